@@ -94,6 +94,49 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalog': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'catalog',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+        },
+    },
+    'carts': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'carts',
+        'TIMEOUT': 60 * 60 * 24 * 7,
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
+}
+
+# store.carts.CacheCartStorage keeps carts in the 'carts' cache and only
+# writes them to the database at checkout or on `flush_carts`. That cache
+# has to be shared by every process, e.g.
+# django.core.cache.backends.redis.RedisCache; local memory is refused.
+CART_STORAGE = {
+    'BACKEND': 'store.carts.DatabaseCartStorage',
+}
+
+# Handlers the process_outbox command delivers order events to, by topic
+# ('order.created', 'order.payment_status_changed', 'order.items_changed')
+# or '*' for all of them. Each one is called with the OutboxEvent.
+OUTBOX_HANDLERS = {
+    '*': ['store.outbox.log_event'],
+    'order.created': ['store.analytics.record_order'],
+    'order.items_changed': ['store.analytics.rebuild_order_day'],
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -145,7 +188,7 @@ INTERNAL_IPS = [
 REST_FRAMEWORK = {
     'COERCE_DECIMAL_TO_STRING': False,
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'user.authentication.CachedJWTAuthentication',
     ),
     'PAGE_SIZE': 10
 }
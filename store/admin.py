@@ -1,8 +1,11 @@
 from django.contrib import admin, messages
+from django.db.models import F
 from django.db.models.aggregates import Count, Sum
+from django.db.models.functions import Coalesce
 from django.utils.html import format_html, urlencode
 from django.urls import reverse
-from . import models
+from django.utils import timezone
+from . import cache, models
 from .filters import InventoryFilter, ProductsCountFilter, OrdersCountFilter, ReviewsCountFilter, OrderItemsCountFilter
 
 
@@ -49,12 +52,15 @@ class ProductAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         return super().get_queryset(request).annotate(
             ordered_times=Count('orderitem'),
-            reviews_count=Count('reviews')
+            reviews_count=Coalesce(F('review_stats__reviews_count'), 0)
         )
 
     @admin.action(description='Clear inventory')
     def clear_inventory(self, request, queryset):
-        updated_count = queryset.update(inventory=0)
+        product_ids = list(queryset.values_list('id', flat=True))
+        updated_count = queryset.update(
+            inventory=0, last_update=timezone.now())
+        cache.invalidate(product_ids=product_ids)
         self.message_user(
             request,
             f'{updated_count} products were successfully updated.',
@@ -95,11 +101,6 @@ class CollectionAdmin(admin.ModelAdmin):
             }))
         return format_html('<a href="{}">{} Products</a>', url, collection.products_count)
 
-    def get_queryset(self, request):
-        return super().get_queryset(request).annotate(
-            products_count=Count('products')
-        )
-
     @admin.action(description="Delete products")
     def delete_products(self, request, queryset):
         total_products_count = sum(collection.products.count()
@@ -0,0 +1,171 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from django.db import IntegrityError, transaction
+from django.db.models import Case, DecimalField, F, IntegerField, Max, Q, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from . import outbox
+from .models import DailyCollectionSales, DailyProductSales, Order, OrderItem, OutboxEvent, SalesRollupLock
+
+REVENUE = DecimalField(max_digits=14, decimal_places=2)
+ROLLUPS = [(DailyProductSales, 'product_id'), (DailyCollectionSales, 'collection_id')]
+
+
+# Units and revenue of the given order items per (day, product) and per
+# (day, collection), summed up by the database.
+def summarize(orderitems):
+    rows = (orderitems
+            .order_by()
+            .values('product_id', collection_id=F('product__collection_id'),
+                    day=TruncDate('order__placed_at'))
+            .annotate(units=Sum('quantity'),
+                      revenue=Sum(F('quantity') * F('unit_price'), output_field=REVENUE)))
+
+    totals = {key: defaultdict(lambda: [0, 0]) for _, key in ROLLUPS}
+    for row in rows:
+        for _, key in ROLLUPS:
+            total = totals[key][(row['day'], row[key])]
+            total[0] += row['units']
+            total[1] += row['revenue']
+    return totals
+
+
+# Adds to the rollup rows that exist with one UPDATE per table and creates
+# the others with one INSERT, retrying as updates if a concurrent worker
+# created them first.
+def add_sales(totals):
+    for model, key in ROLLUPS:
+        rows = totals[key]
+        if not rows:
+            continue
+        matches = Q()
+        for day, pk in rows:
+            matches |= Q(day=day, **{key: pk})
+        existing = set(model.objects.filter(matches).values_list('day', key))
+
+        if existing:
+            def increment(index, output_field):
+                return Case(*[When(day=day, **{key: pk}, then=Value(rows[day, pk][index]))
+                              for day, pk in existing],
+                            default=Value(0), output_field=output_field)
+            model.objects.filter(matches).update(
+                units=F('units') + increment(0, IntegerField()),
+                revenue=F('revenue') + increment(1, REVENUE))
+
+        missing = [model(day=day, units=units, revenue=revenue, **{key: pk})
+                   for (day, pk), (units, revenue) in rows.items()
+                   if (day, pk) not in existing]
+        try:
+            with transaction.atomic():
+                model.objects.bulk_create(missing)
+        except IntegrityError:
+            for rollup in missing:
+                lookup = {'day': rollup.day, key: getattr(rollup, key)}
+                if not model.objects.filter(**lookup).update(
+                        units=F('units') + rollup.units, revenue=F('revenue') + rollup.revenue):
+                    model.objects.create(units=rollup.units, revenue=rollup.revenue, **lookup)
+
+
+def get_day_range(day):
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, start + timedelta(days=1)
+
+
+# Held until the end of the transaction.
+def lock_rollups():
+    SalesRollupLock.objects.select_for_update().get_or_create(pk=1)
+
+
+# Orders whose order.created event is still in the outbox. They are added
+# up when it is delivered, so rebuilds leave them out.
+def get_pending_order_ids():
+    return {payload['order_id'] for payload in OutboxEvent.objects
+            .filter(topic=outbox.ORDER_CREATED)
+            .values_list('payload', flat=True)}
+
+
+# Recomputes whole days, for changes that can't be applied as increments.
+def rebuild_days(days):
+    with transaction.atomic():
+        lock_rollups()
+        pending_ids = get_pending_order_ids()
+        for day in set(days):
+            start, end = get_day_range(day)
+            for model, _ in ROLLUPS:
+                model.objects.filter(day=day).delete()
+            add_sales(summarize(OrderItem.objects
+                                .filter(order__placed_at__gte=start, order__placed_at__lt=end)
+                                .exclude(order_id__in=pending_ids)))
+
+
+# Outbox handlers. An event is deleted in the same transaction as the
+# rollups it updated, so each order is counted exactly once.
+def record_order(event):
+    lock_rollups()
+    add_sales(summarize(OrderItem.objects.filter(order_id=event.payload['order_id'])))
+
+
+def rebuild_order_day(event):
+    placed_at = Order.objects.filter(
+        pk=event.payload['order_id']).values_list('placed_at', flat=True).first()
+    if placed_at is not None:
+        rebuild_days([timezone.localdate(placed_at)])
+
+
+# Aggregates the order items an id range at a time, then swaps the whole
+# rollup tables. It all runs under the rollups lock, so no order.created
+# event is delivered meanwhile; orders whose event is still pending are
+# left for it.
+def backfill(chunk_size=10000, batch_size=1000):
+    with transaction.atomic():
+        lock_rollups()
+        pending_ids = get_pending_order_ids()
+        max_id = OrderItem.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+        totals = {key: defaultdict(lambda: [0, 0]) for _, key in ROLLUPS}
+        for start in range(0, max_id, chunk_size):
+            chunk = summarize(OrderItem.objects
+                              .filter(id__gt=start, id__lte=start + chunk_size)
+                              .exclude(order_id__in=pending_ids))
+            for _, key in ROLLUPS:
+                for group, (units, revenue) in chunk[key].items():
+                    totals[key][group][0] += units
+                    totals[key][group][1] += revenue
+
+        for model, key in ROLLUPS:
+            model.objects.all().delete()
+            model.objects.bulk_create(
+                [model(day=day, units=units, revenue=revenue, **{key: pk})
+                 for (day, pk), (units, revenue) in totals[key].items()],
+                batch_size=batch_size)
+    return len(totals['product_id'])
+
+
+# Sales between two days (both included) grouped by day, product or
+# collection, read from the rollups only. Product grouping or filtering
+# needs the product rollup; everything else is answered by the smaller
+# collection rollup.
+def get_sales(start, end, group_by='day', product_id=None, collection_id=None):
+    if group_by == 'product' or product_id is not None:
+        rollups = DailyProductSales.objects.all()
+        if collection_id is not None:
+            rollups = rollups.filter(product__collection_id=collection_id)
+    else:
+        rollups = DailyCollectionSales.objects.all()
+        if collection_id is not None:
+            rollups = rollups.filter(collection_id=collection_id)
+    if product_id is not None:
+        rollups = rollups.filter(product_id=product_id)
+
+    group = {'day': 'day', 'product': 'product_id', 'collection': 'collection_id'}[group_by]
+    ordering = [group] if group_by == 'day' else ['-revenue', group]
+    results = list(rollups
+                   .filter(day__gte=start, day__lte=end)
+                   .order_by()
+                   .values(group)
+                   .annotate(units=Sum('units'), revenue=Sum('revenue', output_field=REVENUE))
+                   .order_by(*ordering))
+    return {
+        'units': sum(row['units'] for row in results),
+        'revenue': sum((row['revenue'] for row in results), REVENUE.to_python('0.00')),
+        'results': results,
+    }
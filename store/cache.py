@@ -0,0 +1,59 @@
+import json
+from hashlib import md5
+from time import time_ns
+from django.core.cache import caches
+from django.db import transaction
+
+CACHE_ALIAS = 'catalog'
+PRODUCTS = 'products'
+COLLECTIONS = 'collections'
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def detail_key(namespace, pk):
+    return f'{namespace}:detail:{pk}'
+
+
+def list_key(namespace, request):
+    url = md5(request.build_absolute_uri().encode('utf-8')).hexdigest()
+    return f'{namespace}:list:{get_generation(namespace)}:{url}'
+
+
+def facets_key(namespace, signature):
+    signature = md5(json.dumps(signature, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+    return f'{namespace}:facets:{get_generation(namespace)}:{signature}'
+
+
+# List responses can't be deleted one by one, so their keys embed a
+# generation that is replaced on every change; the orphaned entries
+# simply expire or get evicted.
+def get_generation(namespace):
+    cache = get_cache()
+    key = f'{namespace}:generation'
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, time_ns(), timeout=None)
+        generation = cache.get(key)
+    return generation
+
+
+def bump_generation(namespace):
+    get_cache().set(f'{namespace}:generation', time_ns(), timeout=None)
+
+
+def invalidate(product_ids=(), collection_ids=(), products_list=True, collections_list=False):
+    def do_invalidate():
+        get_cache().delete_many(
+            [detail_key(PRODUCTS, pk) for pk in product_ids]
+            + [detail_key(COLLECTIONS, pk) for pk in collection_ids])
+        if products_list:
+            bump_generation(PRODUCTS)
+        if collections_list:
+            bump_generation(COLLECTIONS)
+
+    # Invalidating before the commit would let a concurrent read put the
+    # old rows straight back into the cache.
+    transaction.on_commit(do_invalidate)
@@ -0,0 +1,469 @@
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from uuid import UUID, uuid4
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, IntegerField, Prefetch, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from . import pricing
+from .inventory import get_quantities
+from .models import Cart, CartItem, Product
+
+
+def to_uuid(value):
+    try:
+        return UUID(str(value))
+    except ValueError:
+        return None
+
+
+def to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# Serializers read `cart.items.all()`, so items that are already at hand
+# are handed over the same way prefetch_related() would.
+def with_items(cart, items):
+    queryset = CartItem.objects.none()
+    queryset._result_cache = list(items)
+    queryset._prefetch_done = True
+    cart._prefetched_objects_cache = {'items': queryset}
+    return cart
+
+
+class CartStorage:
+    def create_cart(self):
+        raise NotImplementedError
+
+    def get_cart(self, cart_id):
+        raise NotImplementedError
+
+    def delete_cart(self, cart_id):
+        raise NotImplementedError
+
+    def get_items(self, cart_id):
+        raise NotImplementedError
+
+    def get_item(self, cart_id, item_id):
+        raise NotImplementedError
+
+    def add_item(self, cart_id, product_id, quantity):
+        raise NotImplementedError
+
+    def add_items(self, cart_id, lines):
+        return [self.add_item(cart_id, product_id, quantity)
+                for product_id, quantity in get_quantities(lines).items()]
+
+    def update_item(self, cart_id, item_id, quantity):
+        raise NotImplementedError
+
+    def delete_item(self, cart_id, item_id):
+        raise NotImplementedError
+
+    # {'id', 'items_count', 'total_price'} without loading the items, or
+    # None if there is no such cart.
+    def get_summary(self, cart_id):
+        raise NotImplementedError
+
+    # Makes sure the cart and its items are in the database, which is where
+    # checkout reads them from.
+    def materialize(self, cart_id):
+        pass
+
+    def flush(self):
+        return 0
+
+    # Deletes carts created before `cutoff`, `batch_size` at a time. Each
+    # batch is picked through the created_at index and deleted with its
+    # items in its own short transaction, then the sweep sleeps so live
+    # checkouts get the tables back. Yields (carts, items, seconds) per batch.
+    def sweep(self, cutoff, batch_size=1000, sleep=0.1):
+        carts = Cart.objects.filter(created_at__lt=cutoff).order_by('created_at')
+        while True:
+            started = time.monotonic()
+            cart_ids = list(carts.values_list('id', flat=True)[:batch_size])
+            if not cart_ids:
+                return
+            with transaction.atomic():
+                _, deleted = Cart.objects.filter(pk__in=cart_ids).delete()
+            self.discard(cart_ids)
+            yield (deleted.get(Cart._meta.label, 0),
+                   deleted.get(CartItem._meta.label, 0),
+                   time.monotonic() - started)
+            if len(cart_ids) < batch_size:
+                return
+            time.sleep(sleep)
+
+    def discard(self, cart_ids):
+        pass
+
+
+class DatabaseCartStorage(CartStorage):
+    def create_cart(self):
+        return with_items(Cart.objects.create(), [])
+
+    def get_cart(self, cart_id):
+        cart_id = to_uuid(cart_id)
+        if cart_id is None:
+            return None
+        return (self.get_carts(cart_id)
+                .prefetch_related(Prefetch('items', queryset=self.get_items(cart_id)))
+                .first())
+
+    # Line and cart totals are summed up by the database; the serializers
+    # read them from `total_price_cents`.
+    def get_carts(self, cart_id):
+        return (Cart.objects
+                .filter(pk=cart_id)
+                .annotate(items_count=Count('items'),
+                          total_price_cents=Coalesce(Sum(pricing.line_total_cents('items__')), 0)))
+
+    def get_summary(self, cart_id):
+        cart_id = to_uuid(cart_id)
+        if cart_id is None:
+            return None
+        summary = self.get_carts(cart_id).values('id', 'items_count', 'total_price_cents').first()
+        if summary is None:
+            return None
+        summary['total_price'] = pricing.from_cents(summary.pop('total_price_cents'))
+        return summary
+
+    def delete_cart(self, cart_id):
+        cart_id = to_uuid(cart_id)
+        if cart_id is None:
+            return False
+        deleted_count, _ = Cart.objects.filter(pk=cart_id).delete()
+        return deleted_count > 0
+
+    def get_items(self, cart_id):
+        cart_id = to_uuid(cart_id)
+        if cart_id is None:
+            return CartItem.objects.none()
+        return (CartItem.objects
+                .filter(cart_id=cart_id)
+                .select_related('product')
+                .annotate(total_price_cents=pricing.line_total_cents()))
+
+    def get_item(self, cart_id, item_id):
+        return self.get_items(cart_id).filter(pk=item_id).first()
+
+    # Increments in place and only inserts when there was nothing to
+    # increment. A concurrent add that inserts first trips the unique
+    # (cart, product) constraint, and the increment is simply retried. If
+    # there is still nothing to increment, it was the cart foreign key.
+    def add_item(self, cart_id, product_id, quantity):
+        cartitems = CartItem.objects.filter(cart_id=cart_id, product_id=product_id)
+        if not cartitems.update(quantity=F('quantity') + quantity):
+            try:
+                with transaction.atomic():
+                    return CartItem.objects.create(
+                        cart_id=cart_id, product_id=product_id, quantity=quantity)
+            except IntegrityError:
+                if not cartitems.update(quantity=F('quantity') + quantity):
+                    raise Cart.DoesNotExist
+        return cartitems.get()
+
+    def add_items(self, cart_id, lines):
+        quantities = get_quantities(lines)
+        cartitems = CartItem.objects.filter(cart_id=cart_id, product_id__in=quantities)
+        existing_ids = set(cartitems.values_list('product_id', flat=True))
+
+        if existing_ids:
+            cartitems.filter(product_id__in=existing_ids).update(quantity=F('quantity') + Case(
+                *[When(product_id=product_id, then=Value(quantity))
+                  for product_id, quantity in quantities.items() if product_id in existing_ids],
+                output_field=IntegerField()))
+        try:
+            with transaction.atomic():
+                CartItem.objects.bulk_create(
+                    [CartItem(cart_id=cart_id, product_id=product_id, quantity=quantity)
+                     for product_id, quantity in quantities.items()
+                     if product_id not in existing_ids])
+        except IntegrityError:
+            for product_id, quantity in quantities.items():
+                if product_id not in existing_ids:
+                    self.add_item(cart_id, product_id, quantity)
+        return list(cartitems.order_by('id'))
+
+    def update_item(self, cart_id, item_id, quantity):
+        cartitem = self.get_item(cart_id, item_id)
+        if cartitem is not None:
+            cartitem.quantity = quantity
+            cartitem.save()
+        return cartitem
+
+    def delete_item(self, cart_id, item_id):
+        deleted_count, _ = CartItem.objects.filter(
+            cart_id=cart_id, pk=item_id).delete()
+        return deleted_count > 0
+
+
+class CartLocked(Exception):
+    pass
+
+
+# Keeps carts in a Django cache as
+# {'created_at', 'items': {product_id: quantity}, 'dirty', 'version'} and
+# only writes them to the database at checkout or when flush() runs, so
+# abandoned carts never cost a database write. A cart that isn't cached is
+# read through from the database. Item ids are the product ids, which are
+# unique per cart.
+#
+# The cache has to be shared by every process (Redis, memcached...), or
+# workers wouldn't see each other's carts and flush_carts would find
+# nothing to flush; local memory is only accepted when asked for, for a
+# single process. Read-modify-writes hold a lock taken with cache.add(),
+# per cart and per dirty shard. Every change bumps the version, so
+# materialize() only marks a cart clean if nothing changed while it was
+# being written.
+class CacheCartStorage(CartStorage):
+    # Changed cart ids are spread over several keys so that no single value
+    # grows with every cart created between two flushes.
+    dirty_shards = 64
+    lock_timeout = 10
+    lock_wait = 5
+
+    def __init__(self, cache_alias='carts', timeout=DEFAULT_TIMEOUT, allow_local_cache=False):
+        self.cache_alias = cache_alias
+        self.timeout = timeout
+        if isinstance(self.cache, LocMemCache) and not allow_local_cache:
+            raise ImproperlyConfigured(
+                f'CacheCartStorage needs a cache shared by every process, but the '
+                f'"{cache_alias}" cache is local memory. Use Redis or memcached, or '
+                f'pass allow_local_cache=True if carts are only used by one process.')
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def get_key(self, cart_id):
+        return f'carts:{cart_id}'
+
+    @contextmanager
+    def lock(self, key):
+        lock_key = f'{key}:lock'
+        token = uuid4().hex
+        deadline = time.monotonic() + self.lock_wait
+        while not self.cache.add(lock_key, token, timeout=self.lock_timeout):
+            if time.monotonic() > deadline:
+                raise CartLocked(key)
+            time.sleep(0.005)
+        try:
+            yield
+        finally:
+            if self.cache.get(lock_key) == token:
+                self.cache.delete(lock_key)
+
+    @contextmanager
+    def locked(self, cart_id):
+        cart_id = to_uuid(cart_id)
+        if cart_id is None:
+            yield None, None
+            return
+        with self.lock(self.get_key(cart_id)):
+            yield self.load(cart_id)
+
+    # Read-through entries are only added, so they never replace a change
+    # stored in the meantime.
+    def load(self, cart_id):
+        cart_id = to_uuid(cart_id)
+        if cart_id is None:
+            return None, None
+
+        key = self.get_key(cart_id)
+        data = self.cache.get(key)
+        if data is None:
+            cart = Cart.objects.filter(pk=cart_id).first()
+            if cart is None:
+                return cart_id, None
+            data = {
+                'created_at': cart.created_at,
+                'items': dict(CartItem.objects.filter(cart_id=cart_id)
+                              .order_by('id').values_list('product_id', 'quantity')),
+                'dirty': False,
+            }
+            if not self.cache.add(key, data, timeout=self.timeout):
+                data = self.cache.get(key, data)
+        return cart_id, data
+
+    def get_dirty_key(self, shard):
+        return f'carts:dirty:{shard}'
+
+    def mark_dirty(self, cart_id):
+        key = self.get_dirty_key(cart_id.int % self.dirty_shards)
+        with self.lock(key):
+            dirty_ids = self.cache.get(key, set())
+            dirty_ids.add(cart_id)
+            self.cache.set(key, dirty_ids, timeout=None)
+
+    def store(self, cart_id, data, dirty=False):
+        if dirty:
+            data['version'] = data.get('version', 0) + 1
+            if not data.get('dirty'):
+                data['dirty'] = True
+                self.mark_dirty(cart_id)
+        self.cache.set(self.get_key(cart_id), data, timeout=self.timeout)
+
+    def build_items(self, cart_id, quantities):
+        products = Product.objects.in_bulk(list(quantities))
+        return [CartItem(id=product_id, cart_id=cart_id,
+                         product=products[product_id], quantity=quantity)
+                for product_id, quantity in quantities.items()
+                if product_id in products]
+
+    def build_cart(self, cart_id, data):
+        cart = Cart(id=cart_id, created_at=data['created_at'])
+        return with_items(cart, self.build_items(cart_id, data['items']))
+
+    def create_cart(self):
+        cart_id = uuid4()
+        data = {'created_at': timezone.now(), 'items': {}}
+        self.store(cart_id, data, dirty=True)
+        return self.build_cart(cart_id, data)
+
+    def get_cart(self, cart_id):
+        cart_id, data = self.load(cart_id)
+        if data is None:
+            return None
+        return self.build_cart(cart_id, data)
+
+    def delete_cart(self, cart_id):
+        with self.locked(cart_id) as (cart_id, data):
+            if data is None:
+                return False
+            self.cache.delete(self.get_key(cart_id))
+            Cart.objects.filter(pk=cart_id).delete()
+        return True
+
+    def get_items(self, cart_id):
+        cart_id, data = self.load(cart_id)
+        if data is None:
+            return []
+        return self.build_items(cart_id, data['items'])
+
+    def get_item(self, cart_id, item_id):
+        cart_id, data = self.load(cart_id)
+        item_id = to_int(item_id)
+        if data is None or item_id not in data['items']:
+            return None
+        items = self.build_items(cart_id, {item_id: data['items'][item_id]})
+        return items[0] if items else None
+
+    def get_summary(self, cart_id):
+        cart_id, data = self.load(cart_id)
+        if data is None:
+            return None
+        unit_prices = dict(Product.objects.filter(
+            pk__in=list(data['items'])).values_list('id', 'unit_price'))
+        prices = pricing.price_unit_prices(unit_prices)
+        return {'id': cart_id,
+                'items_count': len(unit_prices),
+                'total_price': sum((quantity * prices[product_id].discounted
+                                    for product_id, quantity in data['items'].items()
+                                    if product_id in prices), pricing.from_cents(0))}
+
+    def add_item(self, cart_id, product_id, quantity):
+        with self.locked(cart_id) as (cart_id, data):
+            if data is None:
+                raise Cart.DoesNotExist
+            data['items'][product_id] = data['items'].get(product_id, 0) + quantity
+            self.store(cart_id, data, dirty=True)
+        return CartItem(id=product_id, cart_id=cart_id, product_id=product_id,
+                        quantity=data['items'][product_id])
+
+    def add_items(self, cart_id, lines):
+        quantities = get_quantities(lines)
+        with self.locked(cart_id) as (cart_id, data):
+            if data is None:
+                raise Cart.DoesNotExist
+            for product_id, quantity in quantities.items():
+                data['items'][product_id] = data['items'].get(product_id, 0) + quantity
+            self.store(cart_id, data, dirty=True)
+        return [CartItem(id=product_id, cart_id=cart_id, product_id=product_id,
+                         quantity=data['items'][product_id]) for product_id in quantities]
+
+    def update_item(self, cart_id, item_id, quantity):
+        item_id = to_int(item_id)
+        with self.locked(cart_id) as (cart_id, data):
+            if data is None or item_id not in data['items']:
+                return None
+            data['items'][item_id] = quantity
+            self.store(cart_id, data, dirty=True)
+        return CartItem(id=item_id, cart_id=cart_id, product_id=item_id, quantity=quantity)
+
+    def delete_item(self, cart_id, item_id):
+        with self.locked(cart_id) as (cart_id, data):
+            if data is None or data['items'].pop(to_int(item_id), None) is None:
+                return False
+            self.store(cart_id, data, dirty=True)
+        return True
+
+    def materialize(self, cart_id):
+        cart_id = to_uuid(cart_id)
+        data = cart_id and self.cache.get(self.get_key(cart_id))
+        if not data or not data.get('dirty'):
+            return False
+
+        product_ids = set(Product.objects.filter(
+            pk__in=list(data['items'])).values_list('id', flat=True))
+        with transaction.atomic():
+            Cart.objects.get_or_create(id=cart_id)
+            Cart.objects.filter(pk=cart_id).update(created_at=data['created_at'])
+            CartItem.objects.filter(cart_id=cart_id).delete()
+            CartItem.objects.bulk_create(
+                [CartItem(cart_id=cart_id, product_id=product_id, quantity=quantity)
+                 for product_id, quantity in data['items'].items()
+                 if product_id in product_ids])
+
+        with self.lock(self.get_key(cart_id)):
+            current = self.cache.get(self.get_key(cart_id))
+            if current is None:
+                return True
+            if current.get('version') != data.get('version'):
+                # Changed while it was being written, so the next flush
+                # writes it again.
+                self.mark_dirty(cart_id)
+                return True
+            current['dirty'] = False
+            self.cache.set(self.get_key(cart_id), current, timeout=self.timeout)
+        return True
+
+    def discard(self, cart_ids):
+        self.cache.delete_many([self.get_key(cart_id) for cart_id in cart_ids])
+
+    # The write-behind half: persists every cart changed since the last flush.
+    def flush(self):
+        flushed_count = 0
+        for shard in range(self.dirty_shards):
+            key = self.get_dirty_key(shard)
+            if not self.cache.get(key):
+                continue
+            with self.lock(key):
+                dirty_ids = self.cache.get(key, set())
+                self.cache.delete(key)
+            flushed_count += sum(self.materialize(cart_id) for cart_id in dirty_ids)
+        return flushed_count
+
+
+@lru_cache(maxsize=None)
+def get_cart_storage():
+    backend = import_string(settings.CART_STORAGE['BACKEND'])
+    return backend(**settings.CART_STORAGE.get('OPTIONS', {}))
+
+
+@receiver(setting_changed)
+def reset_cart_storage(setting, **kwargs):
+    if setting == 'CART_STORAGE':
+        get_cart_storage.cache_clear()
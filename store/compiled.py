@@ -0,0 +1,163 @@
+from functools import lru_cache
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import serializers
+from rest_framework.relations import RelatedField
+from . import pricing
+from .models import OrderItem
+from .serializers import ProductSerializer, CartItemSerializer, OrderSerializer, OrderItemSerializer
+
+
+# Read-only counterparts of the model serializers. Each one inspects its
+# serializer's fields once and turns them into plain functions over
+# `.values()` rows, so a list response builds dicts straight from the rows
+# without a serializer or model instance per row. Method fields and nested
+# lists have no generic equivalent and get a `compile_<field>` method.
+class CompiledSerializer:
+    serializer_class = None
+
+    def __init__(self, fields=None, exclude=None, expand=None):
+        kwargs = {}
+        if fields is not None:
+            kwargs['fields'] = fields
+        if exclude is not None:
+            kwargs['exclude'] = exclude
+        if expand is not None:
+            kwargs['expand'] = expand
+        serializer = self.serializer_class(**kwargs)
+
+        self.field_names = list(serializer.fields)
+        self.value_keys, self.accessors = self.compile(serializer)
+
+    def compile(self, serializer, prefix=''):
+        value_keys, accessors = [], []
+        for name, field in serializer.fields.items():
+            compile_field = getattr(self, f'compile_{name}', None)
+            if compile_field is not None and not prefix:
+                keys, accessor = compile_field(field)
+            elif isinstance(field, (serializers.SerializerMethodField, serializers.ListSerializer)):
+                raise ImproperlyConfigured(
+                    f'{type(self).__name__} needs a compile_{name} method')
+            elif isinstance(field, serializers.BaseSerializer):
+                keys, accessor = self.compile_nested(
+                    field, f'{prefix}{field.source}__')
+            elif isinstance(field, RelatedField):
+                keys, accessor = self.compile_related(field, prefix)
+            else:
+                keys, accessor = self.compile_value(field, prefix)
+            value_keys += keys
+            accessors.append((name, accessor))
+        return value_keys, accessors
+
+    def compile_nested(self, serializer, prefix):
+        keys, accessors = self.compile(serializer, prefix)
+
+        def accessor(row, context):
+            return {name: get(row, context) for name, get in accessors}
+        return keys, accessor
+
+    def compile_related(self, field, prefix):
+        key = prefix + field.source.replace('.', '__')
+
+        def accessor(row, context):
+            return row[key]
+        return [key], accessor
+
+    def compile_value(self, field, prefix):
+        key = prefix + field.source.replace('.', '__')
+        to_representation = field.to_representation
+
+        def accessor(row, context):
+            value = row[key]
+            return None if value is None else to_representation(value)
+        return [key], accessor
+
+    def values(self, queryset, *extra_keys):
+        return queryset.values(*dict.fromkeys(self.value_keys + list(extra_keys)))
+
+    def prepare(self, rows):
+        return {}
+
+    def serialize(self, rows):
+        rows = list(rows)
+        context = self.prepare(rows)
+        accessors = self.accessors
+        return [{name: get(row, context) for name, get in accessors} for row in rows]
+
+    def has_any(self, *field_names):
+        return any(name in self.field_names for name in field_names)
+
+
+@lru_cache(maxsize=256)
+def compile_serializer(compiled_class, fields=None, exclude=None, expand=None):
+    return compiled_class(fields, exclude, expand)
+
+
+def get_compiled(compiled_class, fields=None, exclude=None, expand=None):
+    return compile_serializer(
+        compiled_class,
+        tuple(fields) if fields is not None else None,
+        tuple(exclude) if exclude is not None else None,
+        tuple(expand) if expand is not None else None)
+
+
+class CompiledProductSerializer(CompiledSerializer):
+    serializer_class = ProductSerializer
+
+    def prepare(self, rows):
+        if not self.has_any(*self.serializer_class.priced_fields):
+            return {}
+        return {'prices': pricing.price_unit_prices(
+            {row['id']: row['unit_price'] for row in rows})}
+
+    def compile_discounted_price(self, field):
+        return ['id', 'unit_price'], lambda row, context: context['prices'][row['id']].discounted
+
+    def compile_price_with_tax(self, field):
+        return ['id', 'unit_price'], lambda row, context: context['prices'][row['id']].with_tax
+
+    def compile_review_stats(self, field):
+        def accessor(row, context):
+            latest_review_date = row['review_stats__latest_review_date']
+            return {'reviews_count': row['review_stats__reviews_count'] or 0,
+                    'latest_review_date': latest_review_date and latest_review_date.isoformat()}
+        return ['review_stats__reviews_count', 'review_stats__latest_review_date'], accessor
+
+
+class CompiledCartItemSerializer(CompiledSerializer):
+    serializer_class = CartItemSerializer
+
+    # Reads the `total_price_cents` annotation of the cart storage queryset.
+    def compile_total_price(self, field):
+        def accessor(row, context):
+            return pricing.from_cents(row['total_price_cents'])
+        return ['total_price_cents'], accessor
+
+
+class CompiledOrderItemSerializer(CompiledSerializer):
+    serializer_class = OrderItemSerializer
+
+    def compile_total_price(self, field):
+        def accessor(row, context):
+            return row['unit_price'] * row['quantity']
+        return ['quantity', 'unit_price'], accessor
+
+
+class CompiledOrderSerializer(CompiledSerializer):
+    serializer_class = OrderSerializer
+
+    def prepare(self, rows):
+        if not self.has_any('items'):
+            return {}
+
+        compiled_items = get_compiled(CompiledOrderItemSerializer)
+        item_rows = list(compiled_items.values(
+            OrderItem.objects.filter(order_id__in=[row['id'] for row in rows]).order_by('order_id', 'id'),
+            'order_id'))
+
+        items = {}
+        for row, item in zip(item_rows, compiled_items.serialize(item_rows)):
+            items.setdefault(row['order_id'], []).append(item)
+        return {'items': items}
+
+    def compile_items(self, field):
+        return ['id'], lambda row, context: context['items'].get(row['id'], [])
@@ -0,0 +1,123 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from . import cache
+from .models import Collection, Product, ProductReviewStats, Reviews
+
+
+# Collection.products_count is kept in step with F() increments in the same
+# transaction as the product write, so concurrent writers never lose counts.
+def adjust_products_count(deltas):
+    now = timezone.now()
+    deltas = {pk: delta for pk, delta in deltas.items() if pk is not None and delta}
+    for collection_id, delta in sorted(deltas.items()):
+        Collection.objects.filter(pk=collection_id).update(
+            products_count=F('products_count') + delta, last_update=now)
+
+
+def counted_products():
+    return Coalesce(Subquery(
+        Product.objects
+        .filter(collection_id=OuterRef('pk'))
+        .order_by()
+        .values('collection_id')
+        .annotate(count=Count('id'))
+        .values('count')), 0)
+
+
+def recount_products(collection_ids):
+    Collection.objects.filter(pk__in=collection_ids).update(
+        products_count=counted_products(), last_update=timezone.now())
+
+
+# Recounts only the collections whose counter has drifted, a chunk at a time.
+def repair_products_count(chunk_size=1000):
+    collections = Collection.objects.order_by('id')
+    repaired_ids = []
+    last_id = 0
+
+    while True:
+        chunk = list(collections.filter(id__gt=last_id)
+                     .annotate(counted=counted_products())
+                     .values_list('id', 'products_count', 'counted')[:chunk_size])
+        if not chunk:
+            break
+        drifted_ids = [pk for pk, stored, counted in chunk if stored != counted]
+        recount_products(drifted_ids)
+        repaired_ids.extend(drifted_ids)
+        last_id = chunk[-1][0]
+
+    if repaired_ids:
+        cache.invalidate(collection_ids=repaired_ids,
+                         products_list=False, collections_list=True)
+    return len(repaired_ids)
+
+
+def add_review(product_id, date, retry=True):
+    updated_count = ProductReviewStats.objects.filter(product_id=product_id).update(
+        reviews_count=F('reviews_count') + 1,
+        latest_review_date=Case(
+            When(Q(latest_review_date__isnull=True) | Q(latest_review_date__lt=date),
+                 then=Value(date)),
+            default=F('latest_review_date')))
+    if updated_count:
+        return
+
+    try:
+        with transaction.atomic():
+            ProductReviewStats.objects.create(
+                product_id=product_id, reviews_count=1, latest_review_date=date)
+    except IntegrityError:
+        # Another review of the same product created the row first.
+        if not retry:
+            raise
+        add_review(product_id, date, retry=False)
+
+
+def remove_review(product_id):
+    ProductReviewStats.objects.filter(product_id=product_id).update(
+        reviews_count=F('reviews_count') - 1, latest_review_date=latest_review_date())
+
+
+def counted_reviews():
+    return Coalesce(Subquery(
+        Reviews.objects
+        .filter(product_id=OuterRef('product_id'))
+        .order_by()
+        .values('product_id')
+        .annotate(count=Count('id'))
+        .values('count')), 0)
+
+
+def latest_review_date():
+    return Subquery(
+        Reviews.objects
+        .filter(product_id=OuterRef('product_id'))
+        .order_by('-date')
+        .values('date')[:1])
+
+
+# Recomputes the stats of the products a chunk at a time, in place: each
+# row is set from the reviews table by a single UPDATE, so reviews written
+# meanwhile are either counted by it or incremented on top of it.
+def backfill_review_stats(chunk_size=1000):
+    products = Product.objects.order_by('id').values_list('id', flat=True)
+    reviewed_count = 0
+    last_id = 0
+
+    while True:
+        product_ids = list(products.filter(id__gt=last_id)[:chunk_size])
+        if not product_ids:
+            return reviewed_count
+        reviewed_ids = set(Reviews.objects
+                           .filter(product_id__in=product_ids)
+                           .values_list('product_id', flat=True)
+                           .distinct())
+        ProductReviewStats.objects.bulk_create(
+            [ProductReviewStats(product_id=product_id) for product_id in sorted(reviewed_ids)],
+            ignore_conflicts=True)
+        ProductReviewStats.objects.filter(product_id__in=product_ids).update(
+            reviews_count=counted_reviews(), latest_review_date=latest_review_date())
+        reviewed_count += len(reviewed_ids)
+        last_id = product_ids[-1]
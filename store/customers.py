@@ -0,0 +1,56 @@
+from django.core.cache import caches
+from django.db import transaction
+from .models import Customer
+
+CACHE_ALIAS = 'default'
+CACHE_TIMEOUT = 300
+
+
+def get_key(user_id):
+    return f'customers:user:{user_id}'
+
+
+# Resolves a user to the id of their customer: memoized on the user object
+# for the rest of the request, then shared through the cache. Customers
+# are created at registration, so the database is only written to for
+# users that predate that. forget() only reaches the process's own cache
+# when it is per process, so the timeout bounds how long others keep a
+# deleted customer's id.
+def get_customer_id(user):
+    customer_id = getattr(user, '_customer_id', None)
+    if customer_id is not None:
+        return customer_id
+
+    cache = caches[CACHE_ALIAS]
+    customer_id = cache.get(get_key(user.pk))
+    if customer_id is None:
+        customer_id = (Customer.objects
+                       .filter(user_id=user.pk)
+                       .order_by()
+                       .values_list('id', flat=True)
+                       .first())
+        if customer_id is None:
+            customer, created = Customer.objects.only('id').get_or_create(user_id=user.pk)
+            customer_id = customer.id
+        cache.set(get_key(user.pk), customer_id, timeout=CACHE_TIMEOUT)
+
+    user._customer_id = customer_id
+    return customer_id
+
+
+def forget(user_id):
+    transaction.on_commit(lambda: caches[CACHE_ALIAS].delete(get_key(user_id)))
+
+
+# Loads the customer of a user. The cached id may belong to a customer
+# another process deleted within the timeout; it is then dropped and the
+# user resolved again.
+def get_customer(user, queryset=None):
+    if queryset is None:
+        queryset = Customer.objects.all()
+    customer = queryset.filter(pk=get_customer_id(user)).first()
+    if customer is None:
+        caches[CACHE_ALIAS].delete(get_key(user.pk))
+        user._customer_id = None
+        customer = queryset.get(pk=get_customer_id(user))
+    return customer
@@ -0,0 +1,61 @@
+import csv
+from itertools import islice
+from django.db import connections
+from rest_framework.utils.encoders import JSONEncoder
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+# One long query read through a server-side cursor where the backend has
+# one. MySQLdb buffers whole result sets client-side, so there the rows
+# are read in primary key ranges instead.
+def iterate_rows(queryset, chunk_size):
+    queryset = queryset.order_by('pk')
+    if connections[queryset.db].vendor != 'mysql':
+        yield from queryset.iterator(chunk_size=chunk_size)
+        return
+
+    last_pk = None
+    while True:
+        chunk = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        rows = list(chunk[:chunk_size])
+        if not rows:
+            return
+        yield from rows
+        last_pk = rows[-1]['id']
+
+
+def iterate_chunks(compiled, queryset, chunk_size):
+    rows = iterate_rows(compiled.values(queryset, 'id'), chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield compiled.serialize(chunk)
+
+
+def export_ndjson(compiled, queryset, chunk_size=2000):
+    encoder = JSONEncoder(separators=(',', ':'))
+    for chunk in iterate_chunks(compiled, queryset, chunk_size):
+        yield ''.join(encoder.encode(row) + '\n' for row in chunk)
+
+
+def export_csv(compiled, queryset, chunk_size=2000):
+    writer = csv.writer(Echo())
+    yield writer.writerow(compiled.field_names)
+    for chunk in iterate_chunks(compiled, queryset, chunk_size):
+        yield ''.join(writer.writerow(row.values()) for row in chunk)
+
+
+EXPORTERS = {
+    'ndjson': export_ndjson,
+    'csv': export_csv,
+}
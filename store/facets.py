@@ -0,0 +1,30 @@
+from django.db.models import Case, Count, IntegerField, Value, When
+
+
+def count_by_collection(queryset):
+    rows = (queryset.order_by()
+            .values('collection_id')
+            .annotate(count=Count('id'))
+            .order_by('-count', 'collection_id'))
+    return [{'collection_id': row['collection_id'], 'count': row['count']}
+            for row in rows]
+
+
+# `bounds` splits prices into len(bounds) + 1 buckets: [None, b0), [b0, b1),
+# ..., [bn, None). Every bucket is returned, empty ones with a zero count,
+# so the sidebar doesn't reshuffle as filters change.
+def count_by_price(queryset, bounds):
+    bucket = Case(
+        *[When(unit_price__lt=bound, then=Value(index))
+          for index, bound in enumerate(bounds)],
+        default=Value(len(bounds)),
+        output_field=IntegerField())
+    rows = (queryset.order_by()
+            .annotate(bucket=bucket)
+            .values('bucket')
+            .annotate(count=Count('id')))
+    counts = {row['bucket']: row['count'] for row in rows}
+
+    edges = [None, *bounds, None]
+    return [{'min': edges[index], 'max': edges[index + 1], 'count': counts.get(index, 0)}
+            for index in range(len(bounds) + 1)]
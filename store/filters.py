@@ -1,8 +1,10 @@
 from django_filters.rest_framework import FilterSet
 from django.db.models.query import QuerySet
-from django.db.models import Count
+from django.db.models import Count, Exists, OuterRef
 from django.contrib import admin
-from .models import Product
+from rest_framework.filters import SearchFilter
+from .models import Order, Product, Reviews
+from .search import search_products
 
 
 class ProductFilters(FilterSet):
@@ -14,6 +16,23 @@ class ProductFilters(FilterSet):
         }
 
 
+class OrderFilter(FilterSet):
+    class Meta:
+        model = Order
+        fields = {
+            'payment_status': ['exact'],
+            'placed_at': ['gte', 'lt']
+        }
+
+
+class ProductSearchFilter(SearchFilter):
+    def filter_queryset(self, request, queryset, view):
+        search_terms = self.get_search_terms(request)
+        if not search_terms:
+            return queryset
+        return search_products(queryset, search_terms)
+
+
 class InventoryFilter(admin.SimpleListFilter):
     title = 'inventory'
     parameter_name = 'inventory'
@@ -39,12 +58,10 @@ class ProductsCountFilter(admin.SimpleListFilter):
         ]
 
     def queryset(self, request, queryset: QuerySet):
-        annotated_value = queryset.annotate(products_count=Count('products'))
-
         if self.value() == '0<':
-            return annotated_value.filter(products_count__gt=0)
+            return queryset.filter(products_count__gt=0)
         elif self.value() == '<1':
-            return annotated_value.filter(products_count__lt=1)
+            return queryset.filter(products_count__lt=1)
 
 
 class OrdersCountFilter(admin.SimpleListFilter):
@@ -96,9 +113,17 @@ class ReviewsCountFilter(admin.SimpleListFilter):
         ]
 
     def queryset(self, request, queryset: QuerySet):
-        annotated_value = queryset.annotate(reviews_count=Count('reviews'))
+        if self.value() == '0<':
+            return queryset.filter(review_stats__reviews_count__gt=0)
+        elif self.value() == '<1':
+            return queryset.exclude(review_stats__reviews_count__gt=0)
+
+
+class UserReviewsCountFilter(ReviewsCountFilter):
+    def queryset(self, request, queryset: QuerySet):
+        has_reviews = Exists(Reviews.objects.filter(user_id=OuterRef('pk')))
 
         if self.value() == '0<':
-            return annotated_value.filter(reviews_count__gt=0)
+            return queryset.filter(has_reviews)
         elif self.value() == '<1':
-            return annotated_value.filter(reviews_count__lt=1)
+            return queryset.filter(~has_reviews)
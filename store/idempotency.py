@@ -0,0 +1,80 @@
+import time
+from hashlib import md5, sha256
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import IdempotencyKey
+
+
+class KeyReused(Exception):
+    pass
+
+
+class KeyInProgress(Exception):
+    pass
+
+
+def get_digest(key, user_id, method, path):
+    return sha256(f'{user_id or ""}:{method}:{path}:{key}'.encode('utf-8')).hexdigest()
+
+
+def get_fingerprint(body):
+    return md5(body).hexdigest()
+
+
+# Returns None once the caller owns the key and should run the request, or
+# the finished IdempotencyKey to replay. The unique digest makes sure only
+# one of several concurrent duplicates gets to run; the others poll until
+# it finishes. A claim whose request died without finishing is taken over
+# once it is older than `lock_timeout`, and an expired key is reused.
+def claim(digest, fingerprint, ttl, lock_timeout, wait=5, interval=0.1):
+    deadline = time.monotonic() + wait
+    while True:
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                IdempotencyKey.objects.create(
+                    digest=digest, fingerprint=fingerprint,
+                    created_at=now, expires_at=now + ttl)
+            return None
+        except IntegrityError:
+            pass
+
+        taken_over = (IdempotencyKey.objects
+                      .filter(Q(expires_at__lte=now)
+                              | Q(status_code__isnull=True, created_at__lte=now - lock_timeout),
+                              digest=digest)
+                      .update(fingerprint=fingerprint, status_code=None, response=None,
+                              created_at=now, expires_at=now + ttl))
+        if taken_over:
+            return None
+
+        idempotency_key = IdempotencyKey.objects.filter(digest=digest).first()
+        if idempotency_key is None:
+            continue
+        if idempotency_key.fingerprint != fingerprint:
+            raise KeyReused
+        if idempotency_key.status_code is not None:
+            return idempotency_key
+        if time.monotonic() >= deadline:
+            raise KeyInProgress
+        time.sleep(interval)
+
+
+def complete(digest, status_code, response):
+    IdempotencyKey.objects.filter(digest=digest).update(
+        status_code=status_code, response=response)
+
+
+def release(digest):
+    IdempotencyKey.objects.filter(digest=digest, status_code__isnull=True).delete()
+
+
+def purge(batch_size=1000):
+    expired = IdempotencyKey.objects.filter(expires_at__lte=timezone.now())
+    purged_count = 0
+    while True:
+        ids = list(expired.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return purged_count
+        purged_count += IdempotencyKey.objects.filter(pk__in=ids).delete()[0]
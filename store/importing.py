@@ -0,0 +1,151 @@
+import csv
+import json
+from itertools import islice
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from .models import Collection, Product
+from .serializers import ProductImportSerializer
+from .signals import products_imported
+
+IMPORTED_FIELDS = ['title', 'description',
+                   'unit_price', 'inventory', 'collection_id']
+
+
+class InvalidRow:
+    def __init__(self, message):
+        self.message = message
+
+
+def read_csv(lines):
+    return csv.DictReader(lines)
+
+
+def read_jsonl(lines):
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as error:
+            yield InvalidRow(f'Invalid JSON: {error}')
+            continue
+        yield row if isinstance(row, dict) else InvalidRow('Expected a JSON object')
+
+
+READERS = {
+    'csv': read_csv,
+    'jsonl': read_jsonl,
+}
+
+CONTENT_TYPES = {
+    'text/csv': 'csv',
+    'application/jsonl': 'jsonl',
+    'application/x-ndjson': 'jsonl',
+}
+
+
+# Upserts products by slug, one chunk at a time, so memory stays flat no
+# matter how long the input is. Only the first `max_errors` row errors are
+# kept in the report.
+class ProductImporter:
+    def __init__(self, chunk_size=500, max_errors=1000):
+        self.chunk_size = chunk_size
+        self.max_errors = max_errors
+        self.serializer = ProductImportSerializer()
+        self.report = {'created': 0, 'updated': 0, 'failed': 0, 'errors': []}
+
+    def run(self, rows):
+        numbered_rows = enumerate(rows, start=1)
+        while True:
+            chunk = list(islice(numbered_rows, self.chunk_size))
+            if not chunk:
+                return self.report
+            self.import_chunk(chunk)
+
+    def import_chunk(self, chunk):
+        validated = {}
+        for number, row in chunk:
+            data = self.validate(number, row)
+            if data is None:
+                continue
+            # The last row of a slug wins, the earlier one is reported.
+            if data['slug'] in validated:
+                earlier_number, _ = validated.pop(data['slug'])
+                self.add_error(earlier_number, {'slug': [
+                    f'Superseded by row {number} with the same slug.']})
+            validated[data['slug']] = (number, data)
+
+        collection_ids = set(Collection.objects.filter(
+            pk__in={data['collection'] for _, data in validated.values()}
+        ).values_list('id', flat=True))
+        for slug, (number, data) in list(validated.items()):
+            if data['collection'] not in collection_ids:
+                self.add_error(number, {'collection': [
+                    f'Invalid pk "{data["collection"]}" - object does not exist.']})
+                del validated[slug]
+
+        if validated:
+            with transaction.atomic():
+                self.upsert({slug: data for slug, (_, data) in validated.items()})
+
+    def validate(self, number, row):
+        if isinstance(row, InvalidRow):
+            self.add_error(number, {'non_field_errors': [row.message]})
+            return None
+        try:
+            return self.serializer.run_validation(row)
+        except ValidationError as error:
+            self.add_error(number, error.detail)
+            return None
+
+    def upsert(self, rows):
+        # Slugs aren't unique in the table; the oldest product wins.
+        existing = {}
+        for product in (Product.objects
+                        .filter(slug__in=rows.keys())
+                        .order_by('id')
+                        .only('id', 'slug', 'collection_id')):
+            existing.setdefault(product.slug, product)
+
+        moved_collection_ids = set()
+        created, updated = [], []
+        for slug, data in rows.items():
+            values = {
+                'title': data['title'],
+                'description': data.get('description'),
+                'unit_price': data['unit_price'],
+                'inventory': data['inventory'],
+                'collection_id': data['collection'],
+            }
+            product = existing.get(slug)
+            if product is None:
+                created.append(Product(slug=slug, **values))
+                moved_collection_ids.add(values['collection_id'])
+                continue
+            if product.collection_id != values['collection_id']:
+                moved_collection_ids.update(
+                    [product.collection_id, values['collection_id']])
+            for field, value in values.items():
+                setattr(product, field, value)
+            product.last_update = timezone.now()
+            updated.append(product)
+
+        Product.objects.bulk_create(created)
+        Product.objects.bulk_update(updated, IMPORTED_FIELDS + ['last_update'])
+
+        # bulk_create() doesn't return ids on every backend.
+        product_ids = list(Product.objects.filter(
+            slug__in=rows.keys()).values_list('id', flat=True))
+        products_imported.send(
+            sender=Product,
+            product_ids=product_ids,
+            moved_collection_ids=moved_collection_ids)
+
+        self.report['created'] += len(created)
+        self.report['updated'] += len(updated)
+
+    def add_error(self, number, errors):
+        self.report['failed'] += 1
+        if len(self.report['errors']) < self.max_errors:
+            self.report['errors'].append({'row': number, 'errors': errors})
@@ -0,0 +1,58 @@
+from collections import Counter
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+from . import cache
+from .models import Product
+
+
+class InsufficientInventory(Exception):
+    def __init__(self, shortfalls):
+        self.shortfalls = shortfalls
+        super().__init__(f'Insufficient inventory for products {[s["product_id"] for s in shortfalls]}')
+
+
+def get_quantities(lines):
+    quantities = Counter()
+    for product_id, quantity in lines:
+        quantities[product_id] += quantity
+    return dict(sorted(quantities.items()))
+
+
+# Reserves every line with a single conditional UPDATE, so concurrent
+# checkouts never read-modify-write the same row. Rows are updated in id
+# order (MySQL honours ORDER BY on UPDATE), which keeps the row locks taken
+# by overlapping checkouts in the same order and rules out deadlocks. If any
+# product is short, the savepoint is rolled back and nothing is reserved.
+def reserve(lines):
+    quantities = get_quantities(lines)
+    if not quantities:
+        return
+
+    requested = Case(
+        *[When(id=product_id, then=Value(quantity))
+          for product_id, quantity in quantities.items()],
+        output_field=IntegerField())
+
+    with transaction.atomic():
+        reserved_count = (Product.objects
+                          .filter(id__in=quantities, inventory__gte=requested)
+                          .order_by('id')
+                          .update(inventory=F('inventory') - requested,
+                                  last_update=timezone.now()))
+        if reserved_count != len(quantities):
+            transaction.set_rollback(True)
+
+    if reserved_count != len(quantities):
+        raise InsufficientInventory(get_shortfalls(quantities))
+    cache.invalidate(product_ids=list(quantities))
+
+
+def get_shortfalls(quantities):
+    available = dict(Product.objects.filter(
+        id__in=quantities).values_list('id', 'inventory'))
+    return [{'product_id': product_id,
+             'requested': quantity,
+             'available': available.get(product_id, 0)}
+            for product_id, quantity in quantities.items()
+            if available.get(product_id, 0) < quantity]
@@ -0,0 +1,38 @@
+from statistics import median
+from time import perf_counter
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from store.models import Collection, Product
+
+
+# Benchmarks seed their own data and roll it back when they're done, so
+# they can be pointed at any database.
+class BenchmarkCommand(BaseCommand):
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.run(**options)
+            transaction.set_rollback(True)
+
+    def run(self, **options):
+        raise NotImplementedError
+
+    def seed_products(self, count, distinct_titles=None):
+        distinct_titles = distinct_titles or count
+        collection = Collection.objects.create(title='Benchmark')
+        Product.objects.bulk_create(
+            (Product(title=f'Product {index % distinct_titles:06d}',
+                     slug=f'product-{index}',
+                     description=f'Benchmark product number {index}',
+                     unit_price=1 + index % 500,
+                     inventory=10,
+                     collection=collection) for index in range(count)),
+            batch_size=1000)
+        return collection
+
+    def time(self, function, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = perf_counter()
+            function()
+            timings.append(perf_counter() - start)
+        return median(timings)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from store.counters import backfill_review_stats
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the per-product review statistics from the reviews table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        products_count = backfill_review_stats(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Review stats of {products_count} products were rebuilt.'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from store.analytics import backfill
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the daily sales rollups from the order items'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        rows_count = backfill(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{rows_count} daily product sales were rebuilt.'))
@@ -0,0 +1,36 @@
+from store.carts import CacheCartStorage, DatabaseCartStorage
+from store.models import Product
+from ._benchmark import BenchmarkCommand
+
+
+class Command(BenchmarkCommand):
+    help = 'Compares add-to-cart throughput of the cart storage backends'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--carts', type=int, default=200)
+        parser.add_argument('--items', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def run(self, **options):
+        collection = self.seed_products(options['items'])
+        product_ids = list(Product.objects.filter(
+            collection=collection).values_list('id', flat=True))
+        adds = options['carts'] * len(product_ids) * 2
+
+        for label, storage in [('database', DatabaseCartStorage()),
+                               ('cache, write-behind', CacheCartStorage(allow_local_cache=True))]:
+            elapsed = self.time(
+                lambda: self.fill_carts(storage, options['carts'], product_ids),
+                options['repeat'])
+            flush_elapsed = self.time(storage.flush, 1)
+            self.stdout.write(
+                f'{label:<20} {elapsed * 1000:9.2f} ms {adds / elapsed:10.0f} adds/s '
+                f'flush {flush_elapsed * 1000:9.2f} ms')
+
+    # Every product is added twice, so both the insert and the increment
+    # paths are measured.
+    def fill_carts(self, storage, count, product_ids):
+        for _ in range(count):
+            cart_id = storage.create_cart().id
+            for product_id in product_ids + product_ids:
+                storage.add_item(cart_id, product_id, 1)
@@ -0,0 +1,45 @@
+from rest_framework.test import APIRequestFactory
+from store import cache
+from store.models import Product
+from store.pagination import KeysetPagination
+from store.views import ProductsViewSet
+from ._benchmark import BenchmarkCommand
+
+
+class Command(BenchmarkCommand):
+    help = 'Compares page-number and cursor pagination latency on /products/'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=10010)
+        parser.add_argument('--page', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def run(self, **options):
+        page, repeat = options['page'], options['repeat']
+        self.seed_products(
+            options['products'], distinct_titles=options['products'] // 2)
+
+        paginator = KeysetPagination()
+        offset = (page - 1) * paginator.page_size
+        boundary = Product.objects.order_by('title', 'id')[offset - 1]
+        cursor = paginator.encode_cursor(
+            paginator.get_position(boundary, 'title'))
+
+        cases = [
+            ('page number', 'page 1', {}),
+            ('page number', f'page {page}', {'page': page}),
+            ('cursor', 'page 1', {'pagination': 'cursor'}),
+            ('cursor', f'page {page}', {'cursor': cursor}),
+        ]
+        for mode, label, params in cases:
+            elapsed = self.time(lambda: self.request(params), repeat)
+            self.stdout.write(f'{mode:<12} {label:<10} {elapsed * 1000:8.2f} ms')
+
+    def request(self, params):
+        cache.get_cache().clear()
+        view = ProductsViewSet.as_view({'get': 'list'})
+        request = APIRequestFactory().get(
+            '/products/', params, SERVER_NAME='localhost')
+        response = view(request)
+        response.render()
+        assert response.status_code == 200, response.data
@@ -0,0 +1,55 @@
+from decimal import Decimal
+from django.db import connection
+from store import pricing
+from store.models import Product, Promotion
+from ._benchmark import BenchmarkCommand
+
+
+class Command(BenchmarkCommand):
+    help = 'Compares batch pricing with per-row price calculation'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def run(self, **options):
+        collection = self.seed_products(options['products'])
+        products = list(Product.objects.filter(collection=collection))
+
+        promotions = Promotion.objects.bulk_create(
+            [Promotion(description=f'{discount:.0%} off', discount=discount)
+             for discount in (0.05, 0.1, 0.25)])
+        promotions = list(Promotion.objects.filter(
+            description__in=[promotion.description for promotion in promotions]))
+        Product.promotions.through.objects.bulk_create(
+            [Product.promotions.through(product_id=product.id,
+                                        promotion_id=promotions[index % len(promotions)].id)
+             for index, product in enumerate(products) if index % 3 == 0],
+            batch_size=1000)
+
+        cases = [
+            ('per row, no promotions', self.price_per_row),
+            ('per row, promotions', self.price_per_row_with_promotions),
+            ('batch engine', pricing.price_products),
+        ]
+        for label, function in cases:
+            queries = []
+            with connection.execute_wrapper(
+                    lambda execute, *args: queries.append(1) or execute(*args)):
+                elapsed = self.time(lambda: function(products), options['repeat'])
+            rate = len(products) / elapsed
+            self.stdout.write(
+                f'{label:<24} {elapsed * 1000:9.2f} ms {rate:12.0f} rows/s '
+                f'{len(queries) // options["repeat"]:6} queries')
+
+    def price_per_row(self, products):
+        return {product.id: product.unit_price * Decimal(1.1) for product in products}
+
+    def price_per_row_with_promotions(self, products):
+        prices = {}
+        for product in products:
+            discounts = [promotion.discount for promotion in product.promotions.all()]
+            discount = Decimal(max(discounts, default=0))
+            prices[product.id] = product.unit_price * \
+                (1 - discount) * Decimal(1.1)
+        return prices
@@ -0,0 +1,56 @@
+from store import pricing
+from store.compiled import get_compiled, CompiledProductSerializer, CompiledCartItemSerializer, CompiledOrderSerializer
+from store.models import Cart, CartItem, Customer, Order, OrderItem, Product
+from store.serializers import ProductSerializer, CartItemSerializer, OrderSerializer
+from user.models import User
+from ._benchmark import BenchmarkCommand
+
+
+class Command(BenchmarkCommand):
+    help = 'Compares list serialization throughput of the model and compiled serializers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def run(self, **options):
+        rows, repeat = options['rows'], options['repeat']
+        collection = self.seed_products(rows)
+        products = Product.objects.filter(collection=collection).order_by('id')
+        product_ids = list(products.values_list('id', flat=True))
+
+        cart = Cart.objects.create()
+        CartItem.objects.bulk_create(
+            [CartItem(cart=cart, product_id=product_id, quantity=2)
+             for product_id in product_ids], batch_size=1000)
+
+        user = User.objects.create(username='benchmark', email='benchmark@localhost')
+        customer = Customer.objects.create(user=user)
+        Order.objects.bulk_create(
+            [Order(customer=customer) for _ in range(rows // 3)], batch_size=1000)
+        order_ids = list(Order.objects.filter(
+            customer=customer).values_list('id', flat=True))
+        OrderItem.objects.bulk_create(
+            [OrderItem(order_id=order_ids[index // 3], product_id=product_id,
+                       quantity=1, unit_price=10)
+             for index, product_id in enumerate(product_ids[:len(order_ids) * 3])],
+            batch_size=1000)
+
+        cases = [
+            ('products', ProductSerializer, CompiledProductSerializer, products),
+            ('cart items', CartItemSerializer, CompiledCartItemSerializer,
+             CartItem.objects.filter(cart=cart).select_related('product')
+             .annotate(total_price_cents=pricing.line_total_cents()).order_by('id')),
+            ('orders', OrderSerializer, CompiledOrderSerializer,
+             Order.objects.filter(customer=customer).prefetch_related('items__product').order_by('id')),
+        ]
+        for label, serializer_class, compiled_class, queryset in cases:
+            count = queryset.count()
+            model = self.time(
+                lambda: serializer_class(queryset.all(), many=True).data, repeat)
+            compiled = get_compiled(compiled_class)
+            fast = self.time(
+                lambda: compiled.serialize(compiled.values(queryset.all())), repeat)
+            self.stdout.write(
+                f'{label:<12} model {count / model:10.0f} rows/s   '
+                f'compiled {count / fast:10.0f} rows/s   x{model / fast:.1f}')
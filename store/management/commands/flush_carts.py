@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from store.carts import get_cart_storage
+
+
+class Command(BaseCommand):
+    help = 'Writes carts changed in the cart storage since the last flush to the database'
+
+    def handle(self, *args, **options):
+        flushed_count = get_cart_storage().flush()
+        self.stdout.write(self.style.SUCCESS(
+            f'{flushed_count} carts were flushed.'))
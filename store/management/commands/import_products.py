@@ -0,0 +1,38 @@
+import json
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from store.importing import READERS, ProductImporter
+
+EXTENSIONS = {
+    '.csv': 'csv',
+    '.jsonl': 'jsonl',
+    '.ndjson': 'jsonl',
+}
+
+
+class Command(BaseCommand):
+    help = 'Creates or updates products by slug from a CSV or JSONL file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--input-format', choices=READERS.keys())
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--max-errors', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        input_format = options['input_format'] or EXTENSIONS.get(path.suffix)
+        if input_format is None:
+            raise CommandError(
+                f'Can\'t tell the format of {path}, use --input-format')
+
+        importer = ProductImporter(
+            chunk_size=options['chunk_size'], max_errors=options['max_errors'])
+        with path.open(newline='', encoding='utf-8-sig') as lines:
+            report = importer.run(READERS[input_format](lines))
+
+        for error in report['errors']:
+            self.stderr.write(f'Row {error["row"]}: {json.dumps(error["errors"])}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{report["created"]} created, {report["updated"]} updated, '
+            f'{report["failed"]} failed.'))
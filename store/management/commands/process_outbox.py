@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from store import outbox
+
+
+class Command(BaseCommand):
+    help = 'Delivers pending outbox events to their handlers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling for new events instead of exiting once drained')
+        parser.add_argument('--sleep', type=float, default=1,
+                            help='Seconds to wait between polls when the outbox is drained')
+
+    def handle(self, *args, **options):
+        self.totals = {'delivered': 0, 'failed': 0, 'seconds': 0}
+        try:
+            outbox.process(batch_size=options['batch_size'], loop=options['loop'],
+                           idle_sleep=options['sleep'], report=self.report)
+        except KeyboardInterrupt:
+            pass
+
+        seconds = self.totals['seconds']
+        backlog = outbox.get_backlog()
+        self.stdout.write(self.style.SUCCESS(
+            f"{self.totals['delivered']} events were delivered and "
+            f"{self.totals['failed']} failed "
+            f"({self.totals['delivered'] / seconds if seconds else 0:.0f} events/s). "
+            f"Backlog: {backlog['pending']} events, {backlog['lag']:.1f}s behind."))
+
+    def report(self, delivered, failed, seconds):
+        self.totals['delivered'] += delivered
+        self.totals['failed'] += failed
+        self.totals['seconds'] += seconds
+        backlog = outbox.get_backlog()
+        self.stdout.write(
+            f'batch: {delivered} delivered, {failed} failed in {seconds:.3f}s '
+            f"({delivered / seconds if seconds else 0:.0f} events/s), "
+            f"backlog {backlog['pending']} events, {backlog['lag']:.1f}s behind")
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from store.idempotency import purge
+
+
+class Command(BaseCommand):
+    help = 'Deletes expired idempotency keys'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        purged_count = purge(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{purged_count} idempotency keys were purged.'))
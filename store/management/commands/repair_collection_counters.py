@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from store.counters import repair_products_count
+
+
+class Command(BaseCommand):
+    help = 'Recounts Collection.products_count wherever it has drifted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        repaired_count = repair_products_count(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{repaired_count} collections were repaired.'))
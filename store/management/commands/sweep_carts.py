@@ -0,0 +1,29 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from store.carts import get_cart_storage
+
+
+class Command(BaseCommand):
+    help = 'Deletes abandoned carts in small batches, meant to be run on a schedule'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30,
+                            help='Delete carts created more than this many days ago')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--sleep', type=float, default=0.1,
+                            help='Seconds to pause between batches')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        batches = get_cart_storage().sweep(
+            cutoff, batch_size=options['batch_size'], sleep=options['sleep'])
+
+        carts_count = items_count = 0
+        for number, (carts, items, seconds) in enumerate(batches, start=1):
+            self.stdout.write(
+                f'batch {number}: {carts} carts, {items} items in {seconds:.3f}s')
+            carts_count += carts
+            items_count += items
+        self.stdout.write(self.style.SUCCESS(
+            f'{carts_count} carts and {items_count} items were deleted.'))
@@ -0,0 +1,33 @@
+# Generated by Django 4.1 on 2026-10-17 19:30
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_products(apps, schema_editor):
+    Collection = apps.get_model('store', 'Collection')
+    Product = apps.get_model('store', 'Product')
+    Collection.objects.update(products_count=Coalesce(Subquery(
+        Product.objects
+        .filter(collection_id=OuterRef('pk'))
+        .order_by()
+        .values('collection_id')
+        .annotate(count=Count('id'))
+        .values('count')), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0008_catalog_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collection',
+            name='products_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_products, migrations.RunPython.noop),
+    ]
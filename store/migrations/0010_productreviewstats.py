@@ -0,0 +1,38 @@
+# Generated by Django 4.1 on 2026-10-17 19:32
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+import django.db.models.deletion
+
+
+def collect_review_stats(apps, schema_editor):
+    Reviews = apps.get_model('store', 'Reviews')
+    ProductReviewStats = apps.get_model('store', 'ProductReviewStats')
+    rows = (Reviews.objects
+            .order_by()
+            .values('product_id')
+            .annotate(count=Count('id'), latest=Max('date')))
+    ProductReviewStats.objects.bulk_create(
+        [ProductReviewStats(product_id=row['product_id'],
+                            reviews_count=row['count'],
+                            latest_review_date=row['latest']) for row in rows],
+        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0009_collection_products_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductReviewStats',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='review_stats', serialize=False, to='store.product')),
+                ('reviews_count', models.PositiveIntegerField(default=0)),
+                ('latest_review_date', models.DateField(null=True)),
+            ],
+        ),
+        migrations.RunPython(collect_review_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.1 on 2026-10-17 20:31
+
+from django.db import migrations
+import store.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0015_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='productsearchterm',
+            name='term',
+            field=store.models.BinaryCharField(max_length=64),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.1 on 2026-10-17 20:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0016_search_term_binary_collation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesRollupLock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ],
+        ),
+    ]
@@ -0,0 +1,269 @@
+from datetime import timedelta
+from hashlib import md5
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.db.models import Max
+from django.http import Http404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.filters import SearchFilter
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+from . import cache, idempotency
+from .compiled import get_compiled
+
+
+class ConditionalGetMixin:
+    cache_namespace = None
+    last_modified_field = 'last_update'
+
+    # Lists are versioned by the catalog cache generation, which every
+    # change (deletes included) replaces, so answering them costs no query.
+    # A generation isn't a modification date, so lists only get an ETag.
+    def list(self, request, *args, **kwargs):
+        etag = self.get_etag(request, str(cache.get_generation(self.cache_namespace)))
+        return self.get_conditional_response(
+            request, etag, None, super().list, *args, **kwargs)
+
+    # A single row is versioned by its own timestamp.
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            queryset = self.filter_queryset(self.get_queryset()).filter(
+                **{self.lookup_field: kwargs[lookup_url_kwarg]})
+        except (TypeError, ValueError, DjangoValidationError):
+            raise Http404
+        last_modified = queryset.order_by().aggregate(
+            last_modified=Max(self.last_modified_field))['last_modified']
+        etag = self.get_etag(
+            request, last_modified.isoformat() if last_modified else '')
+        return self.get_conditional_response(
+            request, etag, last_modified, super().retrieve, *args, **kwargs)
+
+    def get_conditional_response(self, request, etag, last_modified, get_response, *args, **kwargs):
+        response = get_conditional_response(
+            request,
+            etag=etag,
+            last_modified=last_modified and int(last_modified.timestamp()))
+        if response is not None:
+            return response
+
+        response = get_response(request, *args, **kwargs)
+        if response.status_code == 200:
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified.timestamp())
+        return response
+
+    def get_etag(self, request, version):
+        fingerprint = ':'.join([
+            version,
+            request.accepted_renderer.format,
+            request.get_full_path(),
+        ])
+        return f'W/"{md5(fingerprint.encode("utf-8")).hexdigest()}"'
+
+
+class CachedCatalogMixin:
+    cache_namespace = None
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            cache.list_key(self.cache_namespace, request),
+            super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = str(kwargs[self.lookup_url_kwarg or self.lookup_field])
+        # Only the plain representation is cached under the detail key.
+        if not pk.isdigit() or request.query_params:
+            return super().retrieve(request, *args, **kwargs)
+        return self.get_cached_response(
+            cache.detail_key(self.cache_namespace, int(pk)),
+            super().retrieve, request, *args, **kwargs)
+
+    def get_cached_response(self, key, get_response, request, *args, **kwargs):
+        data = cache.get_cache().get(key)
+        if data is not None:
+            return Response(data)
+
+        response = get_response(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.get_cache().set(key, response.data)
+        return response
+
+
+class IdempotencyKeyInProgress(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'A request with this Idempotency-Key is still being processed.'
+    default_code = 'idempotency_key_in_progress'
+
+
+class IdempotencyKeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = 'This Idempotency-Key was already used for a different request.'
+    default_code = 'idempotency_key_reused'
+
+
+# Requests sent with an Idempotency-Key header run once: the response is
+# stored, and a retry with the same key gets it back without running the
+# request again. Only responses below 500 are kept, so a retry after a
+# crash or a server error runs the request again.
+class IdempotentCreateMixin:
+    idempotency_header = 'Idempotency-Key'
+    idempotency_key_max_length = 255
+    idempotency_ttl = timedelta(days=1)
+    idempotency_lock_timeout = timedelta(minutes=1)
+    idempotency_wait = 5
+
+    def create(self, request, *args, **kwargs):
+        return self.get_idempotent_response(super().create, request, *args, **kwargs)
+
+    def get_idempotent_response(self, get_response, request, *args, **kwargs):
+        key = request.headers.get(self.idempotency_header)
+        if not key:
+            return get_response(request, *args, **kwargs)
+        if len(key) > self.idempotency_key_max_length:
+            raise ValidationError({self.idempotency_header: 'Idempotency keys are limited to '
+                                   f'{self.idempotency_key_max_length} characters.'})
+
+        digest = idempotency.get_digest(key, request.user.pk, request.method, request.path)
+        try:
+            replayed = idempotency.claim(
+                digest, idempotency.get_fingerprint(request.body), self.idempotency_ttl,
+                self.idempotency_lock_timeout, wait=self.idempotency_wait)
+        except idempotency.KeyReused:
+            raise IdempotencyKeyReused
+        except idempotency.KeyInProgress:
+            raise IdempotencyKeyInProgress
+        if replayed is not None:
+            return Response(replayed.response, status=replayed.status_code,
+                            headers={'Idempotent-Replayed': 'true'})
+
+        try:
+            response = get_response(request, *args, **kwargs)
+        except BaseException:
+            idempotency.release(digest)
+            raise
+        if response.status_code >= 500:
+            idempotency.release(digest)
+        else:
+            idempotency.complete(digest, response.status_code, response.data)
+        return response
+
+
+class FacetedListMixin:
+    facets_query_param = 'facets'
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if (response.status_code == 200 and isinstance(response.data, dict)
+                and self.wants_facets()):
+            response.data['facets'] = self.get_facets()
+        return response
+
+    def wants_facets(self):
+        return self.request.query_params.get(self.facets_query_param) in ('true', '1')
+
+    def get_facets(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        key = cache.facets_key(self.cache_namespace, self.get_facet_signature())
+        facets = cache.get_cache().get(key)
+        if facets is None:
+            facets = self.get_facet_counts(queryset)
+            cache.get_cache().set(key, facets)
+        return facets
+
+    def get_facet_counts(self, queryset):
+        raise NotImplementedError
+
+    # Facets only depend on the filters, so every page, ordering and
+    # fieldset of the same filtered list shares one cache entry.
+    def get_facet_signature(self):
+        signature = {}
+        for backend_class in self.filter_backends:
+            backend = backend_class()
+            if hasattr(backend, 'get_filterset'):
+                filterset = backend.get_filterset(
+                    self.request, self.get_queryset(), self)
+                if filterset is not None and filterset.is_valid():
+                    signature.update(
+                        (name, value) for name, value in filterset.form.cleaned_data.items()
+                        if value not in (None, ''))
+            elif isinstance(backend, SearchFilter):
+                terms = backend.get_search_terms(self.request)
+                if terms:
+                    signature[backend.search_param] = sorted(
+                        {term.lower() for term in terms})
+        return signature
+
+
+class SparseFieldsetMixin:
+    fields_query_param = 'fields'
+    exclude_query_param = 'exclude'
+    expand_query_param = 'expand'
+    sparse_required_fields = ['id']
+
+    def get_sparse_fieldset(self):
+        if self.request.method not in SAFE_METHODS:
+            return {}
+
+        fieldset = {}
+        for kwarg, param in [('fields', self.fields_query_param),
+                             ('exclude', self.exclude_query_param),
+                             ('expand', self.expand_query_param)]:
+            value = self.request.query_params.get(param)
+            if value is not None:
+                fieldset[kwarg] = [name.strip()
+                                   for name in value.split(',') if name.strip()]
+        return fieldset
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.update(self.get_sparse_fieldset())
+        return super().get_serializer(*args, **kwargs)
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        fieldset = self.get_sparse_fieldset()
+        if not fieldset:
+            return queryset
+        return queryset.only(*self.get_sparse_columns(queryset.model, fieldset))
+
+    # Maps the serializer fields left in the fieldset to the model columns
+    # they read, so everything else stays out of the SELECT.
+    def get_sparse_columns(self, model, fieldset):
+        serializer_class = self.get_serializer_class()
+        serializer = serializer_class(**fieldset)
+        method_field_sources = getattr(
+            serializer_class, 'method_field_sources', {})
+
+        columns = set(self.sparse_required_fields)
+        for name, field in serializer.fields.items():
+            sources = method_field_sources.get(name, [field.source])
+            for source in sources:
+                try:
+                    model_field = model._meta.get_field(source.split('.')[0])
+                except FieldDoesNotExist:
+                    continue
+                if model_field.concrete:
+                    columns.add(model_field.name)
+        return columns
+
+
+class CompiledListMixin:
+    compiled_serializer_class = None
+    sparse_required_fields = ['id']
+
+    def get_sparse_fieldset(self):
+        return {}
+
+    def list(self, request, *args, **kwargs):
+        compiled = get_compiled(
+            self.compiled_serializer_class, **self.get_sparse_fieldset())
+        queryset = compiled.values(
+            self.filter_queryset(self.get_queryset()), *self.sparse_required_fields)
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(compiled.serialize(page))
+        return Response(compiled.serialize(queryset))
@@ -1,8 +1,10 @@
 from django.core.validators import MinValueValidator
 from django.conf import settings
 from django.contrib import admin
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 from uuid import uuid4
+from rest_framework.utils.encoders import JSONEncoder
 from user.models import User
 
 
@@ -15,12 +17,18 @@ class Collection(models.Model):
     title = models.CharField(max_length=255)
     featured_product = models.ForeignKey(
         'Product', on_delete=models.SET_NULL, null=True, related_name='+', blank=True)
+    last_update = models.DateTimeField(auto_now=True)
+    products_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self) -> str:
         return self.title
 
     class Meta:
         ordering = ['title']
+        indexes = [
+            models.Index(fields=['title']),
+            models.Index(fields=['last_update']),
+        ]
 
 
 class Product(models.Model):
@@ -40,8 +48,28 @@ class Product(models.Model):
     def __str__(self) -> str:
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        product = super().from_db(db, field_names, values)
+        product._loaded_collection_id = product.__dict__.get('collection_id')
+        return product
+
+    # post_save receivers keep the collection counters in step, so they
+    # have to run in the same transaction as the write itself.
+    def save(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+        self._loaded_collection_id = self.collection_id
+
     class Meta:
         ordering = ['title']
+        indexes = [
+            models.Index(fields=['title', 'id']),
+            models.Index(fields=['unit_price', 'id']),
+            models.Index(fields=['collection', 'title', 'id']),
+            models.Index(fields=['collection', 'unit_price']),
+            models.Index(fields=['last_update']),
+        ]
 
 
 class Customer(models.Model):
@@ -93,7 +121,25 @@ class Order(models.Model):
         max_length=1, choices=PAYMENT_STATUS_CHOICES, default=PAYMENT_STATUS_PENDING)
     customer = models.ForeignKey(Customer, on_delete=models.PROTECT)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        order = super().from_db(db, field_names, values)
+        order._loaded_payment_status = order.__dict__.get('payment_status')
+        return order
+
+    # post_save receivers add outbox events, which have to be written in
+    # the same transaction as the order.
+    def save(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+        self._loaded_payment_status = self.payment_status
+
     class Meta:
+        indexes = [
+            models.Index(fields=['placed_at', 'id']),
+            models.Index(fields=['payment_status', 'placed_at', 'id']),
+            models.Index(fields=['customer', 'placed_at', 'id']),
+        ]
         permissions = [
             ('cancel_order', 'can cancel order')
         ]
@@ -106,6 +152,10 @@ class OrderItem(models.Model):
     quantity = models.PositiveSmallIntegerField()
     unit_price = models.DecimalField(max_digits=6, decimal_places=2)
 
+    def save(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+
 
 class Address(models.Model):
     street = models.CharField(max_length=255)
@@ -118,6 +168,11 @@ class Cart(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     id = models.UUIDField(primary_key=True, default=uuid4)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at']),
+        ]
+
 
 class CartItem(models.Model):
     cart = models.ForeignKey(
@@ -137,6 +192,115 @@ class Reviews(models.Model):
         Product, on_delete=models.CASCADE, related_name='reviews')
     date = models.DateField(auto_now_add=True)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        review = super().from_db(db, field_names, values)
+        review._loaded_product_id = review.__dict__.get('product_id')
+        return review
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+        self._loaded_product_id = self.product_id
+
     class Meta:
         verbose_name = 'Review'
         verbose_name_plural = 'Reviews'
+
+
+class ProductReviewStats(models.Model):
+    product = models.OneToOneField(
+        Product, on_delete=models.CASCADE, primary_key=True, related_name='review_stats')
+    reviews_count = models.PositiveIntegerField(default=0)
+    latest_review_date = models.DateField(null=True)
+
+
+# Compared byte for byte on MySQL as well, whose default collations fold
+# case and accents and would treat 'café' and 'cafe' as the same term.
+class BinaryCharField(models.CharField):
+    def db_parameters(self, connection):
+        db_params = super().db_parameters(connection)
+        if connection.vendor == 'mysql':
+            db_params['collation'] = 'utf8mb4_bin'
+        return db_params
+
+
+class ProductSearchTerm(models.Model):
+    term = BinaryCharField(max_length=64)
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='search_terms')
+    title_frequency = models.PositiveSmallIntegerField(default=0)
+    description_frequency = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = [['term', 'product']]
+
+
+# The stored outcome of a request sent with an Idempotency-Key header.
+# `digest` hashes the key with the user and endpoint it was sent to;
+# `status_code` stays null while the first request is still running.
+class IdempotencyKey(models.Model):
+    digest = models.CharField(max_length=64, unique=True)
+    fingerprint = models.CharField(max_length=32)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.JSONField(null=True, encoder=JSONEncoder)
+    created_at = models.DateTimeField()
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['expires_at']),
+        ]
+
+
+# Units sold and revenue per day, kept up to date from the order.created
+# events of the outbox. Collections are the ones products are in when the
+# rollup is written, so a product that moves keeps its past sales in its
+# old collection until those days are rebuilt.
+class DailyProductSales(models.Model):
+    day = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = [['day', 'product']]
+        indexes = [
+            models.Index(fields=['product', 'day']),
+        ]
+
+
+class DailyCollectionSales(models.Model):
+    day = models.DateField()
+    collection = models.ForeignKey(Collection, on_delete=models.CASCADE, related_name='+')
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = [['day', 'collection']]
+        indexes = [
+            models.Index(fields=['collection', 'day']),
+        ]
+
+
+# A single row that everything writing the sales rollups locks first, so a
+# backfill never interleaves with the outbox handlers.
+class SalesRollupLock(models.Model):
+    pass
+
+
+# Events written in the same transaction as the change they describe and
+# delivered afterwards by the process_outbox command. Delivered events are
+# deleted, so the table only holds the backlog.
+class OutboxEvent(models.Model):
+    topic = models.CharField(max_length=255)
+    payload = models.JSONField(encoder=JSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    available_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['available_at', 'id']),
+        ]
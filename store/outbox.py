@@ -0,0 +1,101 @@
+import logging
+import time
+from datetime import timedelta
+from functools import lru_cache
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .models import OutboxEvent
+
+ORDER_CREATED = 'order.created'
+ORDER_PAYMENT_STATUS_CHANGED = 'order.payment_status_changed'
+ORDER_ITEMS_CHANGED = 'order.items_changed'
+
+MAX_RETRY_DELAY = 3600
+
+logger = logging.getLogger(__name__)
+
+
+# Meant to be called inside the transaction of the change itself, so the
+# event is stored if and only if the change is committed.
+def enqueue(topic, payload):
+    return OutboxEvent.objects.create(topic=topic, payload=payload)
+
+
+def log_event(event):
+    logger.info('%s %s', event.topic, event.payload)
+
+
+# OUTBOX_HANDLERS maps a topic, or '*' for every topic, to a list of
+# callables taking the event, given as dotted paths or the callables.
+@lru_cache(maxsize=None)
+def get_handlers(topic):
+    handlers = getattr(settings, 'OUTBOX_HANDLERS', {})
+    return [import_string(handler) if isinstance(handler, str) else handler
+            for handler in [*handlers.get('*', []), *handlers.get(topic, [])]]
+
+
+@receiver(setting_changed)
+def reset_handlers(setting, **kwargs):
+    if setting == 'OUTBOX_HANDLERS':
+        get_handlers.cache_clear()
+
+
+# Locks a batch of due events with SKIP LOCKED, so several workers can
+# drain the outbox side by side, and hands them to their handlers inside
+# that transaction. Each delivered event is deleted along with what its
+# handlers did, so later handlers of the batch only see undelivered events
+# in the table; failed ones are retried later with an exponential backoff. A worker that dies
+# mid-batch rolls back and its events are delivered again: handlers get
+# every event at least once and have to tolerate duplicates.
+def process_batch(batch_size=100):
+    now = timezone.now()
+    with transaction.atomic():
+        events = list(OutboxEvent.objects
+                      .select_for_update(skip_locked=True)
+                      .filter(available_at__lte=now)
+                      .order_by('available_at', 'id')[:batch_size])
+        delivered_ids, failed = [], []
+        for event in events:
+            try:
+                with transaction.atomic():
+                    for handler in get_handlers(event.topic):
+                        handler(event)
+                    OutboxEvent.objects.filter(pk=event.pk).delete()
+            except Exception as error:
+                logger.exception('Delivering outbox event %s failed', event.id)
+                event.attempts += 1
+                event.available_at = now + timedelta(
+                    seconds=min(2 ** event.attempts, MAX_RETRY_DELAY))
+                event.last_error = repr(error)
+                failed.append(event)
+            else:
+                delivered_ids.append(event.id)
+
+        OutboxEvent.objects.bulk_update(failed, ['attempts', 'available_at', 'last_error'])
+    return len(delivered_ids), len(failed)
+
+
+# How far delivery is behind: the number of undelivered events and the
+# age in seconds of the oldest one.
+def get_backlog():
+    oldest = OutboxEvent.objects.order_by('id').values_list('created_at', flat=True).first()
+    return {
+        'pending': OutboxEvent.objects.count(),
+        'lag': (timezone.now() - oldest).total_seconds() if oldest else 0,
+    }
+
+
+def process(batch_size=100, loop=False, idle_sleep=1, report=None):
+    while True:
+        started = time.monotonic()
+        delivered, failed = process_batch(batch_size)
+        if report is not None and (delivered or failed):
+            report(delivered, failed, time.monotonic() - started)
+        if delivered + failed < batch_size:
+            if not loop:
+                return
+            time.sleep(idle_sleep)
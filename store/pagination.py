@@ -0,0 +1,163 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from collections import OrderedDict
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+# Seeks past the boundary row with a WHERE clause on the ordering field
+# plus `id`, so pages cost the same no matter how deep they are.
+class KeysetPagination(BasePagination):
+    cursor_query_param = 'cursor'
+    page_size = api_settings.PAGE_SIZE
+    # search_rank is the annotation search results are ranked by.
+    ordering_fields = ['title', 'unit_price', 'search_rank']
+    default_ordering = 'title'
+    tiebreaker = 'id'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.model = queryset.model
+        self.annotations = queryset.query.annotations
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(queryset)
+
+        # Rows read through values() still need the annotation they are
+        # ordered by to build the cursor.
+        field = self.ordering.lstrip('-')
+        fields = queryset._fields
+        if fields and field in self.annotations and field not in fields:
+            queryset = queryset.annotate(**{field: self.annotations[field]})
+
+        position = self.decode_cursor(request)
+        is_reversed = bool(position and position['p'])
+        if position is not None:
+            queryset = queryset.filter(
+                self.get_seek_filter(position, is_reversed))
+
+        descending = self.ordering.startswith('-') != is_reversed
+        order_by = [f'-{name}' if descending else name
+                    for name in (field, self.tiebreaker)]
+        rows = list(queryset.order_by(*order_by)[:self.page_size + 1])
+
+        has_more = len(rows) > self.page_size
+        page = rows[:self.page_size]
+        if is_reversed:
+            page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+
+        self.page = page
+        return page
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        position = self.get_position(self.page[-1], self.ordering)
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, self.encode_cursor(position))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        position = self.get_position(
+            self.page[0], self.ordering, previous=True)
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, self.encode_cursor(position))
+
+    def get_ordering(self, queryset):
+        ordering = queryset.query.order_by or queryset.model._meta.ordering
+        if ordering and isinstance(ordering[0], str):
+            if ordering[0].lstrip('-') in self.ordering_fields:
+                return ordering[0]
+        return self.default_ordering
+
+    def get_position(self, row, ordering, previous=False):
+        field = ordering.lstrip('-')
+        if isinstance(row, dict):
+            value, pk = row[field], row[self.tiebreaker]
+        else:
+            value, pk = getattr(row, field), getattr(row, self.tiebreaker)
+        return {'o': ordering, 'v': str(value), 'i': pk, 'p': int(previous)}
+
+    def get_seek_filter(self, position, is_reversed):
+        field = self.ordering.lstrip('-')
+        descending = self.ordering.startswith('-') != is_reversed
+        lookup = 'lt' if descending else 'gt'
+        return (
+            Q(**{f'{field}__{lookup}': position['v']})
+            | Q(**{field: position['v'],
+                   f'{self.tiebreaker}__{lookup}': position['i']})
+        )
+
+    def encode_cursor(self, position):
+        encoded = json.dumps(position, separators=(',', ':')).encode('utf-8')
+        return urlsafe_b64encode(encoded).decode('ascii')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            position = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            field = self.get_cursor_field(position['o'])
+            position['v'] = field.to_python(position['v'])
+            position['i'] = int(position['i'])
+            position['p'] = bool(position['p'])
+        except (BinasciiError, KeyError, TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if position['o'] != self.ordering:
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def get_cursor_field(self, ordering):
+        field = ordering.lstrip('-')
+        if field not in self.ordering_fields:
+            raise ValueError(ordering)
+        if field in self.annotations:
+            return self.annotations[field].output_field
+        return self.model._meta.get_field(field)
+
+
+class ProductPagination(PageNumberPagination):
+    keyset_pagination_class = KeysetPagination
+    pagination_query_param = 'pagination'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.wants_keyset(request):
+            self.keyset = self.keyset_pagination_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def wants_keyset(self, request):
+        params = request.query_params
+        return (self.keyset_pagination_class.cursor_query_param in params
+                or params.get(self.pagination_query_param) == 'cursor')
+
+
+class OrderPagination(KeysetPagination):
+    ordering_fields = ['placed_at']
+    default_ordering = '-placed_at'
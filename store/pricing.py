@@ -0,0 +1,78 @@
+from collections import namedtuple
+from decimal import Decimal, ROUND_HALF_UP
+from functools import lru_cache
+from django.db.models import F, FloatField, IntegerField, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Coalesce, Floor, Greatest, Least, Round
+from .models import Product
+
+TAX_RATE = Decimal('0.1')
+PRICE_QUANTUM = Decimal('0.01')
+DISCOUNT_QUANTUM = Decimal('0.0001')
+
+Price = namedtuple('Price', ['base', 'discount', 'discounted', 'with_tax'])
+
+
+# Promotion.discount is a fraction of the unit price (0.15 is 15% off).
+# It's stored as a float, so it goes through str() to get an exact Decimal.
+@lru_cache(maxsize=1024)
+def to_discount(value):
+    if not value:
+        return Decimal(0)
+    discount = Decimal(str(value)).quantize(DISCOUNT_QUANTUM, ROUND_HALF_UP)
+    return min(max(discount, Decimal(0)), Decimal(1))
+
+
+def calculate(unit_price, discount=None):
+    discount = to_discount(discount)
+    if discount:
+        discounted = (unit_price * (1 - discount)).quantize(
+            PRICE_QUANTUM, ROUND_HALF_UP)
+    else:
+        discounted = unit_price
+    with_tax = (discounted * (1 + TAX_RATE)).quantize(
+        PRICE_QUANTUM, ROUND_HALF_UP)
+    return Price(unit_price, discount, discounted, with_tax)
+
+
+# Promotions don't stack: the best one a product has is applied.
+def get_discounts(product_ids):
+    return dict(Product.promotions.through.objects
+                .filter(product_id__in=product_ids)
+                .order_by()
+                .values('product_id')
+                .annotate(discount=Max('promotion__discount'))
+                .values_list('product_id', 'discount'))
+
+
+def price_unit_prices(unit_prices):
+    discounts = get_discounts(unit_prices.keys()) if unit_prices else {}
+    return {product_id: calculate(unit_price, discounts.get(product_id))
+            for product_id, unit_price in unit_prices.items()}
+
+
+def price_products(products):
+    return price_unit_prices({product.id: product.unit_price for product in products})
+
+
+def from_cents(cents):
+    return Decimal(cents or 0).scaleb(-2)
+
+
+# SQL counterpart of calculate(...).discounted * quantity for cart lines,
+# in whole cents. Everything stays in integer arithmetic, so the rounding
+# is the same ROUND_HALF_UP as above on every database, floats included.
+# `prefix` is the path from the queried model to the cart item.
+def line_total_cents(prefix=''):
+    discount = Coalesce(Subquery(
+        Product.promotions.through.objects
+        .filter(product_id=OuterRef(f'{prefix}product_id'))
+        .order_by()
+        .values('product_id')
+        .annotate(discount=Max('promotion__discount'))
+        .values('discount')), Value(0.0), output_field=FloatField())
+    basis_points = Least(Greatest(
+        Cast(Round(discount * 10000), IntegerField()), Value(0)), Value(10000))
+    unit_cents = Cast(Round(F(f'{prefix}product__unit_price') * 100), IntegerField())
+    discounted_cents = Floor(
+        (unit_cents * (10000 - basis_points) + 5000) / 10000, output_field=IntegerField())
+    return discounted_cents * F(f'{prefix}quantity')
@@ -0,0 +1,90 @@
+import re
+from collections import Counter
+from django.db import transaction
+from django.db.models import F, OuterRef, Q, Subquery, Sum
+from .models import Product, ProductSearchTerm
+
+TITLE_BOOST = 3
+MAX_TERM_LENGTH = ProductSearchTerm._meta.get_field('term').max_length
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+def tokenize(text):
+    if not text:
+        return []
+    return [token[:MAX_TERM_LENGTH] for token in TOKEN_PATTERN.findall(text.lower())]
+
+
+def build_terms(product):
+    title_counts = Counter(tokenize(product.title))
+    description_counts = Counter(tokenize(product.description))
+
+    return [ProductSearchTerm(product_id=product.id,
+                              term=term,
+                              title_frequency=title_counts[term],
+                              description_frequency=description_counts[term])
+            for term in title_counts.keys() | description_counts.keys()]
+
+
+def index_products(products):
+    products = list(products)
+    terms = [term for product in products for term in build_terms(product)]
+
+    with transaction.atomic():
+        ProductSearchTerm.objects.filter(
+            product_id__in=[product.id for product in products]).delete()
+        ProductSearchTerm.objects.bulk_create(terms, batch_size=1000)
+
+
+def rebuild_index(chunk_size=500):
+    products = Product.objects.only('id', 'title', 'description').order_by('id')
+    indexed_count = 0
+    last_id = 0
+
+    with transaction.atomic():
+        ProductSearchTerm.objects.all().delete()
+        while True:
+            chunk = list(products.filter(id__gt=last_id)[:chunk_size])
+            if not chunk:
+                return indexed_count
+            ProductSearchTerm.objects.bulk_create(
+                [term for product in chunk for term in build_terms(product)],
+                batch_size=1000)
+            indexed_count += len(chunk)
+            last_id = chunk[-1].id
+
+
+# The explicit range lets every backend seek the term index; LIKE on its own
+# cannot use an index on SQLite. The upper bound is the smallest string past
+# every prefixed term, so it stays in the Basic Multilingual Plane that
+# MySQL's utf8 (utf8mb3) charset can store. Terms have a binary collation,
+# so the range compares code points like the LIKE BINARY of startswith;
+# under an accent-insensitive one 'café' and 'cafê' would be equal and the
+# range empty.
+def prefix_match(term):
+    upper_bound = term[:-1] + chr(ord(term[-1]) + 1)
+    return Q(term__gte=term, term__lt=upper_bound, term__startswith=term)
+
+
+def search_products(queryset, search_terms):
+    terms = list(dict.fromkeys(tokenize(' '.join(search_terms))))
+    if not terms:
+        return queryset
+
+    # Every term has to match (as a prefix, so partial words typed into a
+    # search box still hit); products are ranked by how often they match.
+    for term in terms:
+        queryset = queryset.filter(pk__in=ProductSearchTerm.objects.filter(
+            prefix_match(term)).values('product_id'))
+
+    matches = Q()
+    for term in terms:
+        matches |= prefix_match(term)
+    rank = (ProductSearchTerm.objects
+            .filter(matches, product_id=OuterRef('pk'))
+            .order_by()
+            .values('product_id')
+            .annotate(rank=Sum(F('title_frequency') * TITLE_BOOST + F('description_frequency')))
+            .values('rank'))
+
+    return queryset.annotate(search_rank=Subquery(rank)).order_by('-search_rank', 'title', 'id')
@@ -1,34 +1,115 @@
+from datetime import timedelta
 from django.core.validators import MinValueValidator
-from django.db import transaction
-from decimal import Decimal
+from django.db import models, transaction
+from django.utils import timezone
 from rest_framework import serializers
-from .models import Product, Collection, Reviews, Cart, CartItem, Customer, Order, OrderItem
+from . import carts, inventory, pricing
+from .models import Product, ProductReviewStats, Collection, Reviews, Cart, CartItem, Customer, Order, OrderItem
+
+
+# Expandable fields cost extra work, so they are only rendered when asked
+# for through `expand` or named in `fields`.
+class SparseFieldsMixin:
+    expandable_fields = []
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        exclude = kwargs.pop('exclude', None)
+        expand = kwargs.pop('expand', None)
+        super().__init__(*args, **kwargs)
+
+        requested = set(expand or []) | set(fields or [])
+        for name in set(self.expandable_fields) - requested:
+            self.fields.pop(name, None)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+        for name in exclude or []:
+            self.fields.pop(name, None)
+
+
+# Prices are memoized in the root serializer's context, so a list, a cart
+# or an order prices all of its products with one promotions query.
+class PricingMixin:
+    def get_prices(self, products):
+        prices = self.context.setdefault('prices', {})
+        missing = [product for product in products if product.id not in prices]
+        if missing:
+            prices.update(pricing.price_products(missing))
+        return prices
+
+    def get_price(self, product: Product):
+        return self.get_prices([product])[product.id]
+
+
+class PricedListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        rows = list(data.all() if isinstance(data, models.Manager) else data)
+        if set(self.child.priced_fields) & set(self.child.fields):
+            self.child.get_prices(
+                product for product in map(self.child.get_priced_product, rows)
+                if product is not None)
+        return super().to_representation(rows)
+
+
+class ProductReviewStatsSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ProductReviewStats
+        fields = ['reviews_count', 'latest_review_date']
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsMixin, PricingMixin, serializers.ModelSerializer):
     class Meta:
         model = Product
-        fields = ['id', 'title', 'description', 'unit_price',
-                  'price_with_tax', 'inventory', 'collection']
-
+        fields = ['id', 'title', 'description', 'unit_price', 'discounted_price',
+                  'price_with_tax', 'inventory', 'collection', 'review_stats']
+        list_serializer_class = PricedListSerializer
+
+    expandable_fields = ['review_stats']
+    priced_fields = ['discounted_price', 'price_with_tax']
+    method_field_sources = {
+        'discounted_price': ['unit_price'],
+        'price_with_tax': ['unit_price'],
+        'review_stats': [],
+    }
+
+    discounted_price = serializers.SerializerMethodField(
+        method_name="get_discounted_price")
     price_with_tax = serializers.SerializerMethodField(
         method_name="get_price_with_tax")
+    review_stats = serializers.SerializerMethodField(
+        method_name="get_review_stats")
+
+    def get_priced_product(self, product: Product):
+        return product
+
+    def get_discounted_price(self, product: Product):
+        return self.get_price(product).discounted
 
     def get_price_with_tax(self, product: Product):
-        tax = 1.1
-        return product.unit_price * Decimal(tax)
+        return self.get_price(product).with_tax
+
+    def get_review_stats(self, product: Product):
+        try:
+            stats = product.review_stats
+        except ProductReviewStats.DoesNotExist:
+            stats = ProductReviewStats(product=product)
+        return ProductReviewStatsSerializer(stats).data
 
 
-class CollectionSerializer(serializers.ModelSerializer):
+class ProductImportSerializer(serializers.ModelSerializer):
     class Meta:
-        model = Collection
-        fields = ['id', 'title', 'products_count']
+        model = Product
+        fields = ['title', 'slug', 'description',
+                  'unit_price', 'inventory', 'collection']
+
+    collection = serializers.IntegerField()
 
-    products_count = serializers.SerializerMethodField(
-        method_name="get_products_count")
 
-    def get_products_count(self, collection: Collection):
-        return collection.products.count()
+class CollectionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Collection
+        fields = ['id', 'title', 'products_count']
 
 
 class ReviewSerializer(serializers.ModelSerializer):
@@ -48,23 +129,54 @@ class CartItemProductSerializer(serializers.ModelSerializer):
         fields = ['id', 'title', 'unit_price']
 
 
-class CartItemSerializer(serializers.ModelSerializer):
+class CartItemSerializer(PricingMixin, serializers.ModelSerializer):
     class Meta:
         model = CartItem
         fields = ['id', 'product', 'quantity', 'total_price']
+        list_serializer_class = PricedListSerializer
+
+    priced_fields = ['total_price']
 
     product = CartItemProductSerializer()
     total_price = serializers.SerializerMethodField(
         method_name="get_total_price")
 
+    # Items loaded from the database come with their total already computed.
+    def get_priced_product(self, cartitem: CartItem):
+        if hasattr(cartitem, 'total_price_cents'):
+            return None
+        return cartitem.product
+
     def get_total_price(self, cartiem: CartItem):
-        return cartiem.quantity * cartiem.product.unit_price
+        if hasattr(cartiem, 'total_price_cents'):
+            return pricing.from_cents(cartiem.total_price_cents)
+        return cartiem.quantity * self.get_price(cartiem.product).discounted
+
+
+# Checks every product of a batch with a single IN query, so the items
+# themselves skip the per-item lookup.
+class AddCartItemListSerializer(serializers.ListSerializer):
+    def validate(self, attrs):
+        product_ids = {item['product_id'] for item in attrs}
+        existing_ids = set(Product.objects.filter(
+            pk__in=product_ids).values_list('id', flat=True))
+        missing_ids = sorted(product_ids - existing_ids)
+        if missing_ids:
+            raise serializers.ValidationError(
+                f"There are no products with given IDs: {missing_ids}")
+        return attrs
+
+    def save(self, **kwargs):
+        lines = [(item['product_id'], item['quantity']) for item in self.validated_data]
+        self.instance = carts.get_cart_storage().add_items(self.context['cart_id'], lines)
+        return self.instance
 
 
 class AddCartItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = CartItem
         fields = ['cart_id', 'product_id', 'quantity']
+        list_serializer_class = AddCartItemListSerializer
 
     product_id = serializers.IntegerField()
 
@@ -72,28 +184,18 @@ class AddCartItemSerializer(serializers.ModelSerializer):
         error_no_product = serializers.ValidationError(
             "There is no product with given ID")
 
+        if isinstance(self.parent, AddCartItemListSerializer):
+            return value
         if not Product.objects.filter(pk=value).exists():
             raise error_no_product
         return value
 
     def save(self, **kwargs):
         validated = self.validated_data
-        instance = self.instance
 
-        product_id = validated['product_id']
-        quantity = instance['quantity']
-        cart_id = self.context['cart_id']
-        try:
-            cartitem = CartItem.objects.get(
-                product_id=product_id, cart_id=cart_id)
-            cartitem.quantity += quantity
-            cartitem.save()
-            instance = cartitem
-        except CartItem.DoesNotExist:
-            cartitem = CartItem.objects.create(cart_id=cart_id, **validated)
-            cartitem.save()
-            instance = cartitem
-        return instance
+        self.instance = carts.get_cart_storage().add_item(
+            self.context['cart_id'], validated['product_id'], validated['quantity'])
+        return self.instance
 
 
 class UpdateCartItemSerializer(serializers.ModelSerializer):
@@ -102,7 +204,7 @@ class UpdateCartItemSerializer(serializers.ModelSerializer):
         fields = ['quantity']
 
 
-class CartSerializer(serializers.ModelSerializer):
+class CartSerializer(PricingMixin, serializers.ModelSerializer):
     class Meta:
         model = Cart
         fields = ['id', 'items', 'total_price']
@@ -113,10 +215,20 @@ class CartSerializer(serializers.ModelSerializer):
         method_name="get_total_price")
 
     def get_total_price(self, cart: Cart):
-        return sum([item.quantity * item.product.unit_price for item in cart.items.all()])
+        if hasattr(cart, 'total_price_cents'):
+            return pricing.from_cents(cart.total_price_cents)
+        items = cart.items.all()
+        prices = self.get_prices(item.product for item in items)
+        return sum([item.quantity * prices[item.product_id].discounted for item in items])
+
+
+class CartSummarySerializer(serializers.Serializer):
+    id = serializers.UUIDField(read_only=True)
+    items_count = serializers.IntegerField(read_only=True)
+    total_price = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
 
 
-class CustomerSerializer(serializers.ModelSerializer):
+class CustomerSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Customer
         fields = ['id', 'user_id', 'phone', 'birth_date', 'membership']
@@ -127,16 +239,17 @@ class CustomerSerializer(serializers.ModelSerializer):
 class OrderItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = OrderItem
-        fields = ['id', 'product', 'quantity', 'unit_price']
+        fields = ['id', 'product', 'quantity', 'unit_price', 'total_price']
 
     product = CartItemProductSerializer()
-    unit_price = serializers.SerializerMethodField()
+    total_price = serializers.SerializerMethodField()
 
-    def get_unit_price(self, orderitem: OrderItem):
-        return orderitem.product.unit_price * orderitem.quantity
+    # Prices are the ones stored when the order was placed.
+    def get_total_price(self, orderitem: OrderItem):
+        return orderitem.unit_price * orderitem.quantity
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = ['id', 'customer', 'payment_status', 'placed_at', 'items']
@@ -158,34 +271,81 @@ class CreateOrderSerializer(serializers.ModelSerializer):
             "This shopping cart is empty")
         minimum_cart_items = 1
 
-        if not Cart.objects.filter(id=value).exists():
+        carts.get_cart_storage().materialize(value)
+        items_count = (Cart.objects
+                       .filter(id=value)
+                       .annotate(items_count=models.Count('items'))
+                       .values_list('items_count', flat=True)
+                       .first())
+        if items_count is None:
             raise error_no_cart
-        elif CartItem.objects.filter(cart_id=value).count() < minimum_cart_items:
+        elif items_count < minimum_cart_items:
             raise error_empty_cart
         return value
 
+    # Every step works on the whole cart at once, so placing an order takes
+    # the same number of queries for one line as for hundreds (bulk inserts
+    # aside, which some databases split into batches).
     def save(self):
         with transaction.atomic():
             cart_id = self.validated_data['cart_id']
-            user_id = self.context['user_id']
 
-            (customer, created) = Customer.objects.get_or_create(user_id=user_id)
-            order = Order.objects.create(customer=customer)
+            # Claims the cart, so a concurrent checkout of the same cart
+            # (say a double click) waits for this one and then finds it gone.
+            if not Cart.objects.select_for_update().filter(id=cart_id).exists():
+                raise serializers.ValidationError(
+                    {'cart_id': ['No cart with given ID was found']})
+
+            cartitems = list(CartItem.objects.filter(
+                cart_id=cart_id).select_related('product').order_by('id'))
+            try:
+                inventory.reserve(
+                    (item.product_id, item.quantity) for item in cartitems)
+            except inventory.InsufficientInventory as error:
+                raise serializers.ValidationError(
+                    {'items': error.shortfalls})
 
-            cartitems = CartItem.objects.filter(cart_id=cart_id)
+            order = Order.objects.create(customer_id=self.context['customer_id'])
+
+            prices = pricing.price_products(item.product for item in cartitems)
             orderitems = [OrderItem(order=order,
                                     product=item.product,
                                     quantity=item.quantity,
-                                    unit_price=item.product.unit_price) for item in cartitems]
+                                    unit_price=prices[item.product_id].discounted) for item in cartitems]
 
             OrderItem.objects.bulk_create(orderitems)
 
-            Cart.objects.filter(id=cart_id).delete()
+            carts.get_cart_storage().delete_cart(cart_id)
 
-            return order
+        # Loaded in one go for the response, which serializes every item.
+        models.prefetch_related_objects(
+            [order], models.Prefetch('items', queryset=OrderItem.objects.select_related('product').order_by('id')))
+        self.instance = order
+        return order
 
 
 class UpdateOrderSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = ['payment_status']
+
+
+class SalesQuerySerializer(serializers.Serializer):
+    default_days = 30
+    max_days = 3 * 366
+
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    group_by = serializers.ChoiceField(['day', 'product', 'collection'], default='day')
+    product_id = serializers.IntegerField(required=False)
+    collection_id = serializers.IntegerField(required=False)
+
+    def validate(self, attrs):
+        attrs.setdefault('end', timezone.localdate())
+        attrs.setdefault('start', attrs['end'] - timedelta(days=self.default_days - 1))
+        if attrs['start'] > attrs['end']:
+            raise serializers.ValidationError('start has to be before end')
+        if (attrs['end'] - attrs['start']).days >= self.max_days:
+            raise serializers.ValidationError(
+                f'Ranges are limited to {self.max_days} days')
+        return attrs
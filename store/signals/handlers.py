@@ -0,0 +1,152 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from store import cache, counters, customers, outbox, search
+from store.models import Collection, Customer, Order, OrderItem, Product, Promotion, Reviews
+from store.signals import products_imported
+
+SEARCHABLE_FIELDS = {'title', 'description'}
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if update_fields is not None and not SEARCHABLE_FIELDS & set(update_fields):
+        return
+    search.index_products([instance])
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous_collection_id = None if created else getattr(
+        instance, '_loaded_collection_id', None)
+    products_moved = created or (previous_collection_id is not None
+                                 and previous_collection_id != instance.collection_id)
+
+    if products_moved:
+        counters.adjust_products_count(
+            {instance.collection_id: 1, previous_collection_id: -1})
+    collection_ids = {instance.collection_id, previous_collection_id} - {None}
+    cache.invalidate(
+        product_ids=[instance.id],
+        collection_ids=collection_ids,
+        collections_list=products_moved)
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    counters.adjust_products_count({instance.collection_id: -1})
+    cache.invalidate(
+        product_ids=[instance.id],
+        collection_ids=[instance.collection_id],
+        collections_list=True)
+
+
+@receiver(products_imported)
+def index_imported_products(sender, product_ids, **kwargs):
+    search.index_products(Product.objects.filter(
+        pk__in=product_ids).only('id', 'title', 'description'))
+
+
+@receiver(products_imported)
+def products_imported_changed(sender, product_ids, moved_collection_ids, **kwargs):
+    counters.recount_products(moved_collection_ids)
+    cache.invalidate(
+        product_ids=product_ids,
+        collection_ids=moved_collection_ids,
+        collections_list=bool(moved_collection_ids))
+
+
+@receiver(post_save, sender=Collection)
+@receiver(post_delete, sender=Collection)
+def invalidate_collection(sender, instance, **kwargs):
+    cache.invalidate(
+        collection_ids=[instance.id],
+        products_list=False,
+        collections_list=True)
+
+
+# Promotions and reviews change product responses without saving the
+# product, so its last_update is bumped here to keep conditional GETs honest.
+def touch_products(product_ids):
+    Product.objects.filter(pk__in=product_ids).update(
+        last_update=timezone.now())
+    cache.invalidate(product_ids=product_ids)
+
+
+@receiver(post_save, sender=Promotion)
+@receiver(pre_delete, sender=Promotion)
+def promotion_changed(sender, instance, **kwargs):
+    touch_products(list(instance.product_set.values_list('id', flat=True)))
+
+
+@receiver(m2m_changed, sender=Product.promotions.through)
+def product_promotions_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+
+    if not reverse:
+        product_ids = [instance.id]
+    elif action == 'pre_clear':
+        product_ids = list(instance.product_set.values_list('id', flat=True))
+    else:
+        product_ids = list(pk_set)
+    touch_products(product_ids)
+
+
+@receiver(post_save, sender=Reviews)
+def review_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous_product_id = None if created else getattr(
+        instance, '_loaded_product_id', None)
+    if not created and previous_product_id in (None, instance.product_id):
+        return
+
+    counters.add_review(instance.product_id, instance.date)
+    product_ids = [instance.product_id]
+    if previous_product_id is not None:
+        counters.remove_review(previous_product_id)
+        product_ids.append(previous_product_id)
+    touch_products(product_ids)
+
+
+@receiver(post_delete, sender=Reviews)
+def review_deleted(sender, instance, **kwargs):
+    counters.remove_review(instance.product_id)
+    touch_products([instance.product_id])
+
+
+@receiver(post_save, sender=Order)
+def order_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        outbox.enqueue(outbox.ORDER_CREATED, {
+            'order_id': instance.id, 'customer_id': instance.customer_id})
+        return
+
+    previous_payment_status = getattr(instance, '_loaded_payment_status', None)
+    if previous_payment_status is not None and previous_payment_status != instance.payment_status:
+        outbox.enqueue(outbox.ORDER_PAYMENT_STATUS_CHANGED, {
+            'order_id': instance.id,
+            'previous': previous_payment_status,
+            'payment_status': instance.payment_status})
+
+
+# Checkout bulk-creates the items of a new order, which sends no signals;
+# these only fire for items changed afterwards, e.g. in the admin.
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def orderitem_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    outbox.enqueue(outbox.ORDER_ITEMS_CHANGED, {'order_id': instance.order_id})
+
+
+@receiver(post_delete, sender=Customer)
+def customer_deleted(sender, instance, **kwargs):
+    customers.forget(instance.user_id)
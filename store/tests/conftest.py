@@ -1,4 +1,5 @@
 import pytest
+from django.core.cache import caches
 from user.models import User
 from rest_framework.test import APIClient
 
@@ -13,3 +14,10 @@ def authenticate(api_client):
     def do_authenticate(user=User):
         return api_client.force_authenticate(user=user)
     return do_authenticate
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    yield
+    for cache in caches.all():
+        cache.clear()
@@ -0,0 +1,183 @@
+import pytest
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from django.core.management import call_command
+from django.utils import timezone
+from model_bakery import baker
+from rest_framework import status
+from user.models import User
+from store import analytics
+from store.models import Collection, DailyCollectionSales, DailyProductSales, Order, OrderItem, OutboxEvent, Product
+
+DAY = date(2026, 3, 14)
+
+
+@pytest.fixture
+def catalog():
+    collections = baker.make(Collection, _quantity=2)
+    return [baker.make(Product, collection=collections[0]),
+            baker.make(Product, collection=collections[0]),
+            baker.make(Product, collection=collections[1])]
+
+
+def place_order(lines, day=DAY):
+    order = baker.make(Order)
+    Order.objects.filter(pk=order.pk).update(
+        placed_at=timezone.make_aware(datetime.combine(day, datetime.min.time())) + timedelta(hours=12))
+    OrderItem.objects.bulk_create(
+        OrderItem(order=order, product=product, quantity=quantity, unit_price=Decimal(unit_price))
+        for product, quantity, unit_price in lines)
+    return order
+
+
+def product_rollups():
+    return set(DailyProductSales.objects.values_list('day', 'product_id', 'units', 'revenue'))
+
+
+def collection_rollups():
+    return set(DailyCollectionSales.objects.values_list('day', 'collection_id', 'units', 'revenue'))
+
+
+@pytest.mark.django_db
+class TestSalesRollups:
+    def test_if_orders_are_delivered_from_outbox_adds_them_up(self, catalog):
+        first, second, other = catalog
+        place_order([(first, 2, '10.00'), (other, 1, '5.00')])
+        place_order([(first, 1, '9.00'), (second, 3, '1.50')])
+        place_order([(first, 1, '10.00')], day=DAY + timedelta(days=1))
+
+        call_command('process_outbox')
+
+        assert product_rollups() == {
+            (DAY, first.id, 3, Decimal('29.00')),
+            (DAY, second.id, 3, Decimal('4.50')),
+            (DAY, other.id, 1, Decimal('5.00')),
+            (DAY + timedelta(days=1), first.id, 1, Decimal('10.00')),
+        }
+        assert collection_rollups() == {
+            (DAY, first.collection_id, 6, Decimal('33.50')),
+            (DAY, other.collection_id, 1, Decimal('5.00')),
+            (DAY + timedelta(days=1), first.collection_id, 1, Decimal('10.00')),
+        }
+
+    def test_if_order_item_is_edited_rebuilds_its_day(self, catalog):
+        first, second, _ = catalog
+        order = place_order([(first, 2, '10.00')])
+        call_command('process_outbox')
+
+        orderitem = OrderItem.objects.get(order=order)
+        orderitem.quantity = 5
+        orderitem.save()
+        call_command('process_outbox')
+
+        assert product_rollups() == {(DAY, first.id, 5, Decimal('50.00'))}
+
+    def test_if_backfilled_matches_incremental_rollups(self, catalog):
+        first, second, other = catalog
+        for day in range(3):
+            place_order([(first, day + 1, '2.00'), (other, 1, '7.25')], day=DAY + timedelta(days=day))
+            place_order([(second, 2, '3.00')], day=DAY + timedelta(days=day))
+        call_command('process_outbox')
+        incremental = product_rollups(), collection_rollups()
+
+        call_command('backfill_sales_rollups', chunk_size=2)
+
+        assert (product_rollups(), collection_rollups()) == incremental
+
+    def test_if_backfilled_before_outbox_is_drained_counts_orders_once(self, catalog):
+        first, _, other = catalog
+        place_order([(first, 1, '2.00')])
+        call_command('process_outbox')
+        place_order([(first, 2, '2.00'), (other, 1, '7.25')])
+
+        analytics.backfill()
+        call_command('process_outbox')
+
+        assert product_rollups() == {
+            (DAY, first.id, 3, Decimal('6.00')),
+            (DAY, other.id, 1, Decimal('7.25')),
+        }
+
+    def test_if_day_is_rebuilt_before_outbox_is_drained_counts_orders_once(self, catalog):
+        first, _, _ = catalog
+        order = place_order([(first, 1, '2.00')])
+        call_command('process_outbox')
+        later = place_order([(first, 2, '2.00')])
+        # Its order.created event is delivered after the rebuild.
+        OutboxEvent.objects.filter(payload__order_id=later.id).update(
+            available_at=timezone.now() + timedelta(hours=1))
+
+        orderitem = OrderItem.objects.get(order=order)
+        orderitem.quantity = 3
+        orderitem.save()
+        call_command('process_outbox')
+        OutboxEvent.objects.update(available_at=timezone.now())
+        call_command('process_outbox')
+
+        assert product_rollups() == {(DAY, first.id, 5, Decimal('10.00'))}
+
+
+@pytest.mark.django_db
+class TestSalesReport:
+    @pytest.fixture
+    def sales(self, catalog):
+        first, second, other = catalog
+        place_order([(first, 2, '10.00'), (other, 1, '5.00')])
+        place_order([(second, 1, '1.00')], day=DAY + timedelta(days=1))
+        place_order([(first, 1, '10.00')], day=DAY + timedelta(days=40))
+        call_command('process_outbox')
+        return catalog
+
+    def get(self, api_client, **params):
+        return api_client.get('/analytics/sales/', {'start': DAY, 'end': DAY + timedelta(days=7), **params})
+
+    def test_if_user_is_not_staff_returns_403(self, api_client, authenticate):
+        authenticate(user=baker.make(User))
+
+        response = self.get(api_client)
+
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    def test_if_grouped_by_day_returns_daily_totals(self, api_client, authenticate, sales):
+        authenticate(user=baker.make(User, is_staff=True))
+
+        response = self.get(api_client)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['units'] == 4
+        assert response.data['revenue'] == Decimal('26.00')
+        assert response.data['results'] == [
+            {'day': DAY, 'units': 3, 'revenue': Decimal('25.00')},
+            {'day': DAY + timedelta(days=1), 'units': 1, 'revenue': Decimal('1.00')},
+        ]
+
+    def test_if_grouped_by_product_returns_best_sellers_first(self, api_client, authenticate, sales):
+        first, second, other = sales
+        authenticate(user=baker.make(User, is_staff=True))
+
+        response = self.get(api_client, group_by='product', collection_id=first.collection_id)
+
+        assert response.data['results'] == [
+            {'product_id': first.id, 'units': 2, 'revenue': Decimal('20.00')},
+            {'product_id': second.id, 'units': 1, 'revenue': Decimal('1.00')},
+        ]
+
+    def test_if_grouped_by_collection_reads_only_rollups(
+            self, api_client, authenticate, sales, django_assert_num_queries):
+        first, _, other = sales
+        authenticate(user=baker.make(User, is_staff=True))
+
+        with django_assert_num_queries(1):
+            response = self.get(api_client, group_by='collection')
+
+        assert response.data['results'] == [
+            {'collection_id': first.collection_id, 'units': 3, 'revenue': Decimal('21.00')},
+            {'collection_id': other.collection_id, 'units': 1, 'revenue': Decimal('5.00')},
+        ]
+
+    def test_if_range_is_reversed_returns_400(self, api_client, authenticate):
+        authenticate(user=baker.make(User, is_staff=True))
+
+        response = api_client.get('/analytics/sales/', {'start': DAY, 'end': DAY - timedelta(days=1)})
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
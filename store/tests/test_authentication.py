@@ -0,0 +1,106 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from model_bakery import baker
+from rest_framework import status
+from rest_framework_simplejwt.tokens import AccessToken
+from user.models import User
+from store.models import Customer, Reviews
+
+
+@pytest.fixture
+def authenticate_with_token(api_client):
+    def do_authenticate_with_token(user):
+        api_client.credentials(HTTP_AUTHORIZATION=f'JWT {AccessToken.for_user(user)}')
+    return do_authenticate_with_token
+
+
+def user_queries(context):
+    return [query['sql'] for query in context.captured_queries
+            if '"user_user"' in query['sql']]
+
+
+@pytest.mark.django_db
+class TestCachedJWTAuthentication:
+    def test_if_token_is_used_again_user_is_not_queried(self, api_client, authenticate_with_token):
+        customer = baker.make(Customer)
+        authenticate_with_token(customer.user)
+        api_client.get('/orders/')
+
+        with CaptureQueriesContext(connection) as context:
+            response = api_client.get('/orders/')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert user_queries(context) == []
+
+    def test_if_user_is_made_staff_applies_it(self, api_client, authenticate_with_token,
+                                              django_capture_on_commit_callbacks):
+        user = baker.make(User)
+        authenticate_with_token(user)
+        assert api_client.post('/collections/', {'title': 'a'}).status_code == status.HTTP_403_FORBIDDEN
+
+        with django_capture_on_commit_callbacks(execute=True):
+            user.is_staff = True
+            user.save()
+        response = api_client.post('/collections/', {'title': 'a'})
+
+        assert response.status_code == status.HTTP_201_CREATED
+
+    def test_if_user_is_deactivated_returns_401(self, api_client, authenticate_with_token,
+                                                django_capture_on_commit_callbacks):
+        user = baker.make(User, is_staff=True)
+        authenticate_with_token(user)
+        api_client.get('/customers/')
+
+        with django_capture_on_commit_callbacks(execute=True):
+            user.is_active = False
+            user.save()
+        response = api_client.get('/customers/')
+
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_if_user_is_deleted_returns_401(self, api_client, authenticate_with_token,
+                                            django_capture_on_commit_callbacks):
+        user = baker.make(User, is_staff=True)
+        authenticate_with_token(user)
+        api_client.get('/customers/')
+
+        with django_capture_on_commit_callbacks(execute=True):
+            user.delete()
+        response = api_client.get('/customers/')
+
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_if_user_is_author_can_update_review(self, api_client, authenticate_with_token):
+        author = baker.make(User)
+        review = baker.make(Reviews, user=author)
+        url = f'/products/{review.product_id}/reviews/{review.id}/'
+        authenticate_with_token(author)
+        api_client.get(url)
+
+        response = api_client.put(url, {'description': 'a'})
+
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_if_user_is_not_author_returns_403(self, api_client, authenticate_with_token):
+        review = baker.make(Reviews, user=baker.make(User))
+        url = f'/products/{review.product_id}/reviews/{review.id}/'
+        authenticate_with_token(baker.make(User))
+        api_client.get(url)
+
+        response = api_client.put(url, {'description': 'a'})
+
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    def test_if_other_fields_are_read_loads_them_at_once(self, api_client, authenticate_with_token):
+        user = baker.make(User, first_name='Jane')
+        authenticate_with_token(user)
+        api_client.get('/auth/users/me/')
+
+        with CaptureQueriesContext(connection) as context:
+            response = api_client.get('/auth/users/me/')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['email'] == user.email
+        assert response.data['first_name'] == 'Jane'
+        assert len(user_queries(context)) == 1
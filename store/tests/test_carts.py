@@ -1,7 +1,19 @@
+import sys
 import pytest
+from datetime import timedelta
+from decimal import Decimal
+from threading import Thread
+from uuid import uuid4
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.utils import timezone
 from model_bakery import baker
 from rest_framework import status
-from store.models import Cart
+from user.models import User
+from store import pricing
+from store.carts import CacheCartStorage, get_cart_storage
+from store.models import Cart, CartItem, Product, Promotion
 
 
 @pytest.mark.django_db
@@ -20,3 +32,358 @@ class TestDeleteCart:
         response = api_client.delete(f'/carts/{cart.id}/')
 
         assert response.status_code == status.HTTP_204_NO_CONTENT
+
+
+@pytest.mark.django_db
+class TestRetrieveCart:
+    def test_if_products_are_promoted_total_uses_discounted_prices(self, api_client):
+        cart = baker.make(Cart)
+        product = baker.make(Product, unit_price=Decimal('10.00'))
+        product.promotions.add(baker.make(Promotion, discount=0.2))
+        baker.make(CartItem, cart=cart, product=product, quantity=3)
+
+        response = api_client.get(f'/carts/{cart.id}/')
+
+        assert response.data['items'][0]['total_price'] == Decimal('24.00')
+        assert response.data['total_price'] == Decimal('24.00')
+
+    @pytest.mark.parametrize('unit_price, discount', [
+        ('10.10', 0.15), ('19.99', 0.333), ('0.05', 0.5), ('999.99', 1), ('12.34', 0)])
+    def test_if_totals_are_summed_in_database_matches_python_rounding(self, api_client, unit_price, discount):
+        cart = baker.make(Cart)
+        product = baker.make(Product, unit_price=Decimal(unit_price))
+        if discount:
+            product.promotions.add(baker.make(Promotion, discount=discount))
+        baker.make(CartItem, cart=cart, product=product, quantity=7)
+
+        response = api_client.get(f'/carts/{cart.id}/')
+
+        expected = pricing.calculate(Decimal(unit_price), discount).discounted * 7
+        assert response.data['items'][0]['total_price'] == expected
+        assert response.data['total_price'] == expected
+
+    def test_if_cart_has_many_items_query_count_does_not_grow(self, api_client, django_assert_num_queries):
+        cart = baker.make(Cart)
+        for product in baker.make(Product, _quantity=50):
+            baker.make(CartItem, cart=cart, product=product)
+
+        # the cart with its total, then its items with their totals
+        with django_assert_num_queries(2):
+            api_client.get(f'/carts/{cart.id}/')
+
+
+@pytest.mark.django_db
+class TestCartSummary:
+    def test_if_cart_exists_returns_count_and_total(self, api_client, cart_storage):
+        cart_id = api_client.post('/carts/').data['id']
+        product = baker.make(Product, unit_price=Decimal('10.00'))
+        product.promotions.add(baker.make(Promotion, discount=0.2))
+        api_client.post(f'/carts/{cart_id}/items/', {'product_id': product.id, 'quantity': 3})
+        api_client.post(f'/carts/{cart_id}/items/', {'product_id': baker.make(Product, unit_price=Decimal('1.50')).id, 'quantity': 1})
+
+        response = api_client.get(f'/carts/{cart_id}/summary/')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == {'id': cart_id, 'items_count': 2, 'total_price': Decimal('25.50')}
+
+    def test_if_cart_is_empty_returns_zero_total(self, api_client, cart_storage):
+        cart_id = api_client.post('/carts/').data['id']
+
+        response = api_client.get(f'/carts/{cart_id}/summary/')
+
+        assert response.data['items_count'] == 0
+        assert response.data['total_price'] == Decimal('0.00')
+
+    def test_if_cart_does_not_exist_returns_404(self, api_client):
+        response = api_client.get('/carts/00000000-0000-0000-0000-000000000000/summary/')
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_if_summary_is_requested_runs_one_query(self, api_client, django_assert_num_queries):
+        cart = baker.make(Cart)
+        baker.make(CartItem, cart=cart, _quantity=5)
+
+        with django_assert_num_queries(1):
+            api_client.get(f'/carts/{cart.id}/summary/')
+
+
+@pytest.fixture(params=['store.carts.DatabaseCartStorage', 'store.carts.CacheCartStorage'])
+def cart_storage(request, settings):
+    options = {'allow_local_cache': True} if request.param.endswith('CacheCartStorage') else {}
+    settings.CART_STORAGE = {'BACKEND': request.param, 'OPTIONS': options}
+    return request.param
+
+
+@pytest.mark.django_db
+class TestCartStorage:
+    def test_if_product_is_added_twice_increments_quantity(self, api_client, cart_storage):
+        cart_id = api_client.post('/carts/').data['id']
+        product = baker.make(Product, unit_price=Decimal('2.00'))
+
+        api_client.post(f'/carts/{cart_id}/items/', {'product_id': product.id, 'quantity': 2})
+        response = api_client.post(f'/carts/{cart_id}/items/', {'product_id': product.id, 'quantity': 3})
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.data['quantity'] == 5
+        cart = api_client.get(f'/carts/{cart_id}/').data
+        assert [item['quantity'] for item in cart['items']] == [5]
+        assert cart['total_price'] == Decimal('10.00')
+
+    def test_if_products_are_added_in_batch_returns_201(self, api_client, cart_storage):
+        cart_id = api_client.post('/carts/').data['id']
+        products = baker.make(Product, _quantity=3)
+        api_client.post(f'/carts/{cart_id}/items/', {'product_id': products[0].id, 'quantity': 1})
+
+        response = api_client.post(f'/carts/{cart_id}/items/batch/', [
+            {'product_id': products[0].id, 'quantity': 2},
+            {'product_id': products[1].id, 'quantity': 1},
+            {'product_id': products[2].id, 'quantity': 4},
+            {'product_id': products[1].id, 'quantity': 1},
+        ], format='json')
+
+        assert response.status_code == status.HTTP_201_CREATED
+        items = api_client.get(f'/carts/{cart_id}/items/').data
+        assert sorted((item['product']['id'], item['quantity']) for item in items) == [
+            (products[0].id, 3), (products[1].id, 2), (products[2].id, 4)]
+
+    def test_if_add_is_retried_with_same_key_adds_once(self, api_client, cart_storage):
+        cart_id = api_client.post('/carts/').data['id']
+        product = baker.make(Product)
+
+        for _ in range(2):
+            api_client.post(f'/carts/{cart_id}/items/', {'product_id': product.id, 'quantity': 2},
+                            HTTP_IDEMPOTENCY_KEY='add-1')
+            api_client.post(f'/carts/{cart_id}/items/batch/', [{'product_id': product.id, 'quantity': 1}],
+                            format='json', HTTP_IDEMPOTENCY_KEY='batch-1')
+
+        items = api_client.get(f'/carts/{cart_id}/items/').data
+        assert [item['quantity'] for item in items] == [3]
+
+    def test_if_batch_has_unknown_product_returns_400(self, api_client, cart_storage):
+        cart_id = api_client.post('/carts/').data['id']
+        product = baker.make(Product)
+
+        response = api_client.post(f'/carts/{cart_id}/items/batch/', [
+            {'product_id': product.id, 'quantity': 1},
+            {'product_id': product.id + 1, 'quantity': 1},
+        ], format='json')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert api_client.get(f'/carts/{cart_id}/items/').data == []
+
+    # Committed for real, so the cart foreign key is checked by the database.
+    @pytest.mark.django_db(transaction=True)
+    @pytest.mark.parametrize('batch', [False, True])
+    def test_if_cart_does_not_exist_returns_404(self, api_client, cart_storage, batch):
+        line = {'product_id': baker.make(Product).id, 'quantity': 1}
+
+        if batch:
+            response = api_client.post(f'/carts/{uuid4()}/items/batch/', [line], format='json')
+        else:
+            response = api_client.post(f'/carts/{uuid4()}/items/', line)
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        assert not CartItem.objects.exists()
+
+    def test_if_item_is_updated_and_deleted_returns_same_responses(self, api_client, cart_storage):
+        cart_id = api_client.post('/carts/').data['id']
+        product = baker.make(Product)
+        api_client.post(f'/carts/{cart_id}/items/', {'product_id': product.id, 'quantity': 1})
+        item_id = api_client.get(f'/carts/{cart_id}/items/').data[0]['id']
+
+        patched = api_client.patch(f'/carts/{cart_id}/items/{item_id}/', {'quantity': 4})
+        deleted = api_client.delete(f'/carts/{cart_id}/items/{item_id}/')
+
+        assert patched.data == {'quantity': 4}
+        assert deleted.status_code == status.HTTP_204_NO_CONTENT
+        assert api_client.get(f'/carts/{cart_id}/items/').data == []
+        assert api_client.get(f'/carts/{cart_id}/items/{item_id}/').status_code == status.HTTP_404_NOT_FOUND
+
+    def test_if_cart_is_deleted_returns_404_afterwards(self, api_client, cart_storage):
+        cart_id = api_client.post('/carts/').data['id']
+
+        api_client.delete(f'/carts/{cart_id}/')
+
+        assert api_client.get(f'/carts/{cart_id}/').status_code == status.HTTP_404_NOT_FOUND
+
+    def test_if_cart_is_checked_out_places_order_from_it(self, api_client, authenticate, cart_storage):
+        cart_id = api_client.post('/carts/').data['id']
+        product = baker.make(Product, inventory=5)
+        api_client.post(f'/carts/{cart_id}/items/', {'product_id': product.id, 'quantity': 2})
+
+        authenticate(user=baker.make(User))
+        response = api_client.post('/orders/', {'cart_id': cart_id})
+
+        assert response.status_code == status.HTTP_200_OK
+        assert [(item['product']['id'], item['quantity']) for item in response.data['items']] == [(product.id, 2)]
+        assert api_client.get(f'/carts/{cart_id}/').status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+class TestAddCartItems:
+    def test_if_product_is_added_again_increments_in_place(self, api_client, django_assert_num_queries):
+        cart = baker.make(Cart)
+        cartitem = baker.make(CartItem, cart=cart, quantity=2)
+
+        # product lookup, increment, read back
+        with django_assert_num_queries(3):
+            api_client.post(f'/carts/{cart.id}/items/', {'product_id': cartitem.product_id, 'quantity': 1})
+
+        cartitem.refresh_from_db()
+        assert cartitem.quantity == 3
+
+    def test_if_batch_is_added_query_count_does_not_grow(self, api_client, django_assert_max_num_queries):
+        cart = baker.make(Cart)
+        products = baker.make(Product, _quantity=20)
+        baker.make(CartItem, cart=cart, product=products[0], quantity=1)
+
+        with django_assert_max_num_queries(8):
+            response = api_client.post(f'/carts/{cart.id}/items/batch/', [
+                {'product_id': product.id, 'quantity': 1} for product in products], format='json')
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert CartItem.objects.filter(cart=cart).count() == 20
+        assert CartItem.objects.get(cart=cart, product=products[0]).quantity == 2
+
+
+@pytest.mark.django_db
+class TestCacheCartStorage:
+    @pytest.fixture(autouse=True)
+    def use_cache_storage(self, settings):
+        settings.CART_STORAGE = {
+            'BACKEND': 'store.carts.CacheCartStorage', 'OPTIONS': {'allow_local_cache': True}}
+
+    def test_if_items_are_added_does_not_write_to_database(self, api_client, django_assert_num_queries):
+        cart_id = api_client.post('/carts/').data['id']
+        product = baker.make(Product)
+
+        # only the product lookup of the validation
+        with django_assert_num_queries(1):
+            api_client.post(f'/carts/{cart_id}/items/', {'product_id': product.id, 'quantity': 1})
+
+        assert not Cart.objects.exists()
+
+    def test_if_carts_are_flushed_writes_them_to_database(self, api_client):
+        cart_id = api_client.post('/carts/').data['id']
+        product = baker.make(Product)
+        api_client.post(f'/carts/{cart_id}/items/', {'product_id': product.id, 'quantity': 3})
+
+        call_command('flush_carts')
+
+        assert list(CartItem.objects.filter(cart_id=cart_id).values_list('product_id', 'quantity')) == [
+            (product.id, 3)]
+
+    def test_if_cart_changes_while_flushed_keeps_the_change(self, api_client, monkeypatch):
+        cart_id = api_client.post('/carts/').data['id']
+        first, second = baker.make(Product, _quantity=2)
+        api_client.post(f'/carts/{cart_id}/items/', {'product_id': first.id, 'quantity': 1})
+        bulk_create = CartItem.objects.bulk_create
+
+        def add_during_write(objs, *args, **kwargs):
+            monkeypatch.undo()
+            get_cart_storage().add_item(cart_id, second.id, 2)
+            return bulk_create(objs, *args, **kwargs)
+
+        monkeypatch.setattr(CartItem.objects, 'bulk_create', add_during_write)
+        call_command('flush_carts')
+        call_command('flush_carts')
+
+        cart = api_client.get(f'/carts/{cart_id}/').data
+        assert sorted(item['quantity'] for item in cart['items']) == [1, 2]
+        assert sorted(CartItem.objects.filter(cart_id=cart_id).values_list('product_id', 'quantity')) == [
+            (first.id, 1), (second.id, 2)]
+
+    def test_if_cache_is_local_memory_refuses_it(self):
+        with pytest.raises(ImproperlyConfigured):
+            CacheCartStorage()
+
+    # Switching threads as often as possible makes lost updates show up.
+    @pytest.fixture
+    def contended(self):
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        yield
+        sys.setswitchinterval(interval)
+
+    def test_if_items_are_added_concurrently_keeps_all_of_them(self, contended):
+        storage = get_cart_storage()
+        cart_id = storage.create_cart().id
+
+        def add_items(first_product_id):
+            for product_id in range(first_product_id, first_product_id + 50):
+                storage.add_item(cart_id, product_id, 1)
+
+        threads = [Thread(target=add_items, args=(start,)) for start in (0, 1000, 2000, 3000)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(storage.load(cart_id)[1]['items']) == 200
+
+    def test_if_carts_are_created_concurrently_flushes_all_of_them(self, contended):
+        storage = get_cart_storage()
+        cart_ids = []
+
+        def create_carts():
+            for _ in range(100):
+                cart_ids.append(storage.create_cart().id)
+
+        threads = [Thread(target=create_carts) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert storage.flush() == 400
+        assert Cart.objects.filter(pk__in=cart_ids).count() == 400
+
+    def test_if_cart_is_not_cached_reads_it_from_database(self, api_client):
+        cart = baker.make(Cart)
+        baker.make(CartItem, cart=cart, quantity=2)
+
+        response = api_client.get(f'/carts/{cart.id}/')
+
+        assert [item['quantity'] for item in response.data['items']] == [2]
+
+
+@pytest.mark.django_db
+class TestSweepCarts:
+    def make_cart(self, days_old, items=1):
+        cart = baker.make(Cart)
+        Cart.objects.filter(pk=cart.pk).update(created_at=timezone.now() - timedelta(days=days_old))
+        baker.make(CartItem, cart=cart, _quantity=items)
+        return cart
+
+    def test_if_carts_are_old_deletes_them_in_batches(self, capsys):
+        for _ in range(5):
+            self.make_cart(days_old=40, items=2)
+        recent = self.make_cart(days_old=1)
+
+        call_command('sweep_carts', days=30, batch_size=2, sleep=0)
+
+        output = capsys.readouterr().out
+        assert output.count('batch ') == 3
+        assert 'batch 1: 2 carts, 4 items' in output
+        assert '5 carts and 10 items were deleted.' in output
+        assert list(Cart.objects.values_list('id', flat=True)) == [recent.id]
+        assert CartItem.objects.count() == 1
+
+    def test_if_no_cart_is_old_deletes_nothing(self, capsys):
+        self.make_cart(days_old=1)
+
+        call_command('sweep_carts', days=30, sleep=0)
+
+        assert '0 carts and 0 items were deleted.' in capsys.readouterr().out
+        assert Cart.objects.count() == 1
+
+    def test_if_carts_are_cached_forgets_them(self, api_client, settings):
+        settings.CART_STORAGE = {
+            'BACKEND': 'store.carts.CacheCartStorage', 'OPTIONS': {'allow_local_cache': True}}
+        cart = self.make_cart(days_old=40)
+        api_client.get(f'/carts/{cart.id}/')
+
+        call_command('sweep_carts', days=30, sleep=0)
+
+        assert caches['carts'].get(f'carts:{cart.id}') is None
+        assert api_client.get(f'/carts/{cart.id}/').status_code == status.HTTP_404_NOT_FOUND
@@ -1,4 +1,6 @@
 import pytest
+from django.core import serializers
+from django.core.management import call_command
 from model_bakery import baker
 from rest_framework import status
 from user.models import User
@@ -157,3 +159,114 @@ class TestRetrieveCollection:
         response = api_client.get('/collections/1/')
 
         assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+class TestCollectionsCache:
+    def test_if_product_is_added_returns_new_products_count(self, api_client, django_capture_on_commit_callbacks):
+        collection = baker.make(Collection)
+        api_client.get(f'/collections/{collection.id}/')
+        api_client.get('/collections/')
+
+        with django_capture_on_commit_callbacks(execute=True):
+            baker.make(Product, collection=collection)
+
+        assert api_client.get(f'/collections/{collection.id}/').data['products_count'] == 1
+        assert api_client.get('/collections/').data[0]['products_count'] == 1
+
+    def test_if_product_changes_collection_returns_new_products_count(self, api_client, django_capture_on_commit_callbacks):
+        product = baker.make(Product)
+        previous_collection = product.collection
+        api_client.get(f'/collections/{previous_collection.id}/')
+
+        with django_capture_on_commit_callbacks(execute=True):
+            product = Product.objects.get(pk=product.id)
+            product.collection = baker.make(Collection)
+            product.save()
+
+        assert api_client.get(f'/collections/{previous_collection.id}/').data['products_count'] == 0
+
+
+@pytest.mark.django_db
+class TestCollectionProductsCount:
+    def test_if_products_are_added_and_deleted_keeps_count(self):
+        collection = baker.make(Collection)
+        products = baker.make(Product, collection=collection, _quantity=3)
+
+        products[0].delete()
+        Product.objects.filter(pk=products[1].pk).delete()
+
+        collection.refresh_from_db()
+        assert collection.products_count == 1
+
+    def test_if_fixture_is_loaded_keeps_its_count(self):
+        collection = baker.make(Collection)
+        product = baker.make(Product, collection=collection)
+        fixture = serializers.serialize('json', [Collection.objects.get(pk=collection.pk), product])
+        Product.objects.all().delete()
+        Collection.objects.all().delete()
+
+        for obj in serializers.deserialize('json', fixture):
+            obj.save()
+
+        collection.refresh_from_db()
+        assert collection.products_count == 1
+
+    def test_if_list_is_requested_does_not_query_products(self, api_client, django_assert_num_queries):
+        for collection in baker.make(Collection, _quantity=3):
+            baker.make(Product, collection=collection, _quantity=2)
+
+        # only the collections
+        with django_assert_num_queries(1):
+            response = api_client.get('/collections/')
+
+        assert [item['products_count'] for item in response.data] == [2, 2, 2]
+
+    def test_if_counter_has_drifted_repair_command_fixes_it(self):
+        collection, empty = baker.make(Collection, _quantity=2)
+        baker.make(Product, collection=collection, _quantity=2)
+        Collection.objects.update(products_count=7)
+
+        call_command('repair_collection_counters', chunk_size=1)
+
+        assert dict(Collection.objects.values_list('id', 'products_count')) == {
+            collection.id: 2, empty.id: 0}
+
+
+@pytest.mark.django_db
+class TestCollectionsConditionalGet:
+    def test_if_collection_is_unchanged_returns_304(self, api_client):
+        collection = baker.make(Collection)
+        etag = api_client.get(f'/collections/{collection.id}/')['ETag']
+
+        response = api_client.get(
+            f'/collections/{collection.id}/', HTTP_IF_NONE_MATCH=etag)
+
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    def test_if_product_is_added_returns_200(self, api_client, django_capture_on_commit_callbacks):
+        collection = baker.make(Collection)
+        etag = api_client.get('/collections/')['ETag']
+
+        with django_capture_on_commit_callbacks(execute=True):
+            baker.make(Product, collection=collection)
+        response = api_client.get('/collections/', HTTP_IF_NONE_MATCH=etag)
+
+        assert response.status_code == status.HTTP_200_OK
+
+
+    def test_if_pk_is_not_a_number_returns_404(self, api_client):
+
+        response = api_client.get('/collections/abc/')
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+class TestCollectionsSparseFieldset:
+    def test_if_fields_are_excluded_does_not_return_them(self, api_client):
+        collection = baker.make(Collection)
+
+        response = api_client.get(f'/collections/{collection.id}/', {'exclude': 'products_count'})
+
+        assert response.data == {'id': collection.id, 'title': collection.title}
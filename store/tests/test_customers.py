@@ -0,0 +1,88 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from model_bakery import baker
+from rest_framework import status
+from user.models import User
+from store import customers
+from store.models import Cart, CartItem, Customer, Order
+
+
+@pytest.mark.django_db
+class TestRegisterUser:
+    def test_if_user_registers_creates_customer(self, api_client):
+        response = api_client.post('/auth/users/', {
+            'username': 'jane', 'email': 'jane@example.com', 'password': 'a-long-passphrase-42',
+            'first_name': 'Jane', 'last_name': 'Doe'})
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert Customer.objects.filter(user_id=response.data['id']).exists()
+
+
+@pytest.mark.django_db
+class TestGetCustomerId:
+    def test_if_resolved_again_reads_neither_memo_nor_database(self, api_client, authenticate):
+        customer = baker.make(Customer)
+        authenticate(user=User.objects.get(pk=customer.user_id))
+        api_client.get('/orders/')
+
+        # a fresh user object, as the next request would authenticate
+        authenticate(user=User.objects.get(pk=customer.user_id))
+        with CaptureQueriesContext(connection) as context:
+            response = api_client.get('/orders/')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert not any('"store_customer"' in query['sql'] for query in context.captured_queries)
+
+    def test_if_user_has_no_customer_creates_it(self):
+        user = baker.make(User)
+
+        customer_id = customers.get_customer_id(user)
+
+        assert Customer.objects.get(user=user).id == customer_id
+
+    def test_if_customer_is_deleted_forgets_it(self, django_capture_on_commit_callbacks):
+        customer = baker.make(Customer)
+        customers.get_customer_id(User.objects.get(pk=customer.user_id))
+
+        with django_capture_on_commit_callbacks(execute=True):
+            customer.delete()
+        customer_id = customers.get_customer_id(User.objects.get(pk=customer.user_id))
+
+        assert customer_id != customer.id
+        assert Customer.objects.get(pk=customer_id).user_id == customer.user_id
+
+    def test_if_me_is_requested_returns_own_customer(self, api_client, authenticate):
+        customer = baker.make(Customer, phone='555')
+
+        authenticate(user=User.objects.get(pk=customer.user_id))
+        response = api_client.get('/customers/me/')
+
+        assert response.data['id'] == customer.id
+        assert response.data['phone'] == '555'
+
+    def test_if_cached_customer_was_deleted_elsewhere_resolves_again(self, api_client, authenticate):
+        customer = baker.make(Customer)
+        user = User.objects.get(pk=customer.user_id)
+        customers.get_customer_id(user)
+        # Deleted by another process: this one's cache still has the id.
+        Customer.objects.filter(pk=customer.pk).delete()
+
+        authenticate(user=User.objects.get(pk=customer.user_id))
+        response = api_client.get('/customers/me/')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['id'] == Customer.objects.get(user_id=customer.user_id).id
+
+    def test_if_cached_customer_was_deleted_elsewhere_checkout_succeeds(self, api_client, authenticate):
+        customer = baker.make(Customer)
+        customers.get_customer_id(User.objects.get(pk=customer.user_id))
+        Customer.objects.filter(pk=customer.pk).delete()
+        cart = baker.make(Cart)
+        baker.make(CartItem, cart=cart, product__inventory=1, quantity=1)
+
+        authenticate(user=User.objects.get(pk=customer.user_id))
+        response = api_client.post('/orders/', {'cart_id': cart.id})
+
+        assert response.status_code == status.HTTP_200_OK
+        assert Order.objects.get().customer.user_id == customer.user_id
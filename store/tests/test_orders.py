@@ -0,0 +1,426 @@
+import math
+import pytest
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from django.db import OperationalError, connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from user.models import User
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIRequestFactory
+from model_bakery import baker
+from django.core.management import call_command
+from store import idempotency, inventory, outbox
+from store.models import Cart, CartItem, Collection, Customer, IdempotencyKey, OutboxEvent, Product, Promotion, Order, OrderItem
+from store.serializers import CreateOrderSerializer
+from store.views import OrderViewSet
+
+
+@pytest.fixture
+def create_order(api_client):
+    def do_create_order(order):
+        return api_client.post('/orders/', order)
+    return do_create_order
+
+
+@pytest.mark.django_db
+class TestCreateOrder:
+    def test_if_user_is_anonymous_returns_401(self, create_order):
+        cart = baker.make(Cart)
+
+        response = create_order({'cart_id': cart.id})
+
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_if_cart_is_empty_returns_400(self, create_order, authenticate):
+        cart = baker.make(Cart)
+
+        authenticate(user=baker.make(User))
+        response = create_order({'cart_id': cart.id})
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_if_cart_is_valid_returns_200(self, create_order, authenticate):
+        cart = baker.make(Cart)
+        baker.make(CartItem, cart=cart, product__inventory=2, quantity=2)
+
+        authenticate(user=baker.make(User))
+        response = create_order({'cart_id': cart.id})
+
+        assert response.status_code == status.HTTP_200_OK
+        assert not Cart.objects.filter(id=cart.id).exists()
+
+    def test_if_product_is_promoted_stores_discounted_unit_price(self, create_order, authenticate):
+        cart = baker.make(Cart)
+        product = baker.make(Product, unit_price=Decimal('20.00'), inventory=1)
+        product.promotions.add(baker.make(Promotion, discount=0.15))
+        baker.make(CartItem, cart=cart, product=product, quantity=1)
+
+        authenticate(user=baker.make(User))
+        create_order({'cart_id': cart.id})
+
+        assert OrderItem.objects.get(product=product).unit_price == Decimal('17.00')
+
+    def test_if_order_is_placed_reserves_inventory(self, create_order, authenticate):
+        cart = baker.make(Cart)
+        product = baker.make(Product, inventory=5)
+        baker.make(CartItem, cart=cart, product=product, quantity=3)
+
+        authenticate(user=baker.make(User))
+        create_order({'cart_id': cart.id})
+
+        product.refresh_from_db()
+        assert product.inventory == 2
+
+    @pytest.mark.parametrize('lines', [1, 10, 500])
+    def test_if_cart_grows_query_count_stays_the_same(self, create_order, authenticate, lines):
+        cart = baker.make(Cart)
+        products = Product.objects.bulk_create(baker.prepare(
+            Product, collection=baker.make(Collection), inventory=10, _quantity=lines))
+        CartItem.objects.bulk_create(
+            CartItem(cart=cart, product=product, quantity=1) for product in products)
+        authenticate(user=baker.make(Customer).user)
+
+        with CaptureQueriesContext(connection) as context:
+            response = create_order({'cart_id': cart.id})
+
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.data['items']) == lines
+        # Only the bulk insert of the order items may be split into batches,
+        # as SQLite caps the parameters of a single statement.
+        fields = [field for field in OrderItem._meta.concrete_fields if not field.primary_key]
+        batches = math.ceil(lines / connection.ops.bulk_batch_size(fields, [None] * lines))
+        inserts = [query for query in context.captured_queries
+                   if query['sql'].startswith('INSERT INTO "store_orderitem"')]
+        assert len(inserts) == batches
+        assert len(context.captured_queries) - len(inserts) == 17
+
+    def test_if_cart_is_checked_out_meanwhile_raises_and_orders_once(self):
+        cart = baker.make(Cart)
+        product = baker.make(Product, inventory=5)
+        baker.make(CartItem, cart=cart, product=product, quantity=2)
+        context = {'customer_id': baker.make(Customer).id}
+        first = CreateOrderSerializer(data={'cart_id': cart.id}, context=context)
+        second = CreateOrderSerializer(data={'cart_id': cart.id}, context=context)
+        assert first.is_valid() and second.is_valid()
+
+        first.save()
+        with pytest.raises(ValidationError):
+            second.save()
+
+        product.refresh_from_db()
+        assert Order.objects.count() == 1
+        assert product.inventory == 3
+
+    def test_if_inventory_is_short_returns_400_and_reserves_nothing(self, create_order, authenticate):
+        cart = baker.make(Cart)
+        in_stock = baker.make(Product, inventory=5)
+        short = baker.make(Product, inventory=1)
+        baker.make(CartItem, cart=cart, product=in_stock, quantity=2)
+        baker.make(CartItem, cart=cart, product=short, quantity=3)
+
+        authenticate(user=baker.make(User))
+        response = create_order({'cart_id': cart.id})
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data['items'] == [
+            {'product_id': str(short.id), 'requested': '3', 'available': '1'}]
+        assert list(Product.objects.order_by('id').values_list('inventory', flat=True)) == [5, 1]
+        assert not Order.objects.exists()
+        assert Cart.objects.filter(id=cart.id).exists()
+
+
+@pytest.mark.django_db
+class TestIdempotentCreateOrder:
+    @pytest.fixture
+    def user(self, authenticate):
+        user = baker.make(User)
+        authenticate(user=user)
+        return user
+
+    @pytest.fixture
+    def cart(self):
+        cart = baker.make(Cart)
+        baker.make(CartItem, cart=cart, product__inventory=5, quantity=2)
+        return cart
+
+    def post(self, api_client, cart, key):
+        return api_client.post('/orders/', {'cart_id': cart.id}, HTTP_IDEMPOTENCY_KEY=key)
+
+    def claim(self, user, cart, created_at):
+        body = APIRequestFactory().post('/orders/', {'cart_id': cart.id}).body
+        return IdempotencyKey.objects.create(
+            digest=idempotency.get_digest('checkout-1', user.id, 'POST', '/orders/'),
+            fingerprint=idempotency.get_fingerprint(body),
+            created_at=created_at, expires_at=created_at + timedelta(days=1))
+
+    def test_if_request_is_retried_replays_first_response(self, api_client, user, cart):
+        first = self.post(api_client, cart, 'checkout-1')
+        retried = self.post(api_client, cart, 'checkout-1')
+
+        assert retried.status_code == status.HTTP_200_OK
+        assert retried.content == first.content
+        assert retried['Idempotent-Replayed'] == 'true'
+        assert Order.objects.count() == 1
+        assert Product.objects.get().inventory == 3
+
+    def test_if_key_is_reused_for_other_request_returns_422(self, api_client, user, cart):
+        self.post(api_client, cart, 'checkout-1')
+
+        response = self.post(api_client, baker.make(Cart), 'checkout-1')
+
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    def test_if_keys_differ_runs_both(self, api_client, user, cart):
+        self.post(api_client, cart, 'checkout-1')
+
+        response = self.post(api_client, cart, 'checkout-2')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert 'Idempotent-Replayed' not in response
+
+    def test_if_request_fails_releases_the_key(self, api_client, user, cart):
+        Product.objects.update(inventory=0)
+        failed = self.post(api_client, cart, 'checkout-1')
+        Product.objects.update(inventory=5)
+
+        response = self.post(api_client, cart, 'checkout-1')
+
+        assert failed.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.status_code == status.HTTP_200_OK
+        assert 'Idempotent-Replayed' not in response
+
+    def test_if_duplicate_is_still_running_returns_409(self, api_client, user, cart, monkeypatch):
+        monkeypatch.setattr(OrderViewSet, 'idempotency_wait', 0)
+        self.claim(user, cart, created_at=timezone.now())
+
+        response = self.post(api_client, cart, 'checkout-1')
+
+        assert response.status_code == status.HTTP_409_CONFLICT
+        assert Cart.objects.filter(id=cart.id).exists()
+
+    def test_if_claim_was_abandoned_takes_it_over(self, api_client, user, cart):
+        self.claim(user, cart, created_at=timezone.now() - timedelta(hours=1))
+
+        response = self.post(api_client, cart, 'checkout-1')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert IdempotencyKey.objects.get().status_code == status.HTTP_200_OK
+
+    def test_if_keys_expired_purges_them(self, user, cart):
+        now = timezone.now()
+        for days in (-2, 2):
+            IdempotencyKey.objects.create(
+                digest=str(days), fingerprint='', created_at=now,
+                expires_at=now + timedelta(days=days))
+
+        assert idempotency.purge() == 1
+        assert list(IdempotencyKey.objects.values_list('digest', flat=True)) == ['2']
+
+
+@pytest.mark.django_db
+class TestOrderOutbox:
+    @pytest.fixture
+    def delivered(self, settings):
+        delivered = []
+        settings.OUTBOX_HANDLERS = {'*': [lambda event: delivered.append((event.topic, event.payload))]}
+        return delivered
+
+    def events(self):
+        return list(OutboxEvent.objects.order_by('id').values_list('topic', 'payload'))
+
+    def test_if_order_is_placed_enqueues_created_event(self, create_order, authenticate):
+        cart = baker.make(Cart)
+        baker.make(CartItem, cart=cart, product__inventory=1, quantity=1)
+
+        authenticate(user=baker.make(User))
+        order_id = create_order({'cart_id': cart.id}).data['id']
+
+        order = Order.objects.get(pk=order_id)
+        assert self.events() == [
+            (outbox.ORDER_CREATED, {'order_id': order.id, 'customer_id': order.customer_id})]
+
+    def test_if_checkout_fails_enqueues_nothing(self, create_order, authenticate):
+        cart = baker.make(Cart)
+        baker.make(CartItem, cart=cart, product__inventory=0, quantity=1)
+
+        authenticate(user=baker.make(User))
+        create_order({'cart_id': cart.id})
+
+        assert self.events() == []
+
+    def test_if_payment_status_changes_enqueues_change_event(self, api_client, authenticate):
+        order = baker.make(Order)
+        OutboxEvent.objects.all().delete()
+
+        authenticate(user=baker.make(User, is_staff=True))
+        api_client.patch(f'/orders/{order.id}/', {'payment_status': 'C'})
+        api_client.patch(f'/orders/{order.id}/', {'payment_status': 'C'})
+
+        assert self.events() == [(outbox.ORDER_PAYMENT_STATUS_CHANGED, {
+            'order_id': order.id, 'previous': 'P', 'payment_status': 'C'})]
+
+    def test_if_outbox_is_processed_delivers_and_deletes_events(self, delivered, capsys):
+        orders = baker.make(Order, _quantity=5)
+
+        call_command('process_outbox', batch_size=2)
+
+        assert delivered == [(outbox.ORDER_CREATED, {'order_id': order.id, 'customer_id': order.customer_id})
+                             for order in orders]
+        assert not OutboxEvent.objects.exists()
+        output = capsys.readouterr().out
+        assert output.count('batch: ') == 3
+        assert '5 events were delivered and 0 failed' in output
+        assert 'Backlog: 0 events' in output
+
+    def test_if_handler_fails_retries_event_later(self, settings):
+        def handler(event):
+            if event.payload['order_id'] == failing.id:
+                raise RuntimeError('mail server down')
+        settings.OUTBOX_HANDLERS = {outbox.ORDER_CREATED: [handler]}
+        failing, delivered = baker.make(Order, _quantity=2)
+
+        assert outbox.process_batch() == (1, 1)
+        assert outbox.process_batch() == (0, 0)
+
+        event = OutboxEvent.objects.get()
+        assert event.payload['order_id'] == failing.id
+        assert event.attempts == 1
+        assert event.available_at > timezone.now()
+        assert 'mail server down' in event.last_error
+        assert outbox.get_backlog()['pending'] == 1
+
+
+@pytest.mark.django_db
+class TestReserveInventory:
+    def test_if_product_is_listed_twice_reserves_the_sum(self):
+        product = baker.make(Product, inventory=5)
+
+        with pytest.raises(inventory.InsufficientInventory) as error:
+            inventory.reserve([(product.id, 3), (product.id, 3)])
+
+        assert error.value.shortfalls == [
+            {'product_id': product.id, 'requested': 6, 'available': 5}]
+
+    def test_if_stock_is_exact_reserves_everything(self):
+        products = baker.make(Product, inventory=2, _quantity=3)
+
+        inventory.reserve([(product.id, 2) for product in products])
+
+        assert set(Product.objects.values_list('inventory', flat=True)) == {0}
+
+
+def is_sqlite_lock(error):
+    # 'database is locked', or 'database table is locked' in shared memory.
+    return connection.vendor == 'sqlite' and 'is locked' in str(error)
+
+
+@pytest.mark.django_db(transaction=True)
+class TestConcurrentReservations:
+    def test_if_checkouts_race_never_oversells(self):
+        products = baker.make(Product, inventory=20, _quantity=3)
+        ids = [product.id for product in products]
+        reserved, failed, errors = [], [], []
+
+        def checkout(index):
+            # Overlapping lines in opposite orders are the classic deadlock.
+            lines = [(product_id, 1) for product_id in ids]
+            if index % 2:
+                lines.reverse()
+            try:
+                for attempt in range(100):
+                    try:
+                        inventory.reserve(lines)
+                        reserved.append(index)
+                        return
+                    except OperationalError as error:
+                        # SQLite refuses a second writer instead of waiting;
+                        # anything else, a deadlock above all, is a failure.
+                        if not is_sqlite_lock(error):
+                            raise
+                errors.append(index)
+            except inventory.InsufficientInventory:
+                failed.append(index)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=checkout, args=(index,)) for index in range(30)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=60)
+
+        assert not any(thread.is_alive() for thread in threads)
+        assert errors == []
+        assert len(reserved) == 20 and len(failed) == 10
+        assert set(Product.objects.values_list('inventory', flat=True)) == {0}
+
+
+@pytest.mark.django_db
+class TestOrdersSparseFieldset:
+    def test_if_fields_are_given_returns_only_them(self, api_client, authenticate):
+        order = baker.make(Order)
+
+        authenticate(user=baker.make(User, is_staff=True))
+        response = api_client.get('/orders/', {'fields': 'id,payment_status'})
+
+        assert response.data['results'] == [{'id': order.id, 'payment_status': order.payment_status}]
+
+
+@pytest.mark.django_db
+class TestListOrders:
+    def make_orders(self, count, **kwargs):
+        orders = baker.make(Order, _quantity=count, **kwargs)
+        now = timezone.now()
+        for index, order in enumerate(orders):
+            Order.objects.filter(pk=order.pk).update(placed_at=now - timedelta(hours=index))
+        return [order.id for order in orders]
+
+    def test_if_user_is_staff_pages_newest_first(self, api_client, authenticate):
+        order_ids = self.make_orders(15)
+
+        authenticate(user=baker.make(User, is_staff=True))
+        first = api_client.get('/orders/').data
+        second = api_client.get(first['next']).data
+
+        assert [order['id'] for order in first['results']] == order_ids[:10]
+        assert [order['id'] for order in second['results']] == order_ids[10:]
+        assert second['next'] is None
+
+    def test_if_filtered_returns_matching_orders(self, api_client, authenticate):
+        pending_ids = self.make_orders(3, payment_status=Order.PAYMENT_STATUS_PENDING)
+        self.make_orders(2, payment_status=Order.PAYMENT_STATUS_COMPLETE)
+
+        authenticate(user=baker.make(User, is_staff=True))
+        response = api_client.get('/orders/', {
+            'payment_status': 'P',
+            'placed_at__gte': (timezone.now() - timedelta(minutes=90)).isoformat(),
+        })
+
+        assert [order['id'] for order in response.data['results']] == pending_ids[:2]
+
+    def test_if_product_price_changes_keeps_stored_line_prices(self, api_client, authenticate):
+        orderitem = baker.make(OrderItem, product__unit_price=Decimal('20.00'),
+                               unit_price=Decimal('17.00'), quantity=3)
+        Product.objects.update(unit_price=Decimal('25.00'))
+
+        authenticate(user=baker.make(User, is_staff=True))
+        listed = api_client.get('/orders/').data['results'][0]['items'][0]
+        retrieved = api_client.get(f'/orders/{orderitem.order_id}/').data['items'][0]
+
+        assert listed == retrieved
+        assert (listed['unit_price'], listed['total_price']) == (Decimal('17.00'), Decimal('51.00'))
+
+    def test_if_orders_have_many_items_query_count_does_not_grow(
+            self, api_client, authenticate, django_assert_num_queries):
+        for order in baker.make(Order, _quantity=10):
+            baker.make(OrderItem, order=order, _quantity=5)
+
+        authenticate(user=baker.make(User, is_staff=True))
+        # the page of orders, then the items of all of them with their products
+        with django_assert_num_queries(2):
+            api_client.get('/orders/')
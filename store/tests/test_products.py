@@ -1,8 +1,11 @@
+import json
 import pytest
+from decimal import Decimal
+from django.db import connection
 from user.models import User
 from rest_framework import status
 from model_bakery import baker
-from store.models import Product, Collection, OrderItem
+from store.models import Product, Collection, OrderItem, ProductSearchTerm, Promotion
 
 
 @pytest.fixture
@@ -186,3 +189,480 @@ class TestRetrieveProduct:
         response = api_client.get('/products/1/')
 
         assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+class TestProductsCursorPagination:
+    def collect_pages(self, api_client, url):
+        ids = []
+        while url:
+            response = api_client.get(url)
+            assert response.status_code == status.HTTP_200_OK
+            ids += [product['id'] for product in response.data['results']]
+            url = response.data['next']
+        return ids
+
+    def test_if_cursor_is_not_requested_returns_page_numbers(self, api_client):
+        baker.make(Product, _quantity=3)
+
+        response = api_client.get('/products/')
+
+        assert response.data['count'] == 3
+
+    def test_if_cursor_is_requested_returns_every_product_once(self, api_client):
+        products = baker.make(Product, title='a', _quantity=12)
+        products += baker.make(Product, title='b', _quantity=12)
+
+        ids = self.collect_pages(api_client, '/products/?pagination=cursor')
+
+        assert ids == [product.id for product in products]
+
+    def test_if_filters_and_ordering_are_applied_cursor_follows_them(self, api_client):
+        collection = baker.make(Collection)
+        products = [baker.make(Product, collection=collection, unit_price=price)
+                    for price in [5, 5, 7, 9, 30] * 5]
+        baker.make(Product, unit_price=8, _quantity=5)
+
+        ids = self.collect_pages(
+            api_client,
+            f'/products/?pagination=cursor&ordering=-unit_price'
+            f'&collection_id={collection.id}&unit_price__lt=20')
+
+        expected = sorted((product for product in products if product.unit_price < 20),
+                          key=lambda product: (-product.unit_price, -product.id))
+        assert ids == [product.id for product in expected]
+
+    def test_if_search_is_applied_cursor_follows_rank(self, api_client):
+        products = [baker.make(Product, title=f'{letter} apple',
+                               description=' '.join(['apple'] * count))
+                    for count, letter in zip([3, 0, 5, 1, 4] * 5, 'abcdefghijklmnopqrstuvwxy')]
+
+        ids = self.collect_pages(api_client, '/products/?pagination=cursor&search=apple')
+
+        expected = sorted(products, key=lambda product: (
+            -product.description.count('apple'), -product.id))
+        assert ids == [product.id for product in expected]
+
+    def test_if_previous_link_is_followed_returns_previous_page(self, api_client):
+        baker.make(Product, _quantity=25)
+        first = api_client.get('/products/?pagination=cursor')
+        second = api_client.get(first.data['next'])
+
+        response = api_client.get(second.data['previous'])
+
+        assert response.data['results'] == first.data['results']
+
+    def test_if_cursor_is_invalid_returns_404(self, api_client):
+
+        response = api_client.get('/products/?cursor=invalid')
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+class TestSearchProducts:
+    def search(self, api_client, query):
+        response = api_client.get('/products/', {'search': query})
+        assert response.status_code == status.HTTP_200_OK
+        return [product['id'] for product in response.data['results']]
+
+    def test_if_all_terms_match_returns_product(self, api_client):
+        product = baker.make(Product, title='Red Apple', description='Fresh fruit')
+        baker.make(Product, title='Red Wine', description='Dry')
+
+        assert self.search(api_client, 'red fresh') == [product.id]
+
+    def test_if_term_is_a_prefix_returns_product(self, api_client):
+        product = baker.make(Product, title='Bananas', description='')
+
+        assert self.search(api_client, 'BAN') == [product.id]
+
+    def test_if_term_is_a_prefix_stops_at_next_prefix(self, api_client):
+        product = baker.make(Product, title='Bazaar', description='')
+        baker.make(Product, title='Bbq', description='')
+
+        assert self.search(api_client, 'ba') == [product.id]
+
+    def test_if_terms_differ_only_in_accents_indexes_both(self, api_client):
+        product = baker.make(Product, title='Café', description='cafe')
+
+        assert self.search(api_client, 'café') == [product.id]
+        assert self.search(api_client, 'cafe') == [product.id]
+
+    def test_if_term_ends_in_an_accent_matches_on_mysql(self, api_client):
+        if connection.vendor != 'mysql':
+            pytest.skip('MySQL collations are the ones that fold accents')
+        product = baker.make(Product, title='Crème brûlée', description='')
+        baker.make(Product, title='Creme brulee', description='')
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT collation_name FROM information_schema.columns '
+                'WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s',
+                [ProductSearchTerm._meta.db_table, 'term'])
+            assert cursor.fetchone()[0] == 'utf8mb4_bin'
+        assert self.search(api_client, 'crème brûlé') == [product.id]
+
+    def test_if_term_is_in_title_ranks_above_description(self, api_client):
+        in_description = baker.make(
+            Product, title='Juice', description='Made from oranges and oranges only')
+        in_title = baker.make(Product, title='Oranges', description='Citrus')
+
+        assert self.search(api_client, 'oranges') == [in_title.id, in_description.id]
+
+    def test_if_product_is_updated_index_follows(self, api_client, authenticate):
+        product = baker.make(Product, title='Old name', description='')
+        authenticate(user=baker.make(User, is_staff=True))
+
+        api_client.put(f'/products/{product.id}/', {
+            'title': 'New name', 'description': '', 'unit_price': 10,
+            'inventory': 1, 'collection': product.collection.id})
+
+        assert self.search(api_client, 'new') == [product.id]
+        assert self.search(api_client, 'old') == []
+
+    def test_if_product_is_deleted_it_is_not_returned(self, api_client):
+        product = baker.make(Product, title='Gone', description='')
+
+        product.delete()
+
+        assert self.search(api_client, 'gone') == []
+
+
+@pytest.mark.django_db
+class TestProductsCache:
+    def test_if_product_was_read_before_only_queries_its_version(self, api_client, django_assert_num_queries):
+        product = baker.make(Product)
+        api_client.get(f'/products/{product.id}/')
+
+        with django_assert_num_queries(1):
+            response = api_client.get(f'/products/{product.id}/')
+
+        assert response.data['id'] == product.id
+
+    def test_if_product_is_updated_returns_new_data(self, api_client, authenticate, django_capture_on_commit_callbacks):
+        product = baker.make(Product, title='a')
+        api_client.get(f'/products/{product.id}/')
+        api_client.get('/products/')
+        authenticate(user=baker.make(User, is_staff=True))
+
+        with django_capture_on_commit_callbacks(execute=True):
+            api_client.patch(f'/products/{product.id}/', {'title': 'b'})
+
+        assert api_client.get(f'/products/{product.id}/').data['title'] == 'b'
+        assert api_client.get('/products/').data['results'][0]['title'] == 'b'
+
+    def test_if_inventory_is_cleared_in_admin_returns_new_data(self, api_client, admin_client, django_capture_on_commit_callbacks):
+        product = baker.make(Product, inventory=5)
+        api_client.get(f'/products/{product.id}/')
+
+        with django_capture_on_commit_callbacks(execute=True):
+            admin_client.post('/admin/store/product/', {
+                'action': 'clear_inventory', '_selected_action': [product.id]})
+
+        assert api_client.get(f'/products/{product.id}/').data['inventory'] == 0
+
+
+@pytest.mark.django_db
+class TestProductsConditionalGet:
+    def test_if_product_is_unchanged_returns_304(self, api_client):
+        product = baker.make(Product)
+        etag = api_client.get(f'/products/{product.id}/')['ETag']
+
+        response = api_client.get(
+            f'/products/{product.id}/', HTTP_IF_NONE_MATCH=etag)
+
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    def test_if_product_is_changed_returns_200(self, api_client):
+        product = baker.make(Product)
+        etag = api_client.get(f'/products/{product.id}/')['ETag']
+
+        product.title = 'changed'
+        product.save()
+        response = api_client.get(
+            f'/products/{product.id}/', HTTP_IF_NONE_MATCH=etag)
+
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_if_list_is_unchanged_returns_304_without_querying(self, api_client, django_assert_num_queries):
+        baker.make(Product, _quantity=3)
+        etag = api_client.get('/products/')['ETag']
+
+        with django_assert_num_queries(0):
+            response = api_client.get('/products/', HTTP_IF_NONE_MATCH=etag)
+
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    def test_if_product_is_deleted_list_returns_200(self, api_client, django_capture_on_commit_callbacks):
+        products = baker.make(Product, _quantity=3)
+        etag = api_client.get('/products/')['ETag']
+
+        with django_capture_on_commit_callbacks(execute=True):
+            products[0].delete()
+        response = api_client.get('/products/', HTTP_IF_NONE_MATCH=etag)
+
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_if_modified_since_last_update_returns_304(self, api_client):
+        product = baker.make(Product)
+        last_modified = api_client.get(f'/products/{product.id}/')['Last-Modified']
+
+        response = api_client.get(
+            f'/products/{product.id}/', HTTP_IF_MODIFIED_SINCE=last_modified)
+
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    def test_if_list_is_requested_returns_no_last_modified(self, api_client):
+        baker.make(Product)
+
+        response = api_client.get('/products/')
+
+        assert 'ETag' in response
+        assert 'Last-Modified' not in response
+
+    def test_if_pk_is_not_a_number_returns_404(self, api_client):
+
+        response = api_client.get('/products/abc/')
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+class TestProductPricing:
+    def test_if_product_has_no_promotion_returns_exact_taxed_price(self, api_client):
+        product = baker.make(Product, unit_price=Decimal('10.05'))
+
+        response = api_client.get(f'/products/{product.id}/')
+
+        assert response.data['discounted_price'] == Decimal('10.05')
+        assert response.data['price_with_tax'] == Decimal('11.06')
+
+    def test_if_product_has_promotions_applies_the_best_one(self, api_client):
+        product = baker.make(Product, unit_price=Decimal('10.00'))
+        product.promotions.add(baker.make(Promotion, discount=0.1),
+                               baker.make(Promotion, discount=0.25))
+
+        response = api_client.get(f'/products/{product.id}/')
+
+        assert response.data['discounted_price'] == Decimal('7.50')
+        assert response.data['price_with_tax'] == Decimal('8.25')
+
+    def test_if_list_is_requested_prices_it_in_one_query(self, api_client, django_assert_num_queries):
+        for product in baker.make(Product, _quantity=5):
+            product.promotions.add(baker.make(Promotion, discount=0.1))
+
+        # count, page, promotions
+        with django_assert_num_queries(3):
+            api_client.get('/products/')
+
+
+@pytest.mark.django_db
+class TestProductsSparseFieldset:
+    def test_if_fields_are_given_returns_only_them(self, api_client):
+        product = baker.make(Product)
+
+        response = api_client.get('/products/', {'fields': 'id,title'})
+
+        assert response.data['results'] == [{'id': product.id, 'title': product.title}]
+
+    def test_if_fields_are_excluded_does_not_select_their_columns(self, api_client, django_assert_num_queries):
+        baker.make(Product, description='long text')
+
+        with django_assert_num_queries(2) as queries:
+            response = api_client.get(
+                '/products/', {'exclude': 'description,discounted_price,price_with_tax'})
+
+        assert 'description' not in response.data['results'][0]
+        assert '"store_product"."description"' not in queries.captured_queries[-1]['sql']
+
+
+@pytest.fixture
+def import_products(api_client):
+    def do_import_products(body, content_type='text/csv'):
+        return api_client.post('/products/import/', body, content_type=content_type)
+    return do_import_products
+
+
+@pytest.mark.django_db
+class TestImportProducts:
+    def test_if_user_is_not_admin_returns_403(self, import_products, authenticate):
+        authenticate(user=baker.make(User))
+
+        response = import_products('title,slug,unit_price,inventory,collection\n')
+
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    def test_if_content_type_is_not_supported_returns_415(self, import_products, authenticate):
+        authenticate(user=baker.make(User, is_staff=True))
+
+        response = import_products('{}', content_type='application/xml')
+
+        assert response.status_code == status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+
+    def test_if_csv_is_valid_creates_and_updates_by_slug(self, import_products, authenticate):
+        collection = baker.make(Collection)
+        existing = baker.make(Product, slug='apple', title='Old apple')
+        authenticate(user=baker.make(User, is_staff=True))
+
+        response = import_products(
+            'title,slug,description,unit_price,inventory,collection\n'
+            f'Apple,apple,Red,2.50,10,{collection.id}\n'
+            f'Pear,pear,,3,5,{collection.id}\n')
+
+        existing.refresh_from_db()
+        assert response.data['created'] == 1
+        assert response.data['updated'] == 1
+        assert existing.title == 'Apple'
+        assert existing.collection_id == collection.id
+        assert Product.objects.get(slug='pear').unit_price == Decimal('3.00')
+
+    def test_if_products_move_collections_keeps_counts(self, import_products, authenticate):
+        collection = baker.make(Collection)
+        existing = baker.make(Product, slug='apple')
+        authenticate(user=baker.make(User, is_staff=True))
+
+        import_products(
+            'title,slug,description,unit_price,inventory,collection\n'
+            f'Apple,apple,Red,2.50,10,{collection.id}\n'
+            f'Pear,pear,,3,5,{collection.id}\n')
+
+        counts = dict(Collection.objects.values_list('id', 'products_count'))
+        assert counts == {collection.id: 2, existing.collection_id: 0}
+
+    def test_if_rows_are_invalid_reports_them_and_imports_the_rest(self, import_products, authenticate):
+        collection = baker.make(Collection)
+        authenticate(user=baker.make(User, is_staff=True))
+
+        response = import_products(
+            f'{{"title": "Plum", "slug": "plum", "unit_price": 1, "inventory": 1, "collection": {collection.id}}}\n'
+            'not json\n'
+            f'{{"title": "", "slug": "empty", "unit_price": 1, "inventory": 1, "collection": {collection.id}}}\n'
+            '{"title": "Fig", "slug": "fig", "unit_price": 1, "inventory": 1, "collection": 0}\n',
+            content_type='application/x-ndjson')
+
+        assert response.data['created'] == 1
+        assert response.data['failed'] == 3
+        assert [error['row'] for error in response.data['errors']] == [2, 3, 4]
+        assert 'collection' in response.data['errors'][2]['errors']
+
+    def test_if_slug_is_repeated_reports_earlier_row(self, import_products, authenticate):
+        collection = baker.make(Collection)
+        authenticate(user=baker.make(User, is_staff=True))
+
+        response = import_products(
+            'title,slug,description,unit_price,inventory,collection\n'
+            f'Apple,apple,Red,2.50,10,{collection.id}\n'
+            f'Green apple,apple,Green,3,5,{collection.id}\n')
+
+        assert response.data['created'] == 1
+        assert response.data['failed'] == 1
+        assert [error['row'] for error in response.data['errors']] == [1]
+        assert Product.objects.get(slug='apple').title == 'Green apple'
+
+    def test_if_product_is_imported_it_is_searchable(self, api_client, import_products, authenticate):
+        collection = baker.make(Collection)
+        authenticate(user=baker.make(User, is_staff=True))
+
+        import_products('title,slug,unit_price,inventory,collection\n'
+                        f'Mango,mango,4,1,{collection.id}\n')
+        response = api_client.get('/products/', {'search': 'mango'})
+
+        assert [product['title'] for product in response.data['results']] == ['Mango']
+
+
+@pytest.mark.django_db
+class TestExportProducts:
+    def export(self, api_client, params):
+        response = api_client.get('/products/export/', params)
+        assert response.status_code == status.HTTP_200_OK
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_if_ndjson_is_requested_streams_list_representation(self, api_client):
+        collection = baker.make(Collection)
+        baker.make(Product, collection=collection, _quantity=3)
+        baker.make(Product)
+
+        content = self.export(api_client, {'collection_id': collection.id})
+
+        listed = api_client.get('/products/', {'collection_id': collection.id}).content
+        rows = [json.loads(line) for line in content.splitlines()]
+        assert sorted(rows, key=lambda row: row['id']) == \
+            sorted(json.loads(listed)['results'], key=lambda row: row['id'])
+
+    def test_if_csv_is_requested_streams_header_and_rows(self, api_client):
+        product = baker.make(Product, unit_price=Decimal('2.50'))
+
+        content = self.export(api_client, {'output': 'csv', 'fields': 'id,unit_price'})
+
+        assert content.splitlines() == ['id,unit_price', f'{product.id},2.50']
+
+    def test_if_output_is_unknown_returns_400(self, api_client):
+
+        response = api_client.get('/products/export/', {'output': 'xml'})
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+class TestProductFacets:
+    def test_if_facets_are_requested_counts_filtered_products(self, api_client):
+        first, second = baker.make(Collection, _quantity=2)
+        baker.make(Product, collection=first, unit_price=5, _quantity=2)
+        baker.make(Product, collection=second, unit_price=30)
+        baker.make(Product, collection=second, unit_price=300)
+
+        response = api_client.get('/products/', {'facets': 'true', 'unit_price__lt': 100})
+
+        facets = response.data['facets']
+        assert facets['collection'] == [
+            {'collection_id': first.id, 'count': 2},
+            {'collection_id': second.id, 'count': 1}]
+        assert [bucket['count'] for bucket in facets['unit_price']] == [2, 0, 1, 0, 0, 0]
+        assert facets['unit_price'][0] == {'min': None, 'max': 10, 'count': 2}
+
+    def test_if_search_is_applied_counts_only_matches(self, api_client):
+        collection = baker.make(Collection)
+        baker.make(Product, title='red lamp', collection=collection, unit_price=20)
+        baker.make(Product, title='blue chair', collection=collection, unit_price=20)
+
+        response = api_client.get('/products/', {'facets': 'true', 'search': 'lamp'})
+
+        assert response.data['facets']['collection'] == [
+            {'collection_id': collection.id, 'count': 1}]
+
+    def test_if_facets_are_not_requested_does_not_return_them(self, api_client):
+        baker.make(Product)
+
+        response = api_client.get('/products/')
+
+        assert 'facets' not in response.data
+
+    def test_if_facets_are_computed_with_one_query_per_family(self, api_client, django_assert_num_queries):
+        baker.make(Product, _quantity=3)
+
+        # count, page, prices, collection facet, price facet
+        with django_assert_num_queries(5):
+            api_client.get('/products/', {'facets': 'true'})
+
+    def test_if_only_the_page_changes_reuses_cached_facets(self, api_client, django_assert_num_queries):
+        baker.make(Product, _quantity=3)
+        api_client.get('/products/', {'facets': 'true', 'ordering': 'unit_price'})
+
+        # count, page
+        with django_assert_num_queries(2):
+            response = api_client.get(
+                '/products/', {'facets': 'true', 'ordering': '-unit_price', 'fields': 'id'})
+
+        assert sum(bucket['count'] for bucket in response.data['facets']['unit_price']) == 3
+
+    def test_if_product_is_created_facets_are_recomputed(self, api_client, django_capture_on_commit_callbacks):
+        collection = baker.make(Collection)
+        api_client.get('/products/', {'facets': 'true'})
+
+        with django_capture_on_commit_callbacks(execute=True):
+            baker.make(Product, collection=collection)
+
+        response = api_client.get('/products/', {'facets': 'true'})
+        assert response.data['facets']['collection'] == [
+            {'collection_id': collection.id, 'count': 1}]
@@ -0,0 +1,214 @@
+import re
+import pytest
+from datetime import timedelta
+from decimal import Decimal
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from user.models import User
+from store import analytics, search
+from store.carts import DatabaseCartStorage
+from store.models import Cart, Collection, Customer, DailyCollectionSales, DailyProductSales, Order, OrderItem, Product
+
+
+PRODUCTS = 2000
+COLLECTIONS = 40
+CUSTOMERS = 200
+WORDS = ['red', 'blue', 'green', 'wooden', 'steel', 'lamp', 'chair', 'table']
+
+
+@pytest.fixture
+def catalog():
+    collections = Collection.objects.bulk_create(
+        Collection(title=f'Collection {i:03}') for i in range(COLLECTIONS))
+    Product.objects.bulk_create(
+        Product(title=f'{WORDS[i % len(WORDS)]} {WORDS[i % 5]} {i:05}',
+                slug=f'product-{i}',
+                description=f'{WORDS[i % 3]} product',
+                unit_price=Decimal(1 + i % 500),
+                inventory=i % 100,
+                collection=collections[i % COLLECTIONS])
+        for i in range(PRODUCTS))
+    search.rebuild_index()
+    users = User.objects.bulk_create(
+        User(username=f'user{i}', email=f'user{i}@example.com',
+             first_name=f'First {i % 50}', last_name=f'Last {i}')
+        for i in range(CUSTOMERS))
+    Customer.objects.bulk_create(Customer(user=user) for user in users)
+    analyze()
+    return collections
+
+
+def analyze():
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            for model in (Collection, Product, Customer, User, Cart, Order, OrderItem,
+                          DailyProductSales, DailyCollectionSales):
+                cursor.execute(f'ANALYZE TABLE {model._meta.db_table}')
+                cursor.fetchall()
+        else:
+            cursor.execute('ANALYZE')
+
+
+def explain(sql):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            cursor.execute(f'EXPLAIN {sql}')
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def find_problems(plan, allow_sort=False, allow_index_scan=True):
+    problems = []
+    for step in plan:
+        if connection.vendor == 'mysql':
+            scans = ('ALL',) if allow_index_scan else ('ALL', 'index')
+            if step['type'] in scans:
+                problems.append(f"full scan of {step['table']}")
+            if not allow_sort and 'filesort' in (step['Extra'] or ''):
+                problems.append(f"filesort on {step['table']}")
+        else:
+            scan = r'SCAN \S+$' if allow_index_scan else r'SCAN '
+            if re.match(scan, step):
+                problems.append(step)
+            if not allow_sort and step.startswith('USE TEMP B-TREE'):
+                problems.append(step)
+    return problems
+
+
+@pytest.mark.django_db
+class TestQueryPlans:
+    @pytest.fixture(autouse=True)
+    def skip_unsupported_vendors(self):
+        if connection.vendor not in ('sqlite', 'mysql'):
+            pytest.skip('query plans are only checked on SQLite and MySQL')
+
+    def assert_indexed(self, api_client, url, **allowed):
+        with CaptureQueriesContext(connection) as context:
+            response = api_client.get(url)
+        assert response.status_code == 200
+
+        selects = [query['sql'] for query in context.captured_queries
+                   if query['sql'].startswith('SELECT')]
+        assert selects
+        for sql in selects:
+            plan = explain(sql)
+            assert find_problems(plan, **allowed) == [], (sql, plan)
+        return response
+
+    @pytest.mark.parametrize('query', [
+        '',
+        '?ordering=unit_price',
+        '?ordering=-unit_price',
+        '?ordering=title',
+        '?page=5',
+        '?pagination=cursor',
+        '?pagination=cursor&ordering=-unit_price',
+    ])
+    def test_products_list(self, api_client, catalog, query):
+        self.assert_indexed(api_client, f'/products/{query}')
+
+    @pytest.mark.parametrize('query', [
+        '',
+        '&ordering=unit_price',
+        '&unit_price__gt=100&unit_price__lt=200&ordering=unit_price',
+        '&pagination=cursor',
+    ])
+    def test_products_list_by_collection(self, api_client, catalog, query):
+        url = f'/products/?collection_id={catalog[7].id}{query}'
+
+        self.assert_indexed(api_client, url)
+
+    def test_products_next_cursor_page(self, api_client, catalog):
+        response = self.assert_indexed(
+            api_client, '/products/?pagination=cursor&ordering=unit_price')
+
+        self.assert_indexed(api_client, response.data['next'])
+
+    def test_products_search(self, api_client, catalog):
+        # Results are ordered by relevance, which always needs a sort, but
+        # matching terms must never walk the whole term index.
+        self.assert_indexed(api_client, '/products/?search=wood cha',
+                            allow_sort=True, allow_index_scan=False)
+
+    def test_collections_list(self, api_client, catalog):
+        self.assert_indexed(api_client, '/collections/')
+
+    def test_customers_list(self, api_client, authenticate, catalog):
+        authenticate(user=User(is_staff=True))
+
+        self.assert_indexed(api_client, '/customers/')
+
+    def test_carts_sweep(self, catalog):
+        Cart.objects.bulk_create(Cart() for _ in range(500))
+        analyze()
+        cutoff = timezone.now() + timedelta(days=1)
+
+        with CaptureQueriesContext(connection) as context:
+            list(DatabaseCartStorage().sweep(cutoff, batch_size=100, sleep=0))
+
+        selects = [query['sql'] for query in context.captured_queries
+                   if query['sql'].startswith('SELECT')]
+        assert selects
+        for sql in selects:
+            plan = explain(sql)
+            assert find_problems(plan) == [], (sql, plan)
+
+    @pytest.fixture
+    def orders(self, catalog):
+        customers = list(Customer.objects.order_by('id'))
+        products = list(Product.objects.order_by('id')[:100])
+        statuses = [choice for choice, _ in Order.PAYMENT_STATUS_CHOICES]
+        now = timezone.now()
+        orders = Order.objects.bulk_create(
+            Order(customer=customers[i % len(customers)],
+                  payment_status=statuses[i % len(statuses)])
+            for i in range(1000))
+        for i, order in enumerate(orders):
+            order.placed_at = now - timedelta(minutes=i)
+        Order.objects.bulk_update(orders, ['placed_at'])
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product=products[(i + j) % len(products)],
+                      quantity=1, unit_price=Decimal(10))
+            for i, order in enumerate(orders) for j in range(3))
+        analyze()
+        return customers
+
+    @pytest.mark.parametrize('query', [
+        '',
+        '?payment_status=C',
+        '?placed_at__gte=2000-01-01T00:00:00Z',
+        '?payment_status=P&placed_at__lt=2100-01-01T00:00:00Z',
+    ])
+    def test_orders_list(self, api_client, authenticate, orders, query):
+        authenticate(user=User(is_staff=True))
+
+        response = self.assert_indexed(api_client, f'/orders/{query}')
+
+        self.assert_indexed(api_client, response.data['next'])
+
+    def test_orders_list_of_customer(self, api_client, authenticate, orders):
+        authenticate(user=orders[0].user)
+
+        self.assert_indexed(api_client, '/orders/')
+
+    @pytest.mark.parametrize('query', [
+        '',
+        '&group_by=product',
+        '&group_by=collection',
+        '&product_id=7',
+        '&collection_id=3',
+    ])
+    def test_sales_report(self, api_client, authenticate, orders, query):
+        analytics.backfill()
+        analyze()
+        authenticate(user=User(is_staff=True))
+
+        # Grouping always sorts, but only the rollups of the range are read.
+        today = timezone.localdate()
+        url = f'/analytics/sales/?start={today - timedelta(days=1)}&end={today}{query}'
+
+        response = self.assert_indexed(api_client, url, allow_sort=True, allow_index_scan=False)
+        assert response.data['results']
@@ -1,8 +1,10 @@
 import pytest
+from datetime import date
+from django.core.management import call_command
 from user.models import User
 from rest_framework import status
 from model_bakery import baker
-from store.models import Reviews, Product
+from store.models import Reviews, Product, ProductReviewStats
 
 
 @pytest.fixture
@@ -195,6 +197,15 @@ class TestGetReviewsList:
 
         assert response.status_code == status.HTTP_200_OK
 
+    def test_if_reviews_exist_queries_them_once(self, api_client, django_assert_num_queries):
+        product = baker.make(Product)
+        baker.make(Reviews, product=product, _quantity=2)
+
+        with django_assert_num_queries(1):
+            response = api_client.get(f'/products/{product.id}/reviews/')
+
+        assert len(response.data) == 2
+
 
 @pytest.mark.django_db
 class TestRetrieveReview:
@@ -212,3 +223,92 @@ class TestRetrieveReview:
             f'/products/{review.product.id}/reviews/{review.id}/')
 
         assert response.status_code == status.HTTP_200_OK
+
+
+@pytest.mark.django_db
+class TestProductReviewStats:
+    def get_stats(self, product):
+        return ProductReviewStats.objects.get(product=product)
+
+    def test_if_reviews_are_added_counts_them(self):
+        product = baker.make(Product)
+
+        reviews = baker.make(Reviews, product=product, _quantity=3)
+
+        stats = self.get_stats(product)
+        assert stats.reviews_count == 3
+        assert stats.latest_review_date == reviews[0].date
+
+    def test_if_latest_review_is_deleted_falls_back_to_previous_date(self):
+        product = baker.make(Product)
+        older, latest = baker.make(Reviews, product=product, _quantity=2)
+        Reviews.objects.filter(pk=older.pk).update(date=date(2020, 1, 1))
+
+        latest.delete()
+
+        stats = self.get_stats(product)
+        assert stats.reviews_count == 1
+        assert stats.latest_review_date == date(2020, 1, 1)
+
+    def test_if_review_moves_product_moves_its_count(self):
+        review = baker.make(Reviews)
+        previous_product = review.product
+
+        review = Reviews.objects.get(pk=review.pk)
+        review.product = baker.make(Product)
+        review.save()
+
+        assert self.get_stats(previous_product).reviews_count == 0
+        assert self.get_stats(review.product).reviews_count == 1
+
+    def test_if_stats_are_lost_backfill_command_rebuilds_them(self):
+        first, second = baker.make(Product, _quantity=2)
+        baker.make(Reviews, product=first, _quantity=3)
+        baker.make(Reviews, product=second)
+        ProductReviewStats.objects.all().delete()
+
+        call_command('backfill_review_stats', chunk_size=2)
+
+        assert dict(ProductReviewStats.objects.values_list('product_id', 'reviews_count')) == {
+            first.id: 3, second.id: 1}
+
+    def test_if_review_is_saved_during_backfill_it_is_kept(self, monkeypatch):
+        first, second = baker.make(Product, _quantity=2)
+        baker.make(Reviews, product=first, _quantity=2)
+        baker.make(Reviews, product=second)
+        ProductReviewStats.objects.filter(product=second).update(reviews_count=5)
+        bulk_create = ProductReviewStats.objects.bulk_create
+
+        def review_during_backfill(objs, **kwargs):
+            if any(stats.product_id == second.id for stats in objs):
+                baker.make(Reviews, product=first)
+            return bulk_create(objs, **kwargs)
+
+        monkeypatch.setattr(ProductReviewStats.objects, 'bulk_create', review_during_backfill)
+        call_command('backfill_review_stats', chunk_size=1)
+
+        assert dict(ProductReviewStats.objects.values_list('product_id', 'reviews_count')) == {
+            first.id: 3, second.id: 1}
+
+    def test_if_expanded_product_embeds_its_stats(self, api_client):
+        product = baker.make(Product)
+        review = baker.make(Reviews, product=product)
+
+        detail = api_client.get(f'/products/{product.id}/', {'expand': 'review_stats'}).data
+        listed = api_client.get('/products/', {'expand': 'review_stats'}).data['results']
+
+        expected = {'reviews_count': 1, 'latest_review_date': review.date.isoformat()}
+        assert detail['review_stats'] == expected
+        assert listed[0]['review_stats'] == expected
+        assert 'review_stats' not in api_client.get(f'/products/{product.id}/').data
+
+    def test_if_admin_filters_by_reviews_uses_stats(self, admin_client):
+        reviewed = baker.make(Product, title='reviewed')
+        baker.make(Product, title='unreviewed')
+        baker.make(Reviews, product=reviewed)
+
+        products = admin_client.get('/admin/store/product/', {'reviews': '0<'})
+        users = admin_client.get('/admin/user/user/', {'reviews': '<1'})
+
+        assert [product.title for product in products.context['cl'].result_list] == ['reviewed']
+        assert [user.is_superuser for user in users.context['cl'].result_list] == [True]
@@ -0,0 +1,80 @@
+import pytest
+from decimal import Decimal
+from model_bakery import baker
+from rest_framework.renderers import JSONRenderer
+from store.carts import get_cart_storage
+from store.compiled import get_compiled, CompiledProductSerializer, CompiledCartItemSerializer, CompiledOrderSerializer
+from store.models import Product, Promotion, Cart, CartItem, Order, OrderItem, Reviews
+from store.serializers import ProductSerializer, CartItemSerializer, OrderSerializer
+
+
+def render(data):
+    return JSONRenderer().render(data)
+
+
+def assert_same_json(serializer_class, compiled_class, queryset, **fieldset):
+    compiled = get_compiled(compiled_class, **fieldset)
+
+    expected = serializer_class(queryset, many=True, **fieldset).data
+    actual = compiled.serialize(compiled.values(queryset))
+
+    assert render(actual) == render(expected)
+
+
+@pytest.mark.django_db
+class TestCompiledProductSerializer:
+    def test_if_products_vary_returns_same_json(self):
+        baker.make(Product, unit_price=Decimal('19.99'), description=None)
+        promoted = baker.make(Product, unit_price=Decimal('3.33'))
+        promoted.promotions.add(baker.make(Promotion, discount=0.333))
+
+        assert_same_json(ProductSerializer, CompiledProductSerializer,
+                         Product.objects.order_by('id'))
+
+    def test_if_fieldset_is_sparse_returns_same_json(self):
+        baker.make(Product, _quantity=3)
+
+        assert_same_json(ProductSerializer, CompiledProductSerializer,
+                         Product.objects.order_by('id'),
+                         fields=['id', 'title', 'price_with_tax'])
+        assert_same_json(ProductSerializer, CompiledProductSerializer,
+                         Product.objects.order_by('id'),
+                         exclude=['description'])
+
+    def test_if_review_stats_are_expanded_returns_same_json(self):
+        reviewed, _ = baker.make(Product, _quantity=2)
+        baker.make(Reviews, product=reviewed, _quantity=2)
+
+        assert_same_json(ProductSerializer, CompiledProductSerializer,
+                         Product.objects.order_by('id'),
+                         expand=['review_stats'])
+
+
+@pytest.mark.django_db
+class TestCompiledCartItemSerializer:
+    def test_if_cart_has_items_returns_same_json(self):
+        cart = baker.make(Cart)
+        promoted = baker.make(Product, unit_price=Decimal('9.95'))
+        promoted.promotions.add(baker.make(Promotion, discount=0.5))
+        baker.make(CartItem, cart=cart, product=promoted, quantity=3)
+        baker.make(CartItem, cart=cart, quantity=1)
+
+        # The compiled serializer reads the totals the storage sums up in SQL,
+        # the model serializer prices the plain items in Python.
+        compiled = get_compiled(CompiledCartItemSerializer)
+        expected = CartItemSerializer(CartItem.objects.filter(cart=cart).order_by('id'), many=True).data
+        actual = compiled.serialize(compiled.values(
+            get_cart_storage().get_items(cart.id).order_by('id')))
+
+        assert render(actual) == render(expected)
+
+
+@pytest.mark.django_db
+class TestCompiledOrderSerializer:
+    def test_if_orders_have_items_returns_same_json(self):
+        for order in baker.make(Order, _quantity=3):
+            baker.make(OrderItem, order=order, quantity=2, _quantity=2)
+        baker.make(Order)
+
+        assert_same_json(OrderSerializer, CompiledOrderSerializer,
+                         Order.objects.order_by('id'))
@@ -8,6 +8,7 @@ router.register('collections',views.CollectionsViewSet)
 router.register('carts',views.CartViewset)
 router.register('customers',views.CustomerViewSet)
 router.register('orders',views.OrderViewSet,basename='orders')
+router.register('analytics',views.AnalyticsViewSet,basename='analytics')
 
 products_router=routers.NestedDefaultRouter(router, 'products',lookup='product')
 products_router.register('reviews', views.ReviewsViewSet,basename='product-reviews')
@@ -1,32 +1,53 @@
+import codecs
+import csv
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.db.models import Count
+from django.db.models.query import QuerySet
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status
-from rest_framework.exceptions import NotFound
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import NotFound, ParseError, UnsupportedMediaType, ValidationError
 from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser, IsAuthenticatedOrReadOnly
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.filters import OrderingFilter
 from rest_framework.decorators import api_view, action
 from rest_framework.mixins import CreateModelMixin, RetrieveModelMixin, DestroyModelMixin, UpdateModelMixin
 from rest_framework.viewsets import ModelViewSet, GenericViewSet
 from rest_framework.response import Response
-from .serializers import OrderSerializer, UpdateOrderSerializer, CreateOrderSerializer, ProductSerializer, CollectionSerializer, CustomerSerializer, ReviewSerializer, CartSerializer, CartItemSerializer, AddCartItemSerializer, UpdateCartItemSerializer
+from .serializers import OrderSerializer, UpdateOrderSerializer, CreateOrderSerializer, ProductSerializer, CollectionSerializer, CustomerSerializer, ReviewSerializer, CartSerializer, CartSummarySerializer, CartItemSerializer, AddCartItemSerializer, UpdateCartItemSerializer, SalesQuerySerializer
 from .models import Product, Collection, Reviews, Cart, CartItem, Customer, Order, OrderItem
-from .filters import ProductFilters
+from .filters import OrderFilter, ProductFilters, ProductSearchFilter
+from .importing import CONTENT_TYPES, READERS, ProductImporter
+from . import analytics, customers, exporting, facets
+from .carts import get_cart_storage
+from .compiled import get_compiled, CompiledProductSerializer, CompiledCartItemSerializer, CompiledOrderSerializer
+from .mixins import CachedCatalogMixin, CompiledListMixin, ConditionalGetMixin, FacetedListMixin, IdempotentCreateMixin, SparseFieldsetMixin
+from .pagination import OrderPagination, ProductPagination
 from .permissions import IsAdminOrReadOnly, IsAuthorOrReadOnly
 
 # Create your views here.
 
 
-class ProductsViewSet(ModelViewSet):
+class ProductsViewSet(SparseFieldsetMixin, ConditionalGetMixin, CachedCatalogMixin, FacetedListMixin, CompiledListMixin, ModelViewSet):
+    cache_namespace = 'products'
+    # Keyset pagination reads the ordering columns of the boundary rows.
+    sparse_required_fields = ['id', 'title', 'unit_price']
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
+    compiled_serializer_class = CompiledProductSerializer
     permission_classes = [IsAdminOrReadOnly]
-    pagination_class = PageNumberPagination
+    pagination_class = ProductPagination
     filterset_class = ProductFilters
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend,
+                       ProductSearchFilter, OrderingFilter]
     ordering_fields = ['unit_price']
     search_fields = ['title', 'description']
+    facet_price_bounds = [10, 25, 50, 100, 250]
+
+    def get_facet_counts(self, queryset):
+        return {
+            'collection': facets.count_by_collection(queryset),
+            'unit_price': facets.count_by_price(queryset, self.facet_price_bounds),
+        }
 
     def destroy(self, request, pk):
         not_allowed = status.HTTP_405_METHOD_NOT_ALLOWED
@@ -39,9 +60,41 @@ class ProductsViewSet(ModelViewSet):
         product.delete()
         return Response(status=no_content)
 
-
-class CollectionsViewSet(ModelViewSet):
-    queryset = Collection.objects.prefetch_related('products').all()
+    @action(detail=False, methods=['POST'], url_path='import', permission_classes=[IsAdminUser])
+    def import_products(self, request):
+        content_type = request.content_type.split(';')[0].strip()
+        if content_type not in CONTENT_TYPES:
+            raise UnsupportedMediaType(content_type)
+
+        reader = READERS[CONTENT_TYPES[content_type]]
+        lines = codecs.iterdecode(request.stream or [], 'utf-8-sig')
+        try:
+            report = ProductImporter().run(reader(lines))
+        except (UnicodeDecodeError, csv.Error) as error:
+            raise ParseError(str(error))
+        return Response(report)
+
+    @action(detail=False, methods=['GET'])
+    def export(self, request):
+        output = request.query_params.get('output', 'ndjson')
+        if output not in exporting.EXPORTERS:
+            raise ValidationError(
+                {'output': [f'Choose one of: {", ".join(exporting.EXPORTERS)}.']})
+
+        compiled = get_compiled(
+            CompiledProductSerializer, **self.get_sparse_fieldset())
+        queryset = self.filter_queryset(self.get_queryset())
+
+        response = StreamingHttpResponse(
+            exporting.EXPORTERS[output](compiled, queryset),
+            content_type=exporting.CONTENT_TYPES[output])
+        response['Content-Disposition'] = f'attachment; filename="products.{output}"'
+        return response
+
+
+class CollectionsViewSet(SparseFieldsetMixin, ConditionalGetMixin, CachedCatalogMixin, ModelViewSet):
+    cache_namespace = 'collections'
+    queryset = Collection.objects.all()
     serializer_class = CollectionSerializer
     permission_classes = [IsAdminOrReadOnly]
 
@@ -63,24 +116,48 @@ class ReviewsViewSet(ModelViewSet):
 
     def get_queryset(self):
         product_id = self.kwargs["product_pk"]
-        review = Reviews.objects.filter(product_id=product_id)
+        return Reviews.objects.filter(product_id=product_id)
 
-        if review.exists():
-            return review
-        else:
+    def list(self, request, *args, **kwargs):
+        reviews = list(self.filter_queryset(self.get_queryset()))
+        if not reviews:
             raise NotFound('There is no product or review')
+        return Response(self.get_serializer(reviews, many=True).data)
 
     def get_serializer_context(self):
         return {"product_id": self.kwargs['product_pk'], "user_id": self.request.user.id}
 
 
 class CartViewset(RetrieveModelMixin, CreateModelMixin, DestroyModelMixin, GenericViewSet):
-    queryset = Cart.objects.prefetch_related('items__product').all()
+    queryset = Cart.objects.all()
     serializer_class = CartSerializer
 
+    def create(self, request, *args, **kwargs):
+        cart = get_cart_storage().create_cart()
+        return Response(self.get_serializer(cart).data, status=status.HTTP_201_CREATED)
+
+    def retrieve(self, request, pk):
+        cart = get_cart_storage().get_cart(pk)
+        if cart is None:
+            raise Http404
+        return Response(self.get_serializer(cart).data)
+
+    def destroy(self, request, pk):
+        if not get_cart_storage().delete_cart(pk):
+            raise Http404
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
-class CariItemViewSet(ModelViewSet):
+    @action(detail=True, methods=['GET'])
+    def summary(self, request, pk):
+        summary = get_cart_storage().get_summary(pk)
+        if summary is None:
+            raise Http404
+        return Response(CartSummarySerializer(summary).data)
+
+
+class CariItemViewSet(IdempotentCreateMixin, CompiledListMixin, ModelViewSet):
     http_method_names = ['get', 'post', 'patch', 'delete']
+    compiled_serializer_class = CompiledCartItemSerializer
 
     def get_serializer_class(self):
         method = self.request.method
@@ -95,11 +172,51 @@ class CariItemViewSet(ModelViewSet):
         return {'cart_id': self.kwargs['cart_pk']}
 
     def get_queryset(self):
-        cart_id = self.kwargs['cart_pk']
-        return CartItem.objects.filter(cart_id=cart_id).select_related('product')
+        return get_cart_storage().get_items(self.kwargs['cart_pk'])
+
+    def get_object(self):
+        cartitem = get_cart_storage().get_item(self.kwargs['cart_pk'], self.kwargs['pk'])
+        if cartitem is None:
+            raise Http404
+        return cartitem
+
+    # Storages that don't keep carts in the database hand back plain lists,
+    # which go through the regular serializer instead of the compiled one.
+    def list(self, request, *args, **kwargs):
+        cartitems = self.get_queryset()
+        if isinstance(cartitems, QuerySet):
+            return super().list(request, *args, **kwargs)
+        return Response(self.get_serializer(cartitems, many=True).data)
+
+    def perform_create(self, serializer):
+        try:
+            serializer.save()
+        except Cart.DoesNotExist:
+            raise Http404
+
+    @action(detail=False, methods=['POST'])
+    def batch(self, request, cart_pk=None):
+        return self.get_idempotent_response(self.add_batch, request)
 
+    def add_batch(self, request):
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def perform_update(self, serializer):
+        cartitem = serializer.instance
+        quantity = serializer.validated_data.get('quantity', cartitem.quantity)
+        serializer.instance = get_cart_storage().update_item(
+            self.kwargs['cart_pk'], cartitem.id, quantity)
+
+    def destroy(self, request, *args, **kwargs):
+        if not get_cart_storage().delete_item(self.kwargs['cart_pk'], kwargs['pk']):
+            raise Http404
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
-class CustomerViewSet(ModelViewSet):
+
+class CustomerViewSet(SparseFieldsetMixin, ModelViewSet):
     queryset = Customer.objects.all()
     serializer_class = CustomerSerializer
     permission_classes = [IsAdminUser]
@@ -110,7 +227,7 @@ class CustomerViewSet(ModelViewSet):
         user = request.user
         data = request.data
 
-        (customer, created) = Customer.objects.get_or_create(user_id=user.id)
+        customer = customers.get_customer(user)
         if method == 'GET':
             serializer = CustomerSerializer(customer)
             return Response(serializer.data)
@@ -121,8 +238,14 @@ class CustomerViewSet(ModelViewSet):
             return Response(serializer.data)
 
 
-class OrderViewSet(ModelViewSet):
+class OrderViewSet(IdempotentCreateMixin, SparseFieldsetMixin, CompiledListMixin, ModelViewSet):
     http_method_names = ['get', 'post', 'patch', 'delete', 'head', 'options']
+    compiled_serializer_class = CompiledOrderSerializer
+    # Keyset pagination reads the ordering columns of the boundary rows.
+    sparse_required_fields = ['id', 'placed_at']
+    pagination_class = OrderPagination
+    filterset_class = OrderFilter
+    filter_backends = [DjangoFilterBackend]
 
     def get_serializer_class(self):
         method = self.request.method
@@ -134,12 +257,13 @@ class OrderViewSet(ModelViewSet):
 
     def get_queryset(self):
         user = self.request.user
+        queryset = Order.objects.all()
+        if self.action == 'retrieve':
+            queryset = queryset.prefetch_related('items__product')
         if user.is_staff:
-            return Order.objects.all()
+            return queryset
 
-        (customer_id, created) = Customer.objects.only(
-            'id').get_or_create(user_id=user.id)
-        return Order.objects.filter(customer_id=customer_id)
+        return queryset.filter(customer_id=customers.get_customer_id(user))
 
     def get_permissions(self):
         method = self.request.method
@@ -148,7 +272,11 @@ class OrderViewSet(ModelViewSet):
         return [IsAuthenticated()]
 
     def create(self, request):
-        context = {'user_id': self.request.user.id}
+        return self.get_idempotent_response(self.place_order, request)
+
+    def place_order(self, request):
+        context = {'customer_id': customers.get_customer(
+            request.user, Customer.objects.only('id')).id}
         data = request.data
         
         serializer = CreateOrderSerializer(data=data, context=context)
@@ -156,3 +284,13 @@ class OrderViewSet(ModelViewSet):
         order = serializer.save()
         serializer = OrderSerializer(order)
         return Response(serializer.data)
+
+
+class AnalyticsViewSet(GenericViewSet):
+    permission_classes = [IsAdminUser]
+
+    @action(detail=False, methods=['GET'])
+    def sales(self, request):
+        query = SalesQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        return Response({**query.validated_data, **analytics.get_sales(**query.validated_data)})
@@ -0,0 +1,48 @@
+from django.core.cache import caches
+from django.db import router, transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+CACHE_ALIAS = 'default'
+CACHE_TIMEOUT = 300
+CACHED_FIELDS = ['id', 'is_staff', 'is_active']
+
+
+def get_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def forget(user_id):
+    transaction.on_commit(lambda: caches[CACHE_ALIAS].delete(get_key(user_id)))
+
+
+# Access tokens live for a day, so instead of loading the user row on every
+# request only what permission checks need is cached, for a few minutes.
+# The user is built with the rest of its fields deferred, so anything else
+# is loaded on first use. Saving or deleting a user evicts its entry; the
+# timeout bounds how long a queryset update() can go unnoticed.
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        cache = caches[CACHE_ALIAS]
+        values = cache.get(get_key(user_id))
+        if values is None:
+            values = (self.user_model.objects
+                      .filter(**{api_settings.USER_ID_FIELD: user_id})
+                      .values_list(*CACHED_FIELDS)
+                      .first())
+            if values is None:
+                raise AuthenticationFailed(_('User not found'), code='user_not_found')
+            cache.set(get_key(user_id), values, timeout=CACHE_TIMEOUT)
+
+        user = self.user_model.from_db(
+            router.db_for_read(self.user_model), CACHED_FIELDS, values)
+        if not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        return user
@@ -4,3 +4,16 @@ from django.contrib.auth.models import AbstractUser
 
 class User(AbstractUser):
     email=models.EmailField(unique=True)
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=['first_name', 'last_name']),
+        ]
+
+    # Users authenticated from cached state load the rest of their row in
+    # one query on first use, rather than a query per field.
+    def refresh_from_db(self, using=None, fields=None):
+        deferred_fields = self.get_deferred_fields()
+        if fields and set(fields) <= deferred_fields:
+            fields = deferred_fields
+        super().refresh_from_db(using, fields)
@@ -1,3 +1,4 @@
+from django.db import transaction
 from djoser.serializers import UserCreateSerializer,UserSerializer
 from store.models import Customer
 
@@ -5,6 +6,14 @@ class RegisterSerializer(UserCreateSerializer):
     class Meta(UserCreateSerializer.Meta):
         fields=['id','username','email','password','first_name','last_name']
 
+    # Every user gets their customer right away, so that resolving it later
+    # never has to write.
+    def perform_create(self, validated_data):
+        with transaction.atomic():
+            user = super().perform_create(validated_data)
+            Customer.objects.create(user=user)
+        return user
+
 
 class CurrentUserSerializer(UserSerializer):
     class Meta(UserSerializer.Meta):